@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     mongodb_uri: str
@@ -10,6 +10,72 @@ class Settings(BaseSettings):
     auth0_client_secret: str
     gemini_api_key: str
 
+    # Auth caching
+    jwks_cache_ttl: int = 3600
+    jwks_refresh_min_interval: int = 30
+    token_cache_size: int = 1024
+    # Auth0 `sub`s allowed to read /api/health/caches
+    admin_user_ids: List[str] = []
+
+    # LLM gateway
+    llm_model: str = "gemini-1.5-flash"
+    llm_timeout_seconds: float = 60.0
+    # Deadline for a whole call, retries and backoff included
+    llm_total_timeout_seconds: float = 120.0
+    llm_max_concurrency: int = 4
+    llm_rate_per_second: float = 2.0
+    llm_burst: int = 4
+    llm_max_retries: int = 3
+    llm_backoff_base: float = 0.5
+    llm_backoff_max: float = 8.0
+
+    # Statement categorisation
+    categorise_batch_size: int = 100
+    categorise_max_parallel_batches: int = 4
+    categorise_batch_retries: int = 2
+    # Size of the statement digest the challenge prompt gets
+    challenge_digest_token_budget: int = 1000
+    merchant_cache_size: int = 10000
+    classifier_model_path: str = "data/transaction_classifier.npz"
+    classifier_min_confidence: float = 0.9
+
+    # Statement CSV parsing; column names are matched case-insensitively
+    csv_chunk_size: int = 10000
+    csv_date_columns: List[str] = ["Trans. Date", "Transaction Date", "Date", "Posted Date", "Post Date"]
+    csv_description_columns: List[str] = ["Description", "Merchant", "Payee", "Details"]
+    csv_amount_columns: List[str] = ["Amount", "Transaction Amount"]
+    # Added to every parsed amount (this used to be a hardcoded "- 30" in the upload)
+    statement_amount_adjustment: float = -30.0
+
+    # Background upload jobs
+    upload_workers: int = 2
+    upload_queue_size: int = 100
+    upload_spool_dir: str = "data/uploads"
+    # A running job's lease is renewed while it works; one that lapses means its worker died
+    upload_job_lease_seconds: float = 120.0
+
+    # Transaction listing
+    transactions_page_max: int = 500
+
+    # Card recommendations: how many locally ranked cards are sent to the LLM for reasons
+    recommender_top_k: int = 3
+    recommendations_cache_size: int = 1000
+    recommendations_cache_ttl: int = 86400
+    # Seconds between checks for a catalog update made by another process
+    catalog_poll_interval: int = 60
+    # Card providers scraped at the same time
+    scraper_max_concurrency: int = 3
+    scraper_http_timeout: float = 20.0
+    scraper_user_agent: str = "Mozilla/5.0 (compatible; ExpinCardCatalog/1.0)"
+    # Page text beyond this many characters is cut before it goes to the LLM
+    scraper_max_page_chars: int = 60000
+
+    # Insights cache
+    insights_cache_size: int = 1000
+    insights_cache_ttl: int = 86400
+    insights_stale_while_revalidate: bool = False
+    insights_token_budget: int = 2000
+
     class Config:
         env_file = ".env"
-        case_sensitive = False
\ No newline at end of file
+        case_sensitive = False
@@ -0,0 +1,13 @@
+from pymongo import MongoClient
+
+from .config import Settings
+
+settings = Settings()
+
+# The API reads and writes this database (see main.startup_db_client)
+DATABASE_NAME = "spendwise"
+
+
+def get_sync_database():
+    """Blocking client for command-line maintenance tasks."""
+    return MongoClient(settings.mongodb_uri)[DATABASE_NAME]
@@ -1,43 +1,145 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
+from .cache import LRUCache
 from .config import Settings
+from typing import Awaitable, Callable, Optional
+import asyncio
+import hashlib
 import httpx
+import time
 
 settings = Settings()
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        token = credentials.credentials
-        jwks_url = f"https://{settings.auth0_domain}/.well-known/jwks.json"
 
+async def fetch_jwks(url: str) -> dict:
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.json()
 
-        print("Token: ", token)
-        unverified_header = jwt.get_unverified_header(token)
-        
-        # Fetch JWKS from Auth0
-        async with httpx.AsyncClient() as client:
-            response = await client.get(jwks_url)
-            jwks = response.json()
-        
-        # Find the matching key in JWKS
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
+
+class JWKSCache:
+    """Caches Auth0 signing keys by `kid`.
+
+    Keys are refreshed after `ttl` seconds, or early when a token arrives with a
+    `kid` we have not seen (key rotation). Forced refreshes are rate limited so a
+    stream of bogus `kid`s cannot hammer Auth0, and if a refresh fails the keys
+    we already have keep being served.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        ttl: float = 3600,
+        min_refresh_interval: float = 30,
+        fetch: Optional[Callable[[str], Awaitable[dict]]] = None
+    ):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.fetch = fetch or fetch_jwks
+        self.keys = {}
+        # -inf rather than 0.0: monotonic time starts near zero on a freshly booted host,
+        # which would make the first forced refresh look rate limited
+        self.fetched_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = None
+
+    def _is_fresh(self) -> bool:
+        return bool(self.keys) and time.monotonic() - self.fetched_at < self.ttl
+
+    async def refresh(self, force: bool = False):
+        # Created lazily so the lock binds to the server's event loop, not the import-time one
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have refreshed while we waited on the lock
+            if not force and self._is_fresh():
+                return
+            if force and time.monotonic() - self.fetched_at < self.min_refresh_interval:
+                return
+
+            try:
+                jwks = await self.fetch(self.jwks_url)
+            except Exception as e:
+                if not self.keys:
+                    raise
+                print(f"JWKS refresh failed, serving cached keys: {str(e)}")
+                return
+
+            self.keys = {
+                key["kid"]: {
                     "kty": key["kty"],
                     "kid": key["kid"],
-                    "use": key["use"],
+                    "use": key.get("use", "sig"),
                     "n": key["n"],
                     "e": key["e"]
                 }
-                break
-        
+                for key in jwks.get("keys", [])
+                if "kid" in key
+            }
+            self.fetched_at = time.monotonic()
+            self.refreshes += 1
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        if self._is_fresh() and kid in self.keys:
+            self.hits += 1
+            return self.keys[kid]
+
+        self.misses += 1
+        await self.refresh()
+        if kid not in self.keys:
+            # Unknown kid usually means Auth0 rotated its signing keys
+            await self.refresh(force=True)
+        return self.keys.get(kid)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
+
+
+jwks_cache = JWKSCache(
+    f"https://{settings.auth0_domain}/.well-known/jwks.json",
+    ttl=settings.jwks_cache_ttl,
+    min_refresh_interval=settings.jwks_refresh_min_interval
+)
+
+# Verified payloads keyed by a digest of the bearer token, expiring at the token's `exp`
+token_cache = LRUCache(maxsize=settings.token_cache_size)
+
+
+def auth_cache_stats() -> dict:
+    return {
+        "jwks": jwks_cache.stats(),
+        "tokens": token_cache.stats(),
+    }
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        token = credentials.credentials
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+
+        payload = token_cache.get(token_key)
+        if payload is not None:
+            return payload
+
+        unverified_header = jwt.get_unverified_header(token)
+
+        # Find the matching key in the cached JWKS
+        rsa_key = await jwks_cache.get_key(unverified_header["kid"])
+
         if not rsa_key:
-            print("JWKS: ", jwks)
             raise JWTError("Unable to find appropriate key")
-            
+
         try:
             payload = jwt.decode(
                 token,
@@ -46,17 +148,29 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 audience=settings.auth0_api_audience,
                 issuer=f"https://{settings.auth0_domain}/"
             )
-            return payload
         except JWTError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"}
             )
+
+        if "exp" in payload:
+            token_cache.set(token_key, payload, expires_at=float(payload["exp"]))
+        return payload
     except Exception:
-        # print what the exception is
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"}
-        )
\ No newline at end of file
+        )
+
+
+async def get_admin_user(current_user = Depends(get_current_user)):
+    """Only lets through users listed in `admin_user_ids`."""
+    if current_user.get("sub") not in settings.admin_user_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return current_user
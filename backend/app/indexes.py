@@ -0,0 +1,153 @@
+"""Declarative MongoDB index registry.
+
+Every query shape the routers and services run should be served by one of these indexes.
+`ensure_indexes` runs on startup and is idempotent; the command line reports
+drift against a live database:
+
+    python -m app.indexes report    # missing, unused and unregistered indexes
+    python -m app.indexes ensure    # create whatever is missing
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .config import Settings
+from .db import DATABASE_NAME
+
+settings = Settings()
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "transactions": [
+        # Upload dedupe: seen-row lookups by row hash; unique so concurrent uploads can't double-insert
+        IndexModel([("user_id", ASCENDING), ("hash", ASCENDING)], unique=True, name="user_id_hash_unique"),
+        # Per-user listing and date-range filters, newest first
+        IndexModel(
+            [("user_id", ASCENDING), ("transaction_date", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_transaction_date"
+        ),
+        # Category totals for the summary and the recommender
+        IndexModel([("user_id", ASCENDING), ("category", ASCENDING), ("amount", ASCENDING)], name="user_id_category_amount"),
+        # Subscription detection re-reads the debits of the merchants an upload touched
+        IndexModel([("user_id", ASCENDING), ("merchant", ASCENDING), ("type", ASCENDING)], name="user_id_merchant_type"),
+    ],
+    "challenges": [
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_id_status"),
+    ],
+    "credit_cards": [
+        # Scraper upserts by (provider, name)
+        IndexModel([("provider", ASCENDING), ("name", ASCENDING)], unique=True, name="provider_name_unique"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "transaction_rollups": [
+        # Upsert key for $inc updates and the rebuild's $merge
+        IndexModel(
+            [("user_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING), ("type", ASCENDING)],
+            unique=True,
+            name="user_id_month_category_type_unique"
+        ),
+    ],
+    "rollup_locks": [
+        # Rebuilds look for live writer leases of a user; uploads look for a rebuild lock
+        IndexModel([("kind", ASCENDING), ("user_id", ASCENDING), ("expires_at", ASCENDING)], name="kind_user_id_expires_at"),
+        # Leases left behind by crashed processes are cleaned up once they expire
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "merchant_categories": [
+        IndexModel([("merchant", ASCENDING)], unique=True, name="merchant_unique"),
+    ],
+    "scraper_pages": [
+        IndexModel([("provider", ASCENDING)], unique=True, name="provider_unique"),
+    ],
+    "statement_uploads": [
+        IndexModel([("user_id", ASCENDING), ("file_hash", ASCENDING)], unique=True, name="user_id_file_hash_unique"),
+    ],
+    "upload_jobs": [
+        IndexModel([("job_id", ASCENDING)], unique=True, name="job_id_unique"),
+        # Startup requeue of queued jobs, oldest first
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        # Recovery of running jobs whose worker stopped renewing its lease
+        IndexModel([("status", ASCENDING), ("host", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_host_lease_expires_at"),
+    ],
+    "subscriptions": [
+        IndexModel([("user_id", ASCENDING), ("merchant", ASCENDING)], unique=True, name="user_id_merchant_unique"),
+    ],
+}
+
+# What to run when existing data blocks a unique index
+UNIQUE_INDEX_FIXES = {
+    "transactions.user_id_hash_unique":
+        "rehash transactions stored before row hashes with `python -m app.services.uploads rehash`",
+}
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every registered index that doesn't exist yet.
+
+    Indexes are created one at a time so a single failure doesn't stop the others.
+    A unique index that can't be built (e.g. existing duplicates block it) raises
+    RuntimeError once the rest are done: the writes it guards would silently
+    duplicate without it, so startup should fail rather than run unprotected.
+    """
+    created = {}
+    failed_unique = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+                created.setdefault(collection, []).append(name)
+            except Exception as e:
+                print(f"Could not create index {collection}.{name}: {str(e)}")
+                if model.document.get("unique"):
+                    failed_unique.append(f"{collection}.{name}")
+    if failed_unique:
+        hints = [UNIQUE_INDEX_FIXES.get(name, f"remove the duplicates blocking {name}") for name in failed_unique]
+        raise RuntimeError(f"Could not create unique indexes {', '.join(failed_unique)}: {'; '.join(hints)}")
+    return created
+
+
+async def index_report(db) -> Dict[str, dict]:
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        registered = {model.document["name"] for model in models}
+
+        usage = {}
+        try:
+            async for stats in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stats["name"]] = stats["accesses"]["ops"]
+        except Exception as e:
+            print(f"$indexStats unavailable for {collection}: {str(e)}")
+
+        report[collection] = {
+            "missing": sorted(registered - set(existing)),
+            "unused": sorted(name for name, ops in usage.items() if ops == 0 and name != "_id_"),
+            "unregistered": sorted(name for name in existing if name not in registered and name != "_id_"),
+        }
+    return report
+
+
+async def _run(command: str):
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    try:
+        db = client[DATABASE_NAME]
+        if command == "ensure":
+            await ensure_indexes(db)
+
+        for collection, entry in (await index_report(db)).items():
+            print(f"{collection}:")
+            for kind, names in entry.items():
+                print(f"  {kind}: {', '.join(names) if names else '-'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or audit the registered MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "report"])
+    asyncio.run(_run(parser.parse_args().command))
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Optional, Protocol
+
+import google.generativeai as genai
+
+from .config import Settings
+
+settings = Settings()
+
+# HTTP status codes the provider uses for transient failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMBackend(Protocol):
+    async def generate(self, prompt: str) -> str:
+        ...
+
+
+class GeminiBackend:
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash"):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+
+async def run_concurrently(*coros):
+    """Await coroutines together; if one fails, cancel the rest and re-raise."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def parse_json(text: str):
+    return json.loads(text.replace("```json", "").replace("```", "").strip())
+
+
+class _InflightCall:
+    """A backend call shared by every caller waiting on the same prompt."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMGateway:
+    """Single entry point for LLM calls.
+
+    Every call waits for a concurrency slot and a rate-limit token, transient
+    provider errors are retried with full-jitter exponential backoff, and
+    concurrent calls with an identical prompt share one request. `timeout`
+    bounds each attempt and `total_timeout` the whole call, retries included.
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        max_concurrency: int = 4,
+        rate_per_second: float = 2.0,
+        burst: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        timeout: Optional[float] = 60.0,
+        total_timeout: Optional[float] = 120.0
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.calls = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self._semaphore = None
+        self._inflight = {}
+
+    async def _call(self, prompt: str, timeout: Optional[float]) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    await self.bucket.acquire()
+                    self.calls += 1
+                    return await asyncio.wait_for(self.backend.generate(prompt), timeout=timeout)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                print(f"LLM call failed ({str(e)}), retrying in {delay:.2f}s")
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        timeout = timeout or self.timeout
+        key = hashlib.sha256(prompt.encode()).hexdigest()
+
+        call = self._inflight.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = _InflightCall(asyncio.ensure_future(
+                asyncio.wait_for(self._call(prompt, timeout), timeout=self.total_timeout)
+            ))
+            self._inflight[key] = call
+            call.task.add_done_callback(lambda _, call=call: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # Shielded so one caller being cancelled doesn't cancel the call for the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to use the result: free the semaphore slot and stop retrying
+                self.abandoned += 1
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _InflightCall):
+        # A later call for the same prompt may already have taken the slot
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    async def generate_json(self, prompt: str, timeout: Optional[float] = None):
+        return parse_json(await self.generate(prompt, timeout=timeout))
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "inflight": len(self._inflight),
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(
+            GeminiBackend(settings.gemini_api_key, settings.llm_model),
+            max_concurrency=settings.llm_max_concurrency,
+            rate_per_second=settings.llm_rate_per_second,
+            burst=settings.llm_burst,
+            max_retries=settings.llm_max_retries,
+            backoff_base=settings.llm_backoff_base,
+            backoff_max=settings.llm_backoff_max,
+            timeout=settings.llm_timeout_seconds,
+            total_timeout=settings.llm_total_timeout_seconds
+        )
+    return _gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]):
+    """Swap the shared gateway, e.g. for one built around a fake backend in tests."""
+    global _gateway
+    _gateway = gateway
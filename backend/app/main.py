@@ -1,7 +1,20 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from .config import Settings
+from .db import DATABASE_NAME
+from .dependencies import auth_cache_stats, get_admin_user
+from .indexes import ensure_indexes
+from .llm import get_gateway
+from .services.catalog import card_catalog
+from .services.classifier import load_classifier
+from .services.insights_cache import insights_cache
+from .services.jobs import upload_jobs
+from .services.merchants import merchant_cache
+from .services.pages import close_http_client
+from .services.recommendations_cache import recommendation_cache
+from .services.rollups import backfill_if_empty
 from .routers import transactions, analysis, auth, scraper, recommender 
 
 app = FastAPI(title="Expin API")
@@ -19,10 +32,21 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     app.mongodb_client = AsyncIOMotorClient(settings.mongodb_uri)
-    app.mongodb = app.mongodb_client["spendwise"]
+    app.mongodb = app.mongodb_client[DATABASE_NAME]
+    await ensure_indexes(app.mongodb)
+    await backfill_if_empty(app.mongodb)
+    load_classifier()
+    await card_catalog.reload(app.mongodb)
+    app.catalog_poller = asyncio.create_task(
+        card_catalog.poll(app.mongodb, settings.catalog_poll_interval)
+    )
+    await upload_jobs.start(app.mongodb)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.catalog_poller.cancel()
+    await upload_jobs.stop()
+    await close_http_client()
     app.mongodb_client.close()
 
 # ✅ Add this for authentication
@@ -60,3 +84,16 @@ app.include_router(
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
+
+# Covers every user's caches and jobs, so admins only
+@app.get("/api/health/caches")
+async def cache_stats(current_user = Depends(get_admin_user)):
+    return {
+        "auth": auth_cache_stats(),
+        "llm": get_gateway().stats(),
+        "merchants": merchant_cache.stats(),
+        "insights": insights_cache.stats(),
+        "recommendations": recommendation_cache.stats(),
+        "card_catalog": card_catalog.stats(),
+        "upload_jobs": upload_jobs.stats()
+    }
@@ -2,15 +2,22 @@ from fastapi import APIRouter, HTTPException, status, Request, Depends
 from motor.motor_asyncio import AsyncIOMotorClient
 from ..config import Settings
 from ..dependencies import get_current_user
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 from pydantic import BaseModel
-import google.generativeai as genai
-import json
+from ..llm import get_gateway
+from ..services.anomalies import detect_anomalies
+from ..services.digest import DIGEST_FIELDS, build_digest, to_frame
+from ..services.insights_cache import insights_cache, transactions_fingerprint
+from ..services.subscriptions import SUBSCRIPTION_COLLECTION, with_status
+from ..services.summary import GRANULARITIES, build_summary
+import asyncio
 
 router = APIRouter()
 settings = Settings()
 
+SUBSCRIPTION_FIELDS = {"_id": 0, "user_id": 0, "updated_at": 0, "active": 0}
+
 class InsightResponse(BaseModel):
     unnecessary_spending: List[dict]
     recommendations: List[str]
@@ -18,6 +25,112 @@ class InsightResponse(BaseModel):
     anomalies: List[dict]
     message: str
 
+
+def build_insights_prompt(digest: str) -> str:
+    return f"""
+    You are a financial advisor analyzing a user's spending and financial behaviors. Review the following summary of their transactions and provide insights in the following format:
+    1. Unnecessary Spending:
+    - Review the recurring subscriptions listed under "subscriptions" in the digest (already detected from the charges) and point out ones that look unused, duplicated or expensive.
+    - Highlight high-cost categories where the user may be overspending.
+    - Provide suggestions to reduce spending in these areas, such as alternative services or cost-cutting measures.
+
+    2. Recommendations:
+    - Provide specific recommendations to help the user save money, such as budget adjustments or more cost-effective alternatives.
+    - Suggest lifestyle or subscription changes based on spending patterns.
+    - Recommend financial products (like credit cards, loans) that fit the user's financial profile and spending habits.
+
+    3. Cash Flow Analysis:
+    - Analyze the user's monthly income vs. total spending and identify trends or forecasts for future months.
+    - Evaluate their savings potential and suggest improvements to increase savings over time.
+    - Provide insights into income sources (if available) and categorize them (e.g., salary, side business).
+
+    Unusual transactions and month-over-month jumps have already been detected and are listed under "anomalies" in the digest; take them into account but do not repeat them.
+
+    Please return the analysis in the following JSON format. Make sure each field follows the exact structure:
+    {{
+        "unnecessary_spending": [
+            {{
+                "description": "Description of the unnecessary spending",
+                "amount": "Amount spent",
+                "suggestion": "Suggestion to reduce this spending"
+            }}
+        ],
+        "recommendations": ["Recommendation 1", "Recommendation 2"],
+        "cash_flow_analysis": {{
+            "monthly_income": "Total monthly income",
+            "total_spent": "Total amount spent",
+            "savings_potential": "Potential savings amount",
+            "cash_flow_trends": ["Trend 1", "Trend 2"]
+        }},
+        "message": "Analysis summary"
+    }}
+
+    Spending digest (JSON; amounts in USD, Credit is money in and Debit money out, so spend totals are negative):
+    {digest}
+    """
+
+
+def summarise_transactions(transactions: List[dict], subscriptions: List[dict]):
+    df = to_frame(transactions)
+    anomalies = detect_anomalies(df)
+    digest = build_digest(
+        None, settings.insights_token_budget, df=df, anomalies=anomalies, subscriptions=subscriptions
+    )
+    return digest, anomalies
+
+
+async def generate_insights(db, query: dict) -> InsightResponse:
+    transactions = await db['transactions'].find(query, DIGEST_FIELDS).to_list(None)
+
+    if not transactions:
+        return InsightResponse(
+            unnecessary_spending=[],
+            recommendations=[],
+            cash_flow_analysis={},
+            anomalies=[],
+            message="No transactions found for analysis"
+        )
+
+    subscriptions = await db[SUBSCRIPTION_COLLECTION].find(
+        {"user_id": query["user_id"]}, SUBSCRIPTION_FIELDS
+    ).sort("annual_cost", -1).to_list(None)
+    subscriptions = with_status(subscriptions)
+
+    # Summarise locally; the model only sees the digest, never raw documents
+    digest, anomalies = await asyncio.to_thread(summarise_transactions, transactions, subscriptions)
+    prompt = build_insights_prompt(digest)
+    
+    # Get insights from Gemini
+    insights = await get_gateway().generate_json(prompt)
+    
+    # Validate and ensure proper data structure
+    validated_insights = {
+        "unnecessary_spending": [
+            item if isinstance(item, dict) else {"description": str(item), "amount": "N/A", "suggestion": "N/A"}
+            for item in insights.get('unnecessary_spending', [])
+        ],
+        "recommendations": insights.get('recommendations', []),
+        "cash_flow_analysis": insights.get('cash_flow_analysis', {
+            "monthly_income": "0",
+            "total_spent": "0",
+            "savings_potential": "0",
+            "cash_flow_trends": []
+        }),
+        "anomalies": anomalies,
+        "message": insights.get('message', 'Analysis completed successfully')
+    }
+    
+    return InsightResponse(**validated_insights)
+
+
+async def refresh_insights(db, user_id: str, start_date, end_date, query: dict, fingerprint: str):
+    try:
+        insights = await generate_insights(db, query)
+        insights_cache.set(user_id, start_date, end_date, fingerprint, insights)
+    except Exception as e:
+        print(f"Background insights refresh failed: {str(e)}")
+
+
 @router.get("/insights")
 async def get_insights(
     request: Request,
@@ -27,112 +140,32 @@ async def get_insights(
 ):
     try:
         # Fetch user's transactions
-        query = {"user_id": current_user['sub']}
+        user_id = current_user['sub']
+        query = {"user_id": user_id}
         if start_date or end_date:
-            query['date'] = {}
+            query['transaction_date'] = {}
             if start_date:
-                query['date']['$gte'] = start_date
+                query['transaction_date']['$gte'] = start_date
             if end_date:
-                query['date']['$lte'] = end_date
-        
-        transactions = await request.app.mongodb['transactions'].find(query).to_list(None)
-        
-        if not transactions:
-            return InsightResponse(
-                unnecessary_spending=[],
-                recommendations=[],
-                cash_flow_analysis={},
-                anomalies=[],
-                message="No transactions found for analysis"
+                query['transaction_date']['$lte'] = end_date
+
+        # Serve from cache while the transaction set is unchanged
+        db = request.app.mongodb
+        fingerprint = await transactions_fingerprint(db, query)
+        cached, fresh = insights_cache.get(user_id, start_date, end_date, fingerprint)
+        if cached is not None and fresh:
+            return cached
+
+        if cached is not None and settings.insights_stale_while_revalidate:
+            insights_cache.refresh_in_background(
+                user_id, start_date, end_date,
+                lambda: refresh_insights(db, user_id, start_date, end_date, query, fingerprint)
             )
-        
-        # Configure Gemini API
-        genai.configure(api_key=settings.gemini_api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-
-        # transaction_data = [transaction.dict() for transaction in transaction_request.transactions]
-        print(transactions)
-
-        # Generate prompt for analysis
-        prompt = f"""
-        You are a financial advisor analyzing a user's spending and financial behaviors. Review the following transactions and provide insights in the following format:
-        1. Unnecessary Spending:
-        - Identify recurring subscriptions or services that are rarely or never used.
-        - Highlight high-cost categories where the user may be overspending.
-        - Provide suggestions to reduce spending in these areas, such as alternative services or cost-cutting measures.
-
-        2. Recommendations:
-        - Provide specific recommendations to help the user save money, such as budget adjustments or more cost-effective alternatives.
-        - Suggest lifestyle or subscription changes based on spending patterns.
-        - Recommend financial products (like credit cards, loans) that fit the user's financial profile and spending habits.
-
-        3. Cash Flow Analysis:
-        - Analyze the user's monthly income vs. total spending and identify trends or forecasts for future months.
-        - Evaluate their savings potential and suggest improvements to increase savings over time.
-        - Provide insights into income sources (if available) and categorize them (e.g., salary, side business).
-
-        4. Anomalies:
-        - Detect any unusual or outlier spending patterns (e.g., large, one-time purchases or unusual increases in a specific category).
-        - Suggest areas where the user might save based on anomalies in their spending behavior.
-
-        Please return the analysis in the following JSON format. Make sure each field follows the exact structure:
-        {{
-            "unnecessary_spending": [
-                {{
-                    "description": "Description of the unnecessary spending",
-                    "amount": "Amount spent",
-                    "suggestion": "Suggestion to reduce this spending"
-                }}
-            ],
-            "recommendations": ["Recommendation 1", "Recommendation 2"],
-            "cash_flow_analysis": {{
-                "monthly_income": "Total monthly income",
-                "total_spent": "Total amount spent",
-                "savings_potential": "Potential savings amount",
-                "cash_flow_trends": ["Trend 1", "Trend 2"]
-            }},
-            "anomalies": [
-                {{
-                    "description": "Description of the anomaly",
-                    "amount": "Amount involved",
-                    "suggestion": "Suggestion to address this anomaly"
-                }}
-            ],
-            "message": "Analysis summary"
-        }}
-
-        Transactions: {transactions}
-        """
-        
-        # Get insights from Gemini
-        response = model.generate_content(prompt)
-        text_response = response.text
-        
-        # Clean and parse the JSON response
-        cleaned_response = text_response.replace("```json", "").replace("```", "").strip()
-        insights = json.loads(cleaned_response)
-        
-        # Validate and ensure proper data structure
-        validated_insights = {
-            "unnecessary_spending": [
-                item if isinstance(item, dict) else {"description": str(item), "amount": "N/A", "suggestion": "N/A"}
-                for item in insights.get('unnecessary_spending', [])
-            ],
-            "recommendations": insights.get('recommendations', []),
-            "cash_flow_analysis": insights.get('cash_flow_analysis', {
-                "monthly_income": "0",
-                "total_spent": "0",
-                "savings_potential": "0",
-                "cash_flow_trends": []
-            }),
-            "anomalies": [
-                item if isinstance(item, dict) else {"description": str(item), "amount": "N/A", "suggestion": "N/A"}
-                for item in insights.get('anomalies', [])
-            ],
-            "message": insights.get('message', 'Analysis completed successfully')
-        }
-        
-        return InsightResponse(**validated_insights)
+            return cached
+
+        insights = await generate_insights(db, query)
+        insights_cache.set(user_id, start_date, end_date, fingerprint, insights)
+        return insights
     
     except Exception as e:
         raise HTTPException(
@@ -143,48 +176,33 @@ async def get_insights(
 @router.get("/summary")
 async def get_summary(
     request: Request,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: str = "month",
     current_user = Depends(get_current_user)
 ):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"granularity must be one of: {', '.join(GRANULARITIES)}"
+        )
+
     try:
-        # Get total spending by category
-        pipeline = [
-            {"$match": {"user_id": current_user['sub']}},
-            {"$group": {
-                "_id": "$category",
-                "total": {"$sum": "$amount"},
-                "count": {"$sum": 1}
-            }}
-        ]
-        
-        categories = await request.app.mongodb['transactions'].aggregate(pipeline).to_list(None)
-        
-        # Get monthly totals
-        pipeline = [
-            {"$match": {"user_id": current_user['sub']}},
-            {"$group": {
-                "_id": {"$substr": ["$transaction_date", 0, 7]},
-                "total": {"$sum": "$amount"}
-            }},
-            {"$sort": {"_id": 1}}
-        ]
-        
-        # Get monthly aggregated data
-        monthly = await request.app.mongodb['transactions'].aggregate(pipeline).to_list(None)
-        
-        # Transform the aggregated data into required format
-        monthly_summary = [
-            {
-                'total': entry['total'],
-                'month': entry['_id']
-            }
-            for entry in monthly
-        ]
-
-        print("monthly_summary", monthly_summary)
+        # One $facet aggregation answers every chart on the dashboard
+        summary = await build_summary(
+            request.app.mongodb, current_user['sub'], start_date, end_date, granularity
+        )
+
+        # `monthly` is what the dashboard's bar chart reads
+        if granularity == "month":
+            summary["monthly"] = [
+                {'total': entry['total'], 'month': entry['period'][:7]}
+                for entry in summary["periods"]
+            ]
         
         return {
-            "categories": categories,
-            "monthly": monthly_summary,
+            **summary,
+            "granularity": granularity,
             "message": "Summary generated successfully"
         }
     
@@ -192,4 +210,32 @@ async def get_summary(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/subscriptions")
+async def get_subscriptions(
+    request: Request,
+    include_inactive: bool = False,
+    current_user = Depends(get_current_user)
+):
+    try:
+        # Maintained on upload, so this is a plain indexed read
+        subscriptions = await request.app.mongodb[SUBSCRIPTION_COLLECTION].find(
+            {"user_id": current_user['sub']}, SUBSCRIPTION_FIELDS
+        ).sort("annual_cost", -1).to_list(None)
+        subscriptions = with_status(subscriptions)
+        if not include_inactive:
+            subscriptions = [item for item in subscriptions if item["active"]]
+
+        return {
+            "subscriptions": subscriptions,
+            "annual_total": round(sum(item["annual_cost"] for item in subscriptions if item.get("active")), 2),
+            "message": "Subscriptions retrieved successfully"
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
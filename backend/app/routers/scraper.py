@@ -1,23 +1,32 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
-import google.generativeai as genai
 from ..config import Settings
 from ..dependencies import get_current_user
-import json
+from ..llm import get_gateway, parse_json
+from ..services.cards import parse_card
+from ..services.catalog import bump_catalog_version, card_catalog
+from ..services.pages import fetch_page, record_page
+from pymongo import UpdateOne
+import asyncio
+import time
 
 router = APIRouter()
 settings = Settings()
 
-# Set up the Gemini API key
-genai.configure(api_key=settings.gemini_api_key)
+CARD_PROVIDERS = {
+    "Chase": "https://creditcards.chase.com/cash-back-credit-cards",
+    "Discover": "https://www.discover.com/credit-cards/cash-back/",
+    "American Express": "https://www.americanexpress.com/us/credit-cards/"
+}
 
 async def extract_credit_card_info(
     url, 
     provider,
     request: Request,
-    current_user
+    current_user,
+    page_text: str
 ):
     prompt = f"""
-    You are a financial assistant. I will provide a website link that contains information about credit cards.
+    You are a financial assistant. I will provide the text of a web page that contains information about credit cards.
     Your task is to extract structured information about each credit card available on the page.
     
     Please return the response in the following format:
@@ -28,7 +37,8 @@ async def extract_credit_card_info(
     - Intro APR & Regular APR: Any introductory APR offers and the regular APR rate.
     - Other Benefits: Additional perks like travel insurance, purchase protection, lounge access, etc.
 
-    Here is the website: {url}
+    Here is the text of the page at {url}:
+    {page_text[:settings.scraper_max_page_chars]}
     
     Please return the data in JSON format:
     {{
@@ -45,67 +55,103 @@ async def extract_credit_card_info(
     }}
     """
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
+    started = time.perf_counter()
+    response_text = await get_gateway().generate(prompt)
 
     try:
-        if response and response.text:
-            card_data = response.text.strip()
-
-            # ✅ Find and extract JSON portion from the response
-            json_start = card_data.find("{")
-            json_end = card_data.rfind("}") + 1  # Get the closing brace for the last JSON object
-            json_content = card_data[json_start:json_end]
-
-            try:
-                card_data = json.loads(json_content)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=500, detail=f"Error parsing JSON: {str(e)}")
-            
-            # Update or Insert each card into MongoDB
-            for card in card_data["cards"]:
-                # Check if the card already exists in the database
-                existing_card = await request.app.mongodb['credit_cards'].find_one({
-                    "provider": card["provider"],
-                    "name": card["name"]
-                })
-                # print(existing_card)
-
-                if existing_card:
-                    # Update the existing card with new information
-                    await request.app.mongodb['credit_cards'].update_one(
-                        {"_id": existing_card["_id"]},  # Match based on unique card ID
-                        {"$set": card}  # Update the card fields
-                    )
-                    print(f"Updated {provider} card: {card['name']}.")
-                else:
-                    # Insert the new card if it does not exist
-                    await request.app.mongodb['credit_cards'].insert_one(card)
-                    print(f"Inserted {provider} card: {card['name']}.")
-
-            # # Insert each card into MongoDB
-            # for card in card_data["cards"]:
-            #     await request.app.mongodb['credit_cards'].insert_one(card)
-
-            # print(f"Inserted {provider} card details into MongoDB.")
+        # The model sometimes wraps the JSON in prose; keep only the outermost object
+        json_content = response_text[response_text.find("{"):response_text.rfind("}") + 1] if response_text else ""
+        card_data = parse_json(json_content) if json_content else {"cards": []}
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Error parsing JSON: {str(e)}")
+
+    try:
+        # One upsert per (provider, name); later duplicates in the response win
+        cards = {}
+        for card in card_data.get("cards", []):
+            card.setdefault("provider", provider)
+            # Structured rates so the recommender can score cards without re-parsing text
+            card["rewards"] = parse_card(card)
+            cards[(card["provider"], card["name"])] = card
+
+        upserted = modified = 0
+        if cards:
+            result = await request.app.mongodb['credit_cards'].bulk_write([
+                UpdateOne({"provider": card_provider, "name": name}, {"$set": card}, upsert=True)
+                for (card_provider, name), card in cards.items()
+            ], ordered=False)
+            upserted, modified = result.upserted_count, result.modified_count
+            print(f"Stored {len(cards)} {provider} cards ({upserted} new, {modified} updated).")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error extracting card info: {str(e)}")
 
-    return response.text
+    return {
+        "provider": provider,
+        "cards": len(cards),
+        "inserted": upserted,
+        "updated": modified,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def scrape_provider(provider: str, url: str, semaphore: asyncio.Semaphore, request: Request, current_user, force: bool = False):
+    async with semaphore:
+        print(f"Fetching credit card details for {provider}...")
+        started = time.perf_counter()
+        try:
+            page = await fetch_page(request.app.mongodb, provider, url, force=force)
+            if not page.changed:
+                # Nothing new on the page: no LLM call and no card writes
+                print(f"{provider} page unchanged, skipping extraction.")
+                return {
+                    "provider": provider,
+                    "cards": 0,
+                    "inserted": 0,
+                    "updated": 0,
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "skipped": True,
+                }
+
+            result = await extract_credit_card_info(url, provider, request, current_user, page.text)
+            await record_page(request.app.mongodb, page)
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            return result
+        except Exception as e:
+            # One provider failing shouldn't throw away the others' results
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"Scraping {provider} failed: {detail}")
+            return {
+                "provider": provider,
+                "cards": 0,
+                "inserted": 0,
+                "updated": 0,
+                "seconds": round(time.perf_counter() - started, 3),
+                "error": detail,
+            }
 
 
 @router.get("/credit-cards-info")
 async def get_credit_cards(
     request: Request,
+    force: bool = False,
     current_user = Depends(get_current_user)
 ):
-    card_providers = {
-        "Chase": "https://creditcards.chase.com/cash-back-credit-cards",
-        "Discover": "https://www.discover.com/credit-cards/cash-back/",
-        "American Express": "https://www.americanexpress.com/us/credit-cards/"
+    # Providers run concurrently, so a refresh takes about as long as the slowest one
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(settings.scraper_max_concurrency)
+    results = await asyncio.gather(*(
+        scrape_provider(provider, url, semaphore, request, current_user, force)
+        for provider, url in CARD_PROVIDERS.items()
+    ))
+
+    # Invalidates recommendations cached against the previous catalog
+    if any(result["cards"] for result in results):
+        await bump_catalog_version(request.app.mongodb)
+        await card_catalog.reload(request.app.mongodb)
+
+    return {
+        "providers": results,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "message": "Credit card catalog refreshed"
     }
-
-    for provider, url in card_providers.items():
-        print(f"Fetching credit card details for {provider}...")
-        await extract_credit_card_info(url, provider, request, current_user)
\ No newline at end of file
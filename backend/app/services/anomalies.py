@@ -0,0 +1,189 @@
+"""Deterministic spending anomaly detection.
+
+Works on the frame built by `digest.to_frame` and flags two kinds of outliers,
+each scored with a robust z-score (distance from the median in units of
+1.4826 * MAD):
+
+- single transactions far above their category's typical amount that also sit
+  beyond the category's upper IQR fence;
+- months where a category's total jumped against both the previous calendar
+  month (zero when the category had no spend that month) and the category's
+  typical month (the median over the months it had spend in).
+
+Everything is grouped NumPy/pandas work, so it stays fast on large histories.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+MAD_SCALE = 1.4826
+# Categories with fewer observations than this don't have a meaningful "typical" value
+MIN_GROUP_SIZE = 5
+
+
+def _group_stats(values: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """Each group's first quartile, median, third quartile and median absolute
+    deviation (linear-interpolated), as an array of shape (4, n_groups).
+
+    One stable sort by group code, then NumPy's partition-based quantiles per
+    group: the groups are categories, so there are only ever a handful of them.
+    """
+    sizes = np.bincount(codes, minlength=n_groups)
+    # The smallest integer type that holds the codes lets NumPy use a radix sort
+    order = np.argsort(codes.astype(np.min_scalar_type(n_groups)), kind="stable")
+    groups = np.split(values[order], np.cumsum(sizes)[:-1])
+    stats = np.full((4, n_groups), np.nan)
+    for group, group_values in enumerate(groups):
+        if len(group_values):
+            q1, median, q3 = np.quantile(group_values, [0.25, 0.5, 0.75])
+            stats[:, group] = q1, median, q3, np.median(np.abs(group_values - median))
+    return stats
+
+
+def _robust_score(values: np.ndarray, median: np.ndarray, mad: np.ndarray) -> np.ndarray:
+    # When most values are identical MAD is 0; fall back to a fraction of the median
+    scale = np.where(mad > 0, MAD_SCALE * mad, np.abs(median) * 0.25 + 1e-9)
+    return (values - median) / scale
+
+
+def _codes(column: pd.Series):
+    """Codes and labels of a categorical column (`to_frame` builds them already)."""
+    values = column.astype("category").array
+    return values.codes, values.categories.to_numpy()
+
+
+def transaction_outliers(df: pd.DataFrame, z_threshold: float = 3.5) -> pd.DataFrame:
+    spend_mask = ~df["is_income"].to_numpy()
+    codes, categories = _codes(df["category"])
+    codes = codes[spend_mask]
+    magnitude = np.abs(df["amount"].to_numpy()[spend_mask])
+    if not len(magnitude):
+        return pd.DataFrame(columns=["transaction_date", "category", "amount", "median", "score"])
+
+    n_groups = len(categories)
+    q1, median, q3, mad = _group_stats(magnitude, codes, n_groups)
+    fence = q3 + 1.5 * (q3 - q1)
+    # Only rows beyond their category's fence can be flagged, so only those are scored
+    eligible = np.bincount(codes, minlength=n_groups) >= MIN_GROUP_SIZE
+    candidates = np.flatnonzero(eligible[codes] & (magnitude > fence[codes]))
+    candidate_codes = codes[candidates]
+    score = _robust_score(magnitude[candidates], median[candidate_codes], mad[candidate_codes])
+
+    flagged = score >= z_threshold
+    rows = np.flatnonzero(spend_mask)[candidates[flagged]]
+    return pd.DataFrame({
+        "transaction_date": df["transaction_date"].to_numpy()[rows],
+        "category": categories[candidate_codes[flagged]],
+        "amount": df["amount"].to_numpy()[rows],
+        "median": median[candidate_codes[flagged]],
+        "score": score[flagged],
+    }).sort_values("score", ascending=False)
+
+
+def _month_numbers(months: np.ndarray) -> np.ndarray:
+    """"YYYY-MM" -> consecutive integers, so adjacent calendar months differ by one."""
+    return np.array([int(month[:4]) * 12 + int(month[5:7]) - 1 for month in months], dtype=np.int64)
+
+
+def _previous_calendar_month(totals: np.ndarray, categories: np.ndarray, months: np.ndarray, n_categories: int) -> np.ndarray:
+    """Each cell's total in the same category's previous calendar month.
+
+    Cells must be sorted by category, then month. A month the category had no
+    spend in counts as 0; the category's first month has no previous one (NaN).
+    """
+    stride = months.max() + 2
+    keys = categories * stride + months
+    wanted = keys - 1
+    position = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    previous = np.where(keys[position] == wanted, totals[position], 0.0)
+
+    first = np.full(n_categories, np.iinfo(np.int64).max)
+    np.minimum.at(first, categories, months)
+    previous[months == first[categories]] = np.nan
+    return previous
+
+
+def monthly_spikes(df: pd.DataFrame, z_threshold: float = 3.0, min_change: float = 0.5, min_delta: float = 50.0) -> pd.DataFrame:
+    columns = ["category", "month", "total", "previous", "median", "score"]
+    month_codes, months = _codes(df["month"])
+    mask = ~df["is_income"].to_numpy() & (months != "unknown")[month_codes]
+    if not mask.any():
+        return pd.DataFrame(columns=columns)
+
+    # Category x month spend totals with one bincount over the whole history
+    category_codes, categories = _codes(df["category"])
+    cell_keys = category_codes[mask].astype(np.int64) * len(months) + month_codes[mask]
+    cells = np.bincount(cell_keys, weights=df["amount"].to_numpy()[mask], minlength=len(categories) * len(months))
+    active = np.bincount(cell_keys, minlength=len(categories) * len(months)) > 0
+
+    # From here on the table is tiny (categories x months)
+    cell_category, cell_month = np.divmod(np.flatnonzero(active), len(months))
+    monthly = pd.DataFrame({
+        "category": categories[cell_category],
+        "month": months[cell_month],
+        "total": np.abs(cells[active]),
+    })
+    codes = cell_category
+    totals = monthly["total"].to_numpy()
+    previous = _previous_calendar_month(totals, cell_category, _month_numbers(months[cell_month]), len(categories))
+    months_seen = np.bincount(codes, minlength=len(categories))[codes]
+
+    _, median, _, mad = _group_stats(totals, codes, len(categories))
+    median, mad = median[codes], mad[codes]
+    score = _robust_score(totals, median, mad)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(previous > 0, (totals - previous) / previous, np.inf)
+
+    flagged = (
+        (months_seen >= MIN_GROUP_SIZE)
+        & ~np.isnan(previous)
+        & (score >= z_threshold)
+        & (change >= min_change)
+        & (totals - np.nan_to_num(previous) >= min_delta)
+    )
+    return monthly.loc[flagged].assign(
+        previous=previous[flagged], median=median[flagged], score=score[flagged]
+    ).sort_values("score", ascending=False)
+
+
+def detect_anomalies(df: pd.DataFrame, limit: int = 10) -> List[dict]:
+    """Top anomalies in the shape `InsightResponse.anomalies` uses."""
+    if df.empty:
+        return []
+
+    anomalies = []
+    for row in transaction_outliers(df).head(limit).itertuples(index=False):
+        amount = abs(row.amount)
+        anomalies.append({
+            "kind": "transaction",
+            "description": f"Unusually large {row.category} transaction on {row.transaction_date}",
+            "category": row.category,
+            "date": str(row.transaction_date),
+            "amount": round(float(amount), 2),
+            "typical_amount": round(float(row.median), 2),
+            "score": round(float(row.score), 2),
+            "suggestion": (
+                f"This is {amount / max(row.median, 0.01):.1f}x your typical {row.category} transaction "
+                f"of ${row.median:.2f}; check that it was planned or expected."
+            ),
+        })
+
+    for row in monthly_spikes(df).head(limit).itertuples(index=False):
+        anomalies.append({
+            "kind": "monthly_increase",
+            "description": f"{row.category} spending jumped in {row.month}",
+            "category": row.category,
+            "month": row.month,
+            "amount": round(float(row.total), 2),
+            "previous_amount": round(float(row.previous), 2),
+            "typical_amount": round(float(row.median), 2),
+            "score": round(float(row.score), 2),
+            "suggestion": (
+                f"{row.category} went from ${row.previous:.2f} to ${row.total:.2f}; a monthly budget near "
+                f"your typical ${row.median:.2f} would bring it back in line."
+            ),
+        })
+
+    anomalies.sort(key=lambda anomaly: anomaly["score"], reverse=True)
+    return anomalies[:limit]
@@ -0,0 +1,224 @@
+"""Structured card rewards and local card ranking.
+
+The scraper stores cards with free-text terms (`"cashback": {"dining": "5%"}`,
+`"annual_fee": "$95"`, `"APR": "0% intro ..., then 15.99%-22.99% variable"`).
+`parse_card` turns those into numbers once, at write time, under `rewards`:
+
+    {"rates": {"Dining": 0.05, ...}, "base_rate": 0.01, "annual_fee": 95.0,
+     "apr_min": 15.99, "apr_max": 22.99}
+
+`score_cards` then prices every card for every user at once from a
+users x cards x categories reward matrix: expected annual net reward is
+category spend times the card's rate for that category, minus the annual fee.
+"""
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .classifier import CATEGORIES
+
+# Income isn't spend, so no card earns on it
+SPEND_CATEGORIES = [category for category in CATEGORIES if category != "Income"]
+
+# Words in scraped cashback keys -> our transaction categories
+CATEGORY_KEYWORDS = {
+    "Groceries": ("grocer", "supermarket", "wholesale"),
+    "Dining": ("dining", "restaurant", "food", "takeout", "delivery"),
+    "Shopping": ("shopping", "amazon", "online", "retail", "department"),
+    "Health & Wellness": ("drugstore", "pharmac", "health", "wellness", "fitness"),
+    "Entertainment": ("entertainment", "streaming", "movie", "theater", "theatre", "concert"),
+    "Travel & Transport": ("travel", "gas", "fuel", "transit", "airline", "flight", "hotel", "uber", "lyft", "rideshare", "car rental"),
+    "Bills & Utilities": ("utilit", "phone", "internet", "cable", "wireless", "bill"),
+}
+BASE_KEYWORDS = ("other", "everything", "all purchases", "everyday", "base", "general")
+
+_PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_MULTIPLIER = re.compile(r"(\d+(?:\.\d+)?)\s*x\b", re.IGNORECASE)
+_MONEY = re.compile(r"\$\s*(\d[\d,]*(?:\.\d+)?)")
+
+
+def parse_rate(text) -> float:
+    """Best reward rate in a cashback string as a fraction: "5%" -> 0.05,
+    "3x points" -> 0.03 (points valued at a cent each)."""
+    text = str(text)
+    values = [float(value) for value in _PERCENT.findall(text)]
+    if not values:
+        values = [float(value) for value in _MULTIPLIER.findall(text)]
+    return max(values) / 100 if values else 0.0
+
+
+def parse_fee(text) -> float:
+    """Annual fee in dollars; "$0", "None" and "No annual fee" are 0.
+    Introductory "$0 the first year, then $95" counts the ongoing fee."""
+    values = [float(value.replace(",", "")) for value in _MONEY.findall(str(text))]
+    return max(values) if values else 0.0
+
+
+def parse_apr(text) -> Tuple[Optional[float], Optional[float]]:
+    """Regular (post-intro) APR range in percent."""
+    text = str(text)
+    # "0% intro APR for 15 months, then 18.24%-28.99% variable" -> the part after "then"
+    regular = re.split(r"\bthen\b|\bafter that\b", text, flags=re.IGNORECASE)[-1]
+    values = [float(value) for value in _PERCENT.findall(regular) if float(value) > 0]
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+def _category_for(key: str) -> Optional[str]:
+    key = key.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in key for keyword in keywords):
+            return category
+    return None
+
+
+def parse_card(card: dict) -> dict:
+    """Structured `rewards` for a scraped card document."""
+    cashback = card.get("cashback") or {}
+    if not isinstance(cashback, dict):
+        cashback = {"others": cashback}
+
+    rates: Dict[str, float] = {}
+    base_rate = 0.0
+    for key, value in cashback.items():
+        rate = parse_rate(value)
+        category = _category_for(key)
+        if category:
+            rates[category] = max(rates.get(category, 0.0), rate)
+        elif any(keyword in key.lower() for keyword in BASE_KEYWORDS):
+            base_rate = max(base_rate, rate)
+
+    apr_min, apr_max = parse_apr(card.get("APR", ""))
+    return {
+        "rates": rates,
+        "base_rate": base_rate,
+        "annual_fee": parse_fee(card.get("annual_fee", "")),
+        "apr_min": apr_min,
+        "apr_max": apr_max,
+    }
+
+
+def card_rewards(card: dict) -> dict:
+    # Cards stored before rewards were parsed at write time
+    return card.get("rewards") or parse_card(card)
+
+
+def reward_matrix(cards: Sequence[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """(cards x categories) reward rates and per-card annual fees."""
+    rates = np.zeros((len(cards), len(SPEND_CATEGORIES)))
+    fees = np.zeros(len(cards))
+    for i, card in enumerate(cards):
+        rewards = card_rewards(card)
+        rates[i] = rewards["base_rate"]
+        for j, category in enumerate(SPEND_CATEGORIES):
+            rates[i, j] = max(rates[i, j], rewards["rates"].get(category, 0.0))
+        fees[i] = rewards["annual_fee"]
+    return rates, fees
+
+
+def spend_vector(spend: Dict[str, float]) -> np.ndarray:
+    """Annual spend per category (positive amounts) in SPEND_CATEGORIES order;
+    anything outside the known categories counts as Others."""
+    vector = np.zeros(len(SPEND_CATEGORIES))
+    others = SPEND_CATEGORIES.index("Others")
+    for category, amount in spend.items():
+        index = SPEND_CATEGORIES.index(category) if category in SPEND_CATEGORIES else others
+        if category != "Income":
+            vector[index] += max(float(amount), 0.0)
+    return vector
+
+
+def score_cards(spend: np.ndarray, rates: np.ndarray, fees: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Expected annual rewards for users x cards.
+
+    `spend` is (users x categories). Returns the net reward (users x cards) and the
+    gross reward broken down by category (users x cards x categories).
+    """
+    by_category = spend[:, None, :] * rates[None, :, :]
+    return by_category.sum(axis=2) - fees[None, :], by_category
+
+
+def rank_cards(
+    spend: Dict[str, float],
+    cards: Sequence[dict],
+    top_k: int = 3,
+    matrix: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> List[dict]:
+    """Top cards for one user's annual category spend, best net reward first.
+
+    `matrix` is a precomputed `reward_matrix(cards)`, e.g. from the catalog snapshot.
+    """
+    if not cards:
+        return []
+    rates, fees = matrix if matrix is not None else reward_matrix(cards)
+    net, by_category = score_cards(spend_vector(spend)[None, :], rates, fees)
+
+    # Stable sort so equal scores keep catalog order and results are deterministic
+    order = np.argsort(-net[0], kind="stable")[:top_k]
+    return _priced(order, cards, rates, fees, net[0], by_category[0])
+
+
+def price_cards(
+    spend: Dict[str, float],
+    cards: Sequence[dict],
+    indices: Sequence[int],
+    matrix: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> List[dict]:
+    """The user's figures for the given cards (catalog indices), in that order,
+    in the same shape as `rank_cards` entries."""
+    if not cards or not len(indices):
+        return []
+    rates, fees = matrix if matrix is not None else reward_matrix(cards)
+    net, by_category = score_cards(spend_vector(spend)[None, :], rates, fees)
+    return _priced(indices, cards, rates, fees, net[0], by_category[0])
+
+
+def _priced(indices, cards, rates, fees, net, by_category) -> List[dict]:
+    priced = []
+    for i in indices:
+        earning = np.argsort(-by_category[i], kind="stable")[:3]
+        priced.append({
+            "index": int(i),
+            "card": cards[i],
+            "net_reward": round(float(net[i]), 2),
+            "gross_reward": round(float(by_category[i].sum()), 2),
+            "annual_fee": round(float(fees[i]), 2),
+            "top_categories": [
+                {
+                    "category": SPEND_CATEGORIES[j],
+                    "rate": round(float(rates[i, j]), 4),
+                    "reward": round(float(by_category[i, j]), 2),
+                }
+                for j in earning if by_category[i, j] > 0
+            ],
+        })
+    return priced
+
+
+def describe_card(card: dict) -> str:
+    """The static part of a card's line in the reasons prompt."""
+    return (
+        f"{card['name']} ({card['provider']}): cashback {describe_cashback(card)}, "
+        f"annual fee {card.get('annual_fee', '')}, benefits: {json.dumps(card.get('benefits', []))}"
+    )
+
+
+def describe_cashback(card: dict) -> str:
+    cashback = card.get("cashback")
+    if isinstance(cashback, dict):
+        return ", ".join(f"{value} on {key}" for key, value in cashback.items())
+    return str(cashback or "")
+
+
+def default_reason(ranked: dict) -> str:
+    """Templated reason used when the LLM is unavailable."""
+    parts = [
+        f"{entry['rate'] * 100:g}% on {entry['category']} (about ${entry['reward']:,.2f}/year)"
+        for entry in ranked["top_categories"]
+    ]
+    earning = "; ".join(parts) if parts else "no bonus categories matching your spending"
+    fee = f" after the ${ranked['annual_fee']:,.2f} annual fee" if ranked["annual_fee"] else " with no annual fee"
+    return f"Estimated ${ranked['net_reward']:,.2f}/year in rewards{fee}: {earning}."
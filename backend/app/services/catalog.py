@@ -0,0 +1,114 @@
+"""Credit-card catalog version and in-process snapshot.
+
+`catalog_meta` holds one counter per catalog that the scraper bumps whenever it
+writes cards. Anything derived from the catalog (cached recommendations) is
+keyed on the version, so new cards invalidate it without explicit purges.
+
+`card_catalog` keeps an immutable snapshot of the cards with their reward
+matrix and prompt lines already built. It is loaded at startup and replaced
+wholesale when the version moves (the scraper reloads it directly, other
+processes pick the change up by polling), so recommendations never read
+`credit_cards` in the steady state.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Tuple
+
+import numpy as np
+from pymongo import ReturnDocument
+
+from ..config import Settings
+from .cards import describe_card, reward_matrix
+
+settings = Settings()
+
+CATALOG_META = "catalog_meta"
+CARD_CATALOG = "credit_cards"
+
+
+async def catalog_version(db) -> int:
+    meta = await db[CATALOG_META].find_one({"_id": CARD_CATALOG}, {"version": 1})
+    return meta["version"] if meta else 0
+
+
+async def bump_catalog_version(db) -> int:
+    meta = await db[CATALOG_META].find_one_and_update(
+        {"_id": CARD_CATALOG},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return meta["version"]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    cards: Tuple[dict, ...]
+    rates: np.ndarray
+    fees: np.ndarray
+    # One pre-rendered prompt line per card, same order as `cards`
+    prompt_lines: Tuple[str, ...]
+    loaded_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def build(cls, version: int, cards) -> "CatalogSnapshot":
+        cards = tuple(cards)
+        rates, fees = reward_matrix(cards)
+        # Shared by every request, so make accidental in-place edits fail loudly
+        rates.flags.writeable = False
+        fees.flags.writeable = False
+        return cls(
+            version=version,
+            cards=cards,
+            rates=rates,
+            fees=fees,
+            prompt_lines=tuple(describe_card(card) for card in cards),
+        )
+
+    @property
+    def matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.rates, self.fees
+
+
+class CardCatalog:
+    """Holder for the current snapshot; swapping the reference is the only mutation."""
+
+    def __init__(self):
+        self.snapshot = CatalogSnapshot.build(version=-1, cards=())
+        self.reloads = 0
+
+    async def reload(self, db) -> CatalogSnapshot:
+        # Read the version first: a write landing in between is picked up on the next check
+        version = await catalog_version(db)
+        cards = await db[CARD_CATALOG].find({}, {"_id": 0}).to_list(None)
+        snapshot = CatalogSnapshot.build(version, cards)
+        self.snapshot = snapshot
+        self.reloads += 1
+        return snapshot
+
+    async def refresh_if_changed(self, db) -> bool:
+        if await catalog_version(db) == self.snapshot.version:
+            return False
+        await self.reload(db)
+        return True
+
+    async def poll(self, db, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_changed(db)
+            except Exception as e:
+                print(f"Card catalog refresh failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "version": self.snapshot.version,
+            "cards": len(self.snapshot.cards),
+            "loaded_at": self.snapshot.loaded_at,
+            "reloads": self.reloads,
+        }
+
+
+card_catalog = CardCatalog()
@@ -0,0 +1,171 @@
+import asyncio
+from typing import List, Tuple
+
+import pandas as pd
+
+from ..config import Settings
+from ..llm import get_gateway, run_concurrently
+from .classifier import canonical_category, get_classifier
+from .merchants import merchant_cache, merchant_key
+from .statements import build_transactions, format_rows
+
+settings = Settings()
+
+
+def build_categorisation_prompt(statement_text: str) -> str:
+    return f"""Analyze the following bank statement transactions from the statement text and extract relevant financial details. 
+        For each transaction, return the following fields in JSON format:
+
+        1.⁠ ⁠Row: The row number given at the start of the line.
+        2.⁠ ⁠Transaction Date: Extract the date when the transaction was made.
+        3.⁠ ⁠Category: Determine the category of the transaction based on its description. 
+        Use the following categories:
+        - Groceries (e.g., FOOD LION, COSTCO, WALMART)
+        - Dining (e.g., Restaurants, Cafes, Fast Food, Starbucks)
+        - Shopping (e.g., Amazon, Online stores, Retail purchases)
+        - Health & Wellness (e.g., Pharmacies, Herbal stores, Clinics)
+        - Entertainment (e.g., Movies, Games, Subscriptions)
+        - Travel & Transport (e.g., Uber, Gas stations, Airlines)
+        - Bills & Utilities (e.g., Electricity, Internet, Water bills)
+        - Income (e.g., Salary, Cashback, Statement Credit)
+        - Others (If the description does not fit any category)
+
+        4.⁠ ⁠Amount: The exact transaction amount.
+        5.⁠ ⁠Type: Determine if the transaction is a Credit (positive amount) or Debit (negative amount).
+
+        Return the output as a JSON array with one object per row, in the same order, where each object follows this structure:
+
+        [
+            {{
+                "row": 0,
+                "transaction_date": "YYYY-MM-DD",
+                "category": "Category Name",
+                "amount": XX.XX,
+                "type": "Credit/Debit"
+            }}
+        ]
+        Statement text: {statement_text}"""
+
+
+def _row_id(item: dict):
+    try:
+        return int(item.get("row"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def categorise_batch(lines: List[str], row_ids: List[int]) -> List[dict]:
+    """Categorise one batch, re-asking the model if the call fails, the reply isn't a
+    usable JSON array or it leaves rows out.
+
+    Items whose row id isn't one of `row_ids` are dropped. A batch never fails the
+    upload: whatever is still unanswered after the last attempt (the whole batch,
+    if every attempt failed) falls back to the default category.
+    """
+    prompt = build_categorisation_prompt("\n".join(lines))
+    attempts = settings.categorise_batch_retries + 1
+    expected = set(row_ids)
+
+    for attempt in range(attempts):
+        try:
+            result = await get_gateway().generate_json(prompt)
+            if not isinstance(result, list) or not all(isinstance(item, dict) for item in result):
+                raise ValueError("Expected a JSON array of transactions")
+        except Exception as e:
+            # Gateway timeouts and provider errors as much as malformed replies
+            error = str(e) or type(e).__name__
+            if attempt == attempts - 1:
+                print(f"Categorisation batch failed ({error}), using the default category for its {len(expected)} rows")
+                return []
+            print(f"Categorisation batch failed ({error}), retrying")
+            continue
+
+        # The model echoes row ids back as ints, strings or not at all
+        answered = {}
+        for item in result:
+            row = _row_id(item)
+            if row in expected and row not in answered:
+                answered[row] = {**item, "row": row}
+        missing = len(expected) - len(answered)
+        if missing and attempt < attempts - 1:
+            print(f"Categorisation batch left out {missing} rows, retrying")
+            continue
+        if missing:
+            print(f"Categorisation batch left out {missing} rows, using the default category for them")
+        return [answered[row] for row in sorted(answered)]
+
+
+async def categorise_lines(lines: List[str], row_ids: List[int]) -> List[dict]:
+    """Split statement lines into fixed-size batches, categorise them in parallel
+    (at most `categorise_max_parallel_batches` at a time) and merge them back in order.
+
+    `row_ids` are the row numbers the lines start with, in the same order.
+    """
+    batch_size = settings.categorise_batch_size
+    batches = [
+        (lines[i:i + batch_size], row_ids[i:i + batch_size])
+        for i in range(0, len(lines), batch_size)
+    ]
+    semaphore = asyncio.Semaphore(settings.categorise_max_parallel_batches)
+
+    async def run(batch):
+        async with semaphore:
+            return await categorise_batch(*batch)
+
+    results = await run_concurrently(*[run(batch) for batch in batches])
+    return [transaction for batch in results for transaction in batch]
+
+
+async def categorise_rows(db, rows: pd.DataFrame) -> Tuple[List[dict], dict]:
+    """Categorise parsed statement rows, asking the LLM only about merchants that
+    neither the merchant cache nor the local classifier (confidently) knows, and
+    teaching the cache the LLM's answers.
+
+    Returns the transactions in row order plus merchant-cache hit statistics.
+    """
+    # Statements repeat descriptions a lot, so normalise each distinct one once
+    descriptions = rows["description"]
+    keys = descriptions.map({text: merchant_key(text) for text in descriptions.unique()})
+    known = await merchant_cache.lookup(db, keys.unique())
+    hits = int(keys.isin(list(known)).sum())
+
+    # One representative row per unknown merchant; rows without a usable key go as-is
+    unkeyed = keys == ""
+    unknown = ~unkeyed & ~keys.isin(list(known))
+    first_rows = keys[unknown].drop_duplicates()
+    pending = dict(zip(first_rows.values, first_rows.index))
+
+    # Predictions are not written back to the cache, so it only ever holds LLM labels
+    classified = {}
+    classifier = get_classifier()
+    if classifier is not None and pending:
+        pending_keys = list(pending)
+        predicted, confidence = classifier.predict(pending_keys)
+        for key, category, score in zip(pending_keys, predicted, confidence):
+            if score >= settings.classifier_min_confidence:
+                classified[key] = category
+                del pending[key]
+        known.update(classified)
+
+    llm_rows = pd.concat([rows.loc[list(pending.values())], rows[unkeyed]])
+    categories_by_row = {}
+    if len(llm_rows):
+        results = await categorise_lines(format_rows(llm_rows).tolist(), llm_rows["row"].astype(int).tolist())
+        # Anything outside our categories is left for build_transactions' default
+        categories_by_row = {_row_id(item): canonical_category(item.get("category")) for item in results}
+        learned = {key: categories_by_row.get(int(rows.at[index, "row"])) for key, index in pending.items()}
+        await merchant_cache.store(db, learned)
+        known.update({key: category for key, category in learned.items() if category})
+
+    categories = keys.map(known)
+    categories[unkeyed] = rows.loc[unkeyed, "row"].map(categories_by_row)
+    transactions = build_transactions(rows, categories, keys)
+
+    stats = {
+        "hits": hits,
+        "misses": len(rows) - hits,
+        "classified_merchants": len(classified),
+        "llm_rows": len(llm_rows),
+        "hit_rate": round(hits / len(rows), 4) if len(rows) else 0.0
+    }
+    return transactions, stats
@@ -0,0 +1,149 @@
+"""Local settlement of savings challenges.
+
+A challenge caps spending in one category between `start_date` and
+`end_date` (inclusive, YYYY-MM-DD). Its spend is the negated net amount of
+the user's transactions in that category and window, so refunds count back.
+Spend above `target_amount` fails the challenge straight away; once the
+window is over, anything at or under the target completes it. Everything
+else stays Active. `target_amount` is therefore a spending cap, and generated
+challenges are checked by `prepare_challenges` before they are stored.
+"""
+import re
+from datetime import date
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from .classifier import canonical_category
+
+ACTIVE = "Active"
+COMPLETED = "Completed"
+FAILED = "Failed"
+
+
+def _category_match(category: str) -> dict:
+    # Challenge categories come from the LLM, so don't depend on their capitalisation
+    return {"$regex": f"^{re.escape(str(category).strip())}$", "$options": "i"}
+
+
+def _window(challenge: dict) -> dict:
+    return {
+        "category": _category_match(challenge["category"]),
+        "transaction_date": {"$gte": str(challenge["start_date"]), "$lte": str(challenge["end_date"])},
+    }
+
+
+async def challenge_spend(db, user_id: str, challenges: List[dict]) -> Dict[str, float]:
+    """Spend per challenge id, for all challenges in one aggregation."""
+    if not challenges:
+        return {}
+
+    # The outer $match narrows to the user's rows in any challenge window; each
+    # facet then sums its own window from that (already small) set
+    pipeline = [
+        {"$match": {"user_id": user_id, "$or": [_window(challenge) for challenge in challenges]}},
+        {"$facet": {
+            str(challenge["_id"]): [
+                {"$match": _window(challenge)},
+                {"$group": {"_id": None, "total": {"$sum": "$amount"}}},
+            ]
+            for challenge in challenges
+        }},
+    ]
+    result = await db["transactions"].aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {}
+
+    spend = {}
+    for challenge in challenges:
+        totals = facets.get(str(challenge["_id"])) or [{"total": 0.0}]
+        # Debits are negative, so spend is the negated net total (+ 0.0 turns -0.0 into 0.0)
+        spend[str(challenge["_id"])] = round(-float(totals[0]["total"]), 2) + 0.0
+    return spend
+
+
+def _parse_date(value) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def prepare_challenges(challenges: List[dict], today: date) -> List[dict]:
+    """The generated challenges the evaluator can settle, normalised for storing.
+
+    Each needs a known category, a positive target and a valid window that hasn't
+    ended yet; a window starting in the past is moved to start today, since spend
+    from before the challenge was set mustn't count against it. Anything else is
+    dropped.
+    """
+    prepared = []
+    for challenge in challenges:
+        category = canonical_category(challenge.get("category"))
+        start, end = _parse_date(challenge.get("start_date")), _parse_date(challenge.get("end_date"))
+        try:
+            target = float(challenge.get("target_amount"))
+        except (TypeError, ValueError):
+            target = 0.0
+        if not category or category == "Income" or target <= 0 or start is None or end is None:
+            print(f"Dropping unusable generated challenge: {challenge}")
+            continue
+        if end < today or end < start:
+            print(f"Dropping generated challenge whose window is over or empty: {challenge}")
+            continue
+        prepared.append({
+            **challenge,
+            "category": category,
+            "target_amount": round(target, 2),
+            "start_date": max(start, today).isoformat(),
+            "end_date": end.isoformat(),
+            "status": ACTIVE,
+        })
+    return prepared
+
+
+def settle(challenge: dict, spent: float, today: date) -> str:
+    try:
+        target = float(challenge["target_amount"])
+    except (TypeError, ValueError):
+        return ACTIVE
+    if spent > target:
+        return FAILED
+    if str(challenge["end_date"]) < today.isoformat():
+        return COMPLETED
+    return ACTIVE
+
+
+async def evaluate_challenges(db, user_id: str, today: Optional[date] = None) -> Dict[str, int]:
+    """Settle the user's active challenges and write the results in one bulk write.
+
+    Every evaluated challenge gets its current `spent`; finished ones also get
+    their new status. Returns how many were completed and failed.
+    """
+    today = today or date.today()
+    active = await db["challenges"].find(
+        {"user_id": user_id, "status": ACTIVE},
+        {"_id": 1, "category": 1, "start_date": 1, "end_date": 1, "target_amount": 1}
+    ).to_list(None)
+    # Challenges without a usable window can't be evaluated
+    active = [
+        challenge for challenge in active
+        if challenge.get("category") and challenge.get("start_date") and challenge.get("end_date")
+    ]
+    if not active:
+        return {COMPLETED: 0, FAILED: 0}
+
+    spend = await challenge_spend(db, user_id, active)
+
+    counts = {COMPLETED: 0, FAILED: 0}
+    operations = []
+    for challenge in active:
+        spent = spend[str(challenge["_id"])]
+        new_status = settle(challenge, spent, today)
+        update = {"spent": spent}
+        if new_status != ACTIVE:
+            update["status"] = new_status
+            counts[new_status] += 1
+        operations.append(UpdateOne({"_id": challenge["_id"]}, {"$set": update}))
+
+    await db["challenges"].bulk_write(operations, ordered=False)
+    return counts
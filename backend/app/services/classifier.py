@@ -0,0 +1,203 @@
+"""Local transaction classifier trained on the categories Gemini has already assigned.
+
+Multinomial naive Bayes over hashed character n-grams of the merchant key. It is
+small enough to train in seconds and classifies a whole statement with a handful
+of NumPy operations, so only rows it is unsure about need to go to the LLM.
+
+    python -m app.services.classifier train     # fit on all labels and save
+    python -m app.services.classifier report    # held-out accuracy and latency
+"""
+import argparse
+import os
+import time
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import Settings
+
+settings = Settings()
+
+CATEGORIES = [
+    "Groceries",
+    "Dining",
+    "Shopping",
+    "Health & Wellness",
+    "Entertainment",
+    "Travel & Transport",
+    "Bills & Utilities",
+    "Income",
+    "Others",
+]
+_CATEGORY_NAMES = {category.lower(): category for category in CATEGORIES}
+
+
+def canonical_category(category) -> Optional[str]:
+    """The CATEGORIES entry `category` names (ignoring case and outer whitespace), else None."""
+    if not isinstance(category, str):
+        return None
+    return _CATEGORY_NAMES.get(category.strip().lower())
+
+
+class TransactionClassifier:
+    def __init__(self, n_features: int = 2 ** 16, ngram_range: Tuple[int, int] = (2, 4), alpha: float = 0.1):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.alpha = alpha
+        self.classes = np.array(CATEGORIES)
+        self.class_log_prior = None
+        self.feature_log_prob = None
+
+    def _hash_ngrams(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Flat (document index, feature index) pairs for every n-gram of every text."""
+        doc_ids = []
+        features = []
+        low, high = self.ngram_range
+        for doc_id, text in enumerate(texts):
+            padded = f" {text} "
+            for n in range(low, high + 1):
+                for start in range(len(padded) - n + 1):
+                    doc_ids.append(doc_id)
+                    # crc32 rather than hash() so features are stable across processes
+                    features.append(zlib.crc32(padded[start:start + n].encode()) % self.n_features)
+        return np.asarray(doc_ids, dtype=np.int64), np.asarray(features, dtype=np.int64)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str]) -> "TransactionClassifier":
+        class_index = {name: i for i, name in enumerate(self.classes)}
+        y = np.array([class_index.get(label, class_index["Others"]) for label in labels], dtype=np.int64)
+
+        doc_ids, features = self._hash_ngrams(texts)
+        counts = np.zeros((len(self.classes), self.n_features), dtype=np.float64)
+        np.add.at(counts, (y[doc_ids], features), 1)
+
+        smoothed = counts + self.alpha
+        self.feature_log_prob = np.log(smoothed / smoothed.sum(axis=1, keepdims=True)).astype(np.float32)
+
+        class_counts = np.bincount(y, minlength=len(self.classes)) + 1
+        self.class_log_prior = np.log(class_counts / class_counts.sum()).astype(np.float32)
+        return self
+
+    def predict(self, texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """Return the predicted category and its posterior probability for each text."""
+        if not len(texts):
+            return [], np.zeros(0, dtype=np.float32)
+
+        doc_ids, features = self._hash_ngrams(texts)
+        scores = np.tile(self.class_log_prior, (len(texts), 1))
+        np.add.at(scores, doc_ids, self.feature_log_prob[:, features].T)
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        best = probabilities.argmax(axis=1)
+        return self.classes[best].tolist(), probabilities[np.arange(len(texts)), best]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            classes=self.classes,
+            class_log_prior=self.class_log_prior,
+            feature_log_prob=self.feature_log_prob,
+            ngram_range=np.array(self.ngram_range),
+            alpha=np.array(self.alpha)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TransactionClassifier":
+        data = np.load(path)
+        model = cls(
+            n_features=data["feature_log_prob"].shape[1],
+            ngram_range=tuple(int(n) for n in data["ngram_range"]),
+            alpha=float(data["alpha"])
+        )
+        model.classes = data["classes"]
+        model.class_log_prior = data["class_log_prior"]
+        model.feature_log_prob = data["feature_log_prob"]
+        return model
+
+
+_classifier: Optional[TransactionClassifier] = None
+
+
+def load_classifier(path: Optional[str] = None) -> Optional[TransactionClassifier]:
+    global _classifier
+    path = path or settings.classifier_model_path
+    if not os.path.exists(path):
+        print(f"No transaction classifier at {path}, every unknown merchant will go to the LLM")
+        _classifier = None
+    else:
+        _classifier = TransactionClassifier.load(path)
+    return _classifier
+
+
+def get_classifier() -> Optional[TransactionClassifier]:
+    return _classifier
+
+
+def load_training_data(db) -> Tuple[List[str], List[str]]:
+    """Merchant keys and the categories the LLM gave them."""
+    texts, labels = [], []
+    for doc in db['merchant_categories'].find({}, {"_id": 0, "merchant": 1, "category": 1}):
+        # Labels cached before categories were validated may not be ours
+        category = canonical_category(doc.get("category"))
+        if doc.get("merchant") and category:
+            texts.append(doc["merchant"])
+            labels.append(category)
+    return texts, labels
+
+
+def evaluate(texts: List[str], labels: List[str], holdout: float, min_confidence: float, seed: int = 0) -> dict:
+    order = np.random.default_rng(seed).permutation(len(texts))
+    split = int(len(texts) * (1 - holdout))
+    train_idx, test_idx = order[:split], order[split:]
+
+    model = TransactionClassifier().fit([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+    test_texts = [texts[i] for i in test_idx]
+    expected = np.array([labels[i] for i in test_idx])
+
+    started = time.perf_counter()
+    predicted, confidence = model.predict(test_texts)
+    elapsed = time.perf_counter() - started
+
+    predicted = np.array(predicted)
+    confident = confidence >= min_confidence
+    return {
+        "train_rows": len(train_idx),
+        "test_rows": len(test_idx),
+        "accuracy": float((predicted == expected).mean()) if len(test_idx) else 0.0,
+        "confident_share": float(confident.mean()) if len(test_idx) else 0.0,
+        "confident_accuracy": float((predicted[confident] == expected[confident]).mean()) if confident.any() else 0.0,
+        "latency_ms_total": round(elapsed * 1000, 3),
+        "latency_us_per_row": round(elapsed * 1e6 / max(len(test_idx), 1), 3),
+    }
+
+
+def main():
+    from ..db import get_sync_database
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local transaction classifier")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--output", default=settings.classifier_model_path)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--min-confidence", type=float, default=settings.classifier_min_confidence)
+    args = parser.parse_args()
+
+    texts, labels = load_training_data(get_sync_database())
+    if not texts:
+        raise SystemExit("No labelled merchants found in merchant_categories")
+
+    if args.command == "report":
+        for name, value in evaluate(texts, labels, args.holdout, args.min_confidence).items():
+            print(f"{name}: {value}")
+        return
+
+    started = time.perf_counter()
+    TransactionClassifier().fit(texts, labels).save(args.output)
+    print(f"Trained on {len(texts)} merchants in {time.perf_counter() - started:.2f}s, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Compact statistical digest of a user's transactions for the insights prompt.
+
+The model gets aggregates (per-month and per-category totals, top merchants,
+income vs spend, detected anomalies and subscriptions) rather than raw documents, so the prompt
+stays roughly the same size however long the history is.
+"""
+import json
+from collections import defaultdict
+from itertools import repeat
+from operator import contains, itemgetter, methodcaller
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .anomalies import detect_anomalies
+
+# Rough chars-per-token ratio for English/JSON text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+DIGEST_FIELDS = {"_id": 0, "transaction_date": 1, "category": 1, "amount": 1, "type": 1, "merchant": 1, "description": 1}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def to_frame(transactions: Iterable[dict]) -> pd.DataFrame:
+    """One row per transaction, built from NumPy arrays made straight from the
+    projected documents: pandas' generic list-of-dicts inference was most of the
+    cost on large histories.
+
+    `category` and `month` are sorted categoricals, so the anomaly engine
+    reuses their codes instead of factorizing strings again; group by them with
+    `observed=True`.
+    """
+    transactions = list(transactions)
+    columns = {"amount": _amounts(transactions)}
+
+    # Parse and label each distinct day once, then spread them over the rows
+    day_codes, days = _encode(transactions, "transaction_date", "")
+    parsed = pd.DatetimeIndex(pd.to_datetime(days, errors="coerce"))
+    columns["transaction_date"] = days[day_codes]
+    columns["date"] = parsed.to_numpy()[day_codes]
+    labels = np.where(parsed.isna(), "unknown", np.datetime_as_string(parsed.to_numpy().astype("datetime64[M]")))
+    month_codes, months = pd.factorize(labels.astype(object), sort=True)
+    columns["month"] = pd.Categorical.from_codes(month_codes[day_codes], months)
+
+    # Uncategorised rows count as Others, as everywhere else
+    columns["category"] = pd.Categorical.from_codes(*_encode(transactions, "category", "Others"))
+    columns["is_income"] = _column(transactions, "type", keep_empty=True) == "Credit"
+
+    # Descriptions only stand in for merchants on documents from before merchants were stored
+    for field in ("merchant", "description"):
+        column = _column(transactions, field)
+        if column is not None:
+            columns[field] = column
+            break
+    # The arrays are ours, so pandas can keep them instead of copying into blocks
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(transactions)), copy=False)
+
+
+def _encode(transactions: List[dict], field: str, missing: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes and sorted distinct values of a low-cardinality field (dates,
+    categories, types); missing values count as `missing`."""
+    column = _column(transactions, field, keep_empty=True)
+    codes, distinct = pd.factorize(column, sort=True)
+    if (codes < 0).any():
+        column[codes < 0] = missing
+        codes, distinct = pd.factorize(column, sort=True)
+    return codes, distinct
+
+
+def _column(transactions: List[dict], field: str, keep_empty: bool = False) -> Optional[np.ndarray]:
+    """`field` of every transaction; None when no transaction has a value for it,
+    unless `keep_empty`."""
+    try:
+        # Projected documents usually all have the field: no per-document .get
+        column = np.fromiter(map(itemgetter(field), transactions), dtype=object, count=len(transactions))
+    except KeyError:
+        if not keep_empty and not any(map(contains, transactions, repeat(field))):
+            return None
+        column = np.fromiter(map(methodcaller("get", field), transactions), dtype=object, count=len(transactions))
+    return column if keep_empty or any(value is not None for value in column) else None
+
+
+def _amounts(transactions: List[dict]) -> np.ndarray:
+    try:
+        amounts = np.fromiter(map(itemgetter("amount"), transactions), dtype=float, count=len(transactions))
+    except (KeyError, TypeError, ValueError):
+        # Missing, None or non-numeric amounts
+        values = pd.Series([transaction.get("amount") for transaction in transactions], dtype=object)
+        amounts = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    amounts[np.isnan(amounts)] = 0.0
+    return amounts
+
+
+def _round(values):
+    return {key: round(float(value), 2) for key, value in values.items()}
+
+
+def build_digest(
+    transactions: Iterable[dict],
+    token_budget: int = 2000,
+    df: Optional[pd.DataFrame] = None,
+    anomalies: Optional[List[dict]] = None,
+    subscriptions: Optional[List[dict]] = None
+) -> str:
+    df = to_frame(transactions) if df is None else df
+    if df.empty:
+        return "{}"
+    if anomalies is None:
+        anomalies = detect_anomalies(df)
+
+    income = df.loc[df["is_income"], "amount"].sum()
+    spend = df.loc[~df["is_income"], "amount"].sum()
+    monthly = df.pivot_table(
+        index="month", columns="is_income", values="amount", aggfunc="sum", fill_value=0.0, observed=True
+    )
+    by_category = df.groupby("category", observed=True)["amount"].agg(["sum", "count"]).sort_values(
+        "sum", key=np.abs, ascending=False
+    )
+    category_month = df[~df["is_income"]].pivot_table(
+        index="category", columns="month", values="amount", aggfunc="sum", fill_value=0.0, observed=True
+    )
+
+    merchant_column = next((column for column in ("merchant", "description") if column in df), None)
+    top_merchants = {}
+    if merchant_column:
+        spend_rows = df[~df["is_income"] & df[merchant_column].notna()]
+        top_merchants = spend_rows.groupby(merchant_column)["amount"].agg(["sum", "count"])
+        top_merchants = top_merchants.reindex(top_merchants["sum"].abs().sort_values(ascending=False).index)
+
+    def render(months: int, merchants: int, outliers: int) -> str:
+        recent = sorted(category_month.columns)[-months:] if months else []
+        digest = {
+            "period": {
+                "from": df["date"].min().strftime("%Y-%m-%d") if df["date"].notna().any() else None,
+                "to": df["date"].max().strftime("%Y-%m-%d") if df["date"].notna().any() else None,
+                "transactions": int(len(df)),
+            },
+            "income_vs_spend": {"income": round(float(income), 2), "spend": round(float(spend), 2), "net": round(float(income + spend), 2)},
+            "monthly": {
+                month: {"income": round(float(row.get(True, 0.0)), 2), "spend": round(float(row.get(False, 0.0)), 2)}
+                for month, row in monthly.tail(months or 1).iterrows()
+            },
+            "categories": {
+                category: {"total": round(float(row["sum"]), 2), "count": int(row["count"])}
+                for category, row in by_category.iterrows()
+            },
+            "category_spend_by_month": {
+                category: _round(row) for category, row in category_month[recent].iterrows()
+            } if recent else {},
+            "top_merchants": [
+                {"merchant": name, "total": round(float(row["sum"]), 2), "count": int(row["count"])}
+                for name, row in top_merchants.head(merchants).iterrows()
+            ] if merchants and len(top_merchants) else [],
+            "subscriptions": [
+                {key: subscription[key] for key in ("merchant", "cadence", "amount", "annual_cost", "last_charge", "active")}
+                for subscription in (subscriptions or [])[:merchants]
+            ],
+            "anomalies": [
+                {key: anomaly[key] for key in ("description", "amount", "typical_amount")}
+                for anomaly in anomalies[:outliers]
+            ],
+        }
+        return json.dumps(digest, separators=(",", ":"))
+
+    # Shrink the least important detail first until the digest fits the budget
+    months, merchants, outliers = 12, 15, 10
+    text = render(months, merchants, outliers)
+    while estimate_tokens(text) > token_budget and (months > 1 or merchants or outliers):
+        if months > 3:
+            months //= 2
+        elif merchants > 5:
+            merchants //= 2
+        elif outliers > 3:
+            outliers //= 2
+        elif months > 1:
+            months -= 1
+        elif merchants:
+            merchants = 0
+        else:
+            outliers = 0
+        text = render(months, merchants, outliers)
+    return text
+
+
+class StatementTally:
+    """Running totals over a statement's transactions, added chunk by chunk.
+
+    Holds one entry per month, category and merchant rather than per row, so a
+    statement of any length can be summarised for a prompt without keeping its
+    transactions around. `render` gives a JSON digest in the shape of
+    `build_digest`'s period/income/monthly/category/merchant sections.
+    """
+
+    def __init__(self):
+        self.first: Optional[str] = None
+        self.last: Optional[str] = None
+        self.count = 0
+        self.income = 0.0
+        self.spend = 0.0
+        self.monthly = defaultdict(lambda: [0.0, 0.0])
+        self.categories = defaultdict(lambda: [0.0, 0])
+        self.merchants = defaultdict(lambda: [0.0, 0])
+
+    def add(self, transactions: Iterable[dict]):
+        for transaction in transactions:
+            amount = float(transaction.get("amount") or 0.0)
+            is_income = transaction.get("type") == "Credit"
+            date = str(transaction.get("transaction_date") or "")
+            if date:
+                self.first = min(self.first or date, date)
+                self.last = max(self.last or date, date)
+            self.count += 1
+            if is_income:
+                self.income += amount
+            else:
+                self.spend += amount
+            self.monthly[date[:7] or "unknown"][0 if is_income else 1] += amount
+            self.categories[transaction.get("category") or "Others"][0] += amount
+            self.categories[transaction.get("category") or "Others"][1] += 1
+            merchant = transaction.get("merchant") or transaction.get("description")
+            if merchant and not is_income:
+                self.merchants[merchant][0] += amount
+                self.merchants[merchant][1] += 1
+
+    def render(self, token_budget: int = 1000) -> str:
+        if not self.count:
+            return "{}"
+        by_size = lambda item: -abs(item[1][0])
+        categories = sorted(self.categories.items(), key=by_size)
+        merchants = sorted(self.merchants.items(), key=by_size)
+
+        def render(months: int, top: int) -> str:
+            return json.dumps({
+                "period": {"from": self.first, "to": self.last, "transactions": self.count},
+                "income_vs_spend": {
+                    "income": round(self.income, 2), "spend": round(self.spend, 2), "net": round(self.income + self.spend, 2)
+                },
+                "monthly": {
+                    month: {"income": round(income, 2), "spend": round(spend, 2)}
+                    for month, (income, spend) in sorted(self.monthly.items())[-months:]
+                },
+                "categories": {
+                    category: {"total": round(total, 2), "count": count} for category, (total, count) in categories
+                },
+                "top_merchants": [
+                    {"merchant": name, "total": round(total, 2), "count": count} for name, (total, count) in merchants[:top]
+                ],
+            }, separators=(",", ":"))
+
+        # Same idea as build_digest: drop the least important detail until it fits
+        months, top = 12, 15
+        text = render(months, top)
+        while estimate_tokens(text) > token_budget and (months > 1 or top):
+            if months > 3:
+                months //= 2
+            elif top > 5:
+                top //= 2
+            elif months > 1:
+                months -= 1
+            else:
+                top = 0
+            text = render(months, top)
+        return text
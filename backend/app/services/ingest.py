@@ -0,0 +1,283 @@
+"""Statement upload pipeline.
+
+Parses a CSV statement chunk by chunk; for each chunk it drops the rows the
+user has uploaded before (a whole repeated file stops right after hashing),
+categorises the rest, stores them and adds them to the rollups. Then it asks
+the LLM for new savings challenges from the statement's running totals, settles
+active challenges locally (see `challenges.py`) and updates the other derived
+collections (subscriptions, insights cache).
+
+Upload jobs (see `jobs.py`) run this in the background; `StageTimer` lets them
+report which stage a statement is in and how long each one took.
+"""
+import asyncio
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import BinaryIO, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from ..config import Settings
+from ..llm import get_gateway
+from .categorisation import categorise_rows
+from .challenges import COMPLETED, FAILED, evaluate_challenges, prepare_challenges
+from .classifier import CATEGORIES
+from .digest import StatementTally
+from .insights_cache import insights_cache
+from .rollups import apply_transactions, rollup_writer
+from .statements import file_hash, iter_statement, row_hashes
+from .subscriptions import update_subscriptions
+from .uploads import find_upload, remember_upload, unseen_rows
+
+settings = Settings()
+
+DUPLICATE_KEY_ERROR = 11000
+# Rejected duplicates listed in an upload's result and log line (all of them are counted)
+MAX_REPORTED_REJECTIONS = 20
+
+EMPTY_RESULT = {
+    "rows": 0,
+    "inserted": 0,
+    "duplicates": 0,
+    "rejected": 0,
+    "rejected_rows": [],
+    "challenges_created": 0,
+    "challenges_completed": 0,
+    "challenges_failed": 0,
+    "merchant_cache": None,
+}
+
+
+class StageTimer:
+    """Wall-clock seconds per pipeline stage; subclasses can persist progress."""
+
+    def __init__(self):
+        self.timings = {}
+
+    async def on_stage(self, name: str):
+        pass
+
+    async def on_progress(self, **fields):
+        pass
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        await self.on_stage(name)
+        started = time.perf_counter()
+        yield
+        # Stages run once per chunk, so their timings add up
+        self.timings[name] = round(self.timings.get(name, 0.0) + time.perf_counter() - started, 3)
+
+
+def build_challenge_prompt(digest: str, today: date) -> str:
+    categories = ", ".join(category for category in CATEGORIES if category != "Income")
+    return f"""Analyze the following summary of a bank statement. Today is {today.isoformat()}.
+    Give me three easy spending-limit challenges that help the user save money over the coming weeks. Each one caps
+    what the user may spend in one category during the challenge window: spending more than the target fails it.
+    Base each target on the user's usual spend in that category for a window of that length, a little below it, so
+    the challenge is achievable. Return the following fields in JSON format:
+
+    1.⁠Challenge Name: Give me a name for the challenge.
+    2.⁠Challenge Target Amount: The maximum amount the user may spend in the category between the start and end date.
+    3.⁠Challenge Category: Give me a category for the challenge, exactly one of: {categories}.
+    4.⁠Challenge Start Date: On or after today ({today.isoformat()}).
+    5.⁠Challenge End Date: After the start date, at most a month later.
+    6.⁠Challenge Status: Active(always)
+
+
+    Return the output as a JSON array where each object follows this structure:
+
+    [
+        {{
+            "name": "Challenge Name",
+            "target_amount": XX.XX,
+            "category": "Category Name",
+            "start_date": "YYYY-MM-DD",
+            "end_date": "YYYY-MM-DD",
+            "status": "Active"
+        }}
+    ]
+    Statement summary (JSON; Credit is money in and Debit money out, so spend totals are negative): {digest}"""
+
+
+async def insert_new_transactions(collection, user_id: str, transactions: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """Insert the transactions in one unordered batch.
+
+    `unseen_rows` has already dropped the hashes this user had stored, so the only
+    duplicates left are ones a concurrent upload stored meanwhile: the unique
+    (user_id, hash) index turns those away. Returns the inserted transactions and
+    the rejected ones.
+    """
+    if not transactions:
+        return [], []
+
+    try:
+        await collection.insert_many(transactions, ordered=False)
+        return transactions, []
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY_ERROR for error in write_errors):
+            raise
+        failed = {error['index'] for error in write_errors}
+        inserted = [transaction for index, transaction in enumerate(transactions) if index not in failed]
+        return inserted, [transactions[index] for index in sorted(failed)]
+
+
+def describe_rejected(transaction: dict) -> dict:
+    return {key: transaction.get(key) for key in ('transaction_date', 'description', 'amount', 'hash')}
+
+
+def _merge_cache_stats(total: Optional[dict], chunk: dict) -> dict:
+    if total is None:
+        total = {"hits": 0, "misses": 0, "classified_merchants": 0, "llm_rows": 0}
+    for key in total:
+        total[key] += chunk[key]
+    rows = total["hits"] + total["misses"]
+    return {**total, "hit_rate": round(total["hits"] / rows, 4) if rows else 0.0}
+
+
+async def generate_challenges(tally: StatementTally, today: date) -> List[dict]:
+    """New savings challenges for a statement, checked by `prepare_challenges`; an LLM
+    failure here doesn't fail the upload, because its transactions are already stored by then."""
+    prompt = build_challenge_prompt(tally.render(settings.challenge_digest_token_budget), today)
+    try:
+        challenges = await get_gateway().generate_json(prompt)
+    except Exception as e:
+        print(f"Challenge generation failed, skipping it: {str(e)}")
+        return []
+    if not isinstance(challenges, list):
+        return []
+    return prepare_challenges([challenge for challenge in challenges if isinstance(challenge, dict)], today)
+
+
+async def process_statement(db, user_id: str, source: BinaryIO, timer: Optional[StageTimer] = None) -> dict:
+    """Run the whole upload pipeline for one statement and return its counts.
+
+    The statement is handled one `csv_chunk_size` chunk at a time: each chunk is
+    parsed, deduplicated, categorised, stored and added to the rollups before the
+    next one is read, so memory stays flat however long the file is. A row counts
+    as seen once its transaction is stored, so a failed run resumes where it stopped.
+
+    Raises ValueError when the file isn't a statement we can read.
+    """
+    timer = timer or StageTimer()
+
+    async with timer.stage("parse"):
+        # A byte-identical re-upload is answered before parsing, let alone any LLM call
+        digest = await asyncio.to_thread(file_hash, source)
+        previous = await find_upload(db, user_id, digest)
+        if previous is not None:
+            return {
+                **EMPTY_RESULT,
+                "rows": previous["summary"].get("rows", 0),
+                "duplicates": previous["summary"].get("rows", 0),
+                "message": "This statement was already uploaded",
+            }
+
+    chunks = iter_statement(source)
+    total_rows = 0
+    new_rows = 0
+    inserted = 0
+    rejected = 0
+    rejected_rows = []
+    occurrences = Counter()
+    cache_stats = None
+    merchants = set()
+    tally = StatementTally()
+
+    while True:
+        async with timer.stage("parse"):
+            # Parse the next chunk off the event loop
+            rows = await asyncio.to_thread(next, chunks, None)
+            if rows is None:
+                break
+            total_rows += len(rows)
+
+            # Only rows this user hasn't uploaded before (in any file) go downstream
+            hashes = await asyncio.to_thread(row_hashes, rows, occurrences)
+            unseen = await unseen_rows(db, user_id, hashes)
+            rows = rows[unseen].reset_index(drop=True)
+            hashes = hashes[unseen].reset_index(drop=True)
+            new_rows += len(rows)
+        await timer.on_progress(rows=total_rows, new_rows=new_rows)
+        if rows.empty:
+            continue
+
+        async with timer.stage("categorise"):
+            transactions_data, chunk_stats = await categorise_rows(db, rows)
+            cache_stats = _merge_cache_stats(cache_stats, chunk_stats)
+
+        # Rollup rebuilds wait for this lease, so the inserts and their $inc can't interleave with one
+        async with rollup_writer(db, user_id):
+            async with timer.stage("store"):
+                # A transaction's hash is its row hash (date, description, amount and occurrence
+                # in the file), so repeated identical purchases are kept while re-imports are not
+                now = datetime.utcnow()
+                for transaction, row_hash in zip(transactions_data, hashes):
+                    transaction['hash'] = row_hash
+                    transaction['user_id'] = user_id
+                    transaction['created_at'] = now
+
+                # The unique (user_id, hash) index rejects anything a concurrent upload stored meanwhile
+                unique_transactions, chunk_rejected = await insert_new_transactions(
+                    db['transactions'], user_id, transactions_data
+                )
+                rejected += len(chunk_rejected)
+                room = MAX_REPORTED_REJECTIONS - len(rejected_rows)
+                rejected_rows.extend(describe_rejected(transaction) for transaction in chunk_rejected[:room])
+
+            async with timer.stage("aggregates"):
+                await apply_transactions(db, user_id, unique_transactions)
+
+        inserted += len(unique_transactions)
+        tally.add(unique_transactions)
+        merchants.update(
+            transaction.get('merchant') for transaction in unique_transactions if transaction['type'] == 'Debit'
+        )
+
+    async with timer.stage("challenges"):
+        # Challenges come from the statement's running totals, so the prompt's
+        # size and latency don't grow with the number of rows
+        today = date.today()
+        new_challenges_data = await generate_challenges(tally, today) if inserted else []
+
+        # Settle active challenges against the stored history, this statement included
+        settled = await evaluate_challenges(db, user_id, today)
+
+        # Insert new challenges into the database
+        for new_challenge in new_challenges_data:
+            new_challenge['user_id'] = user_id
+            new_challenge['created_at'] = datetime.utcnow()
+        if new_challenges_data:
+            await db['challenges'].insert_many(new_challenges_data)
+
+    if inserted:
+        async with timer.stage("aggregates"):
+            await update_subscriptions(db, user_id, merchants)
+            insights_cache.invalidate_user(user_id)
+
+    if rejected:
+        print(f"Upload for {user_id}: rejected {rejected} duplicate transactions, first {len(rejected_rows)}: {rejected_rows}")
+
+    await remember_upload(db, user_id, digest, {"rows": total_rows})
+
+    duplicates = total_rows - inserted
+    if inserted:
+        message = f"Successfully processed {inserted} new transactions. {duplicates} duplicates were skipped."
+    else:
+        message = "All transactions are duplicates"
+
+    return {
+        "rows": total_rows,
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "rejected_rows": rejected_rows,
+        "challenges_created": len(new_challenges_data),
+        "challenges_completed": settled[COMPLETED],
+        "challenges_failed": settled[FAILED],
+        "merchant_cache": cache_stats,
+        "message": message,
+    }
@@ -0,0 +1,75 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from ..cache import LRUCache
+from ..config import Settings
+
+settings = Settings()
+
+
+async def transactions_fingerprint(db, query: dict) -> str:
+    """Cheap summary of a user's transaction set: row count plus the newest _id.
+
+    Both come from the (user_id, transaction_date, _id) index, so this never
+    touches the documents themselves.
+    """
+    result = await db['transactions'].aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "last_id": {"$max": "$_id"}}}
+    ]).to_list(1)
+    if not result:
+        return "0:"
+    return f"{result[0]['count']}:{result[0]['last_id']}"
+
+
+class InsightsCache:
+    """Validated insights keyed by (user, start_date, end_date).
+
+    An entry is fresh when its transaction fingerprint still matches and the user
+    hasn't uploaded since it was stored. Uploads bump a per-user generation
+    instead of deleting entries, so stale ones can still be served while a
+    refresh runs (stale-while-revalidate).
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.generations = defaultdict(int)
+        self.refreshing = set()
+        # The event loop only keeps weak references to tasks, so background refreshes are held here
+        self.tasks = set()
+
+    def get(self, user_id: str, start_date, end_date, fingerprint: str) -> Tuple[Any, bool]:
+        """Return (cached value or None, whether it is fresh)."""
+        entry = self.entries.get((user_id, start_date, end_date))
+        if entry is None:
+            return None, False
+        fresh = entry["fingerprint"] == fingerprint and entry["generation"] == self.generations[user_id]
+        return entry["value"], fresh
+
+    def set(self, user_id: str, start_date, end_date, fingerprint: str, value: Any):
+        self.entries.set((user_id, start_date, end_date), {
+            "fingerprint": fingerprint,
+            "generation": self.generations[user_id],
+            "value": value,
+        })
+
+    def refresh_in_background(self, user_id: str, start_date, end_date, refresh: Callable[[], Awaitable]):
+        """Start `refresh()` as a task unless one is already running for this entry."""
+        key = (user_id, start_date, end_date)
+        if key in self.refreshing:
+            return
+        self.refreshing.add(key)
+        task = asyncio.create_task(refresh())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda _: self.refreshing.discard(key))
+
+    def invalidate_user(self, user_id: str):
+        self.generations[user_id] += 1
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+insights_cache = InsightsCache(maxsize=settings.insights_cache_size, ttl=settings.insights_cache_ttl)
@@ -0,0 +1,313 @@
+"""Background statement-upload jobs.
+
+`POST /api/transactions/upload` spools the file to disk, records a job in
+`upload_jobs` and returns 202 straight away; a small pool of worker tasks
+takes jobs off a bounded in-process queue and runs the ingest pipeline.
+When the queue is full new uploads are refused (503) instead of piling up.
+
+Job documents carry the status, the current stage, per-stage timings and the
+final counts, so they can be polled and survive restarts. Several processes
+may share the collection, so a worker claims a job atomically (queued ->
+running) and holds a lease on it that it renews while the job runs. Spooled
+files live on the host that accepted the upload, so each host only recovers
+its own jobs: queued ones on startup, and running ones whose lease lapsed
+(their worker died) for as long as it runs.
+"""
+import asyncio
+import os
+import shutil
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO, List, Optional
+
+from pymongo import ReturnDocument
+
+from ..config import Settings
+from .ingest import StageTimer, process_statement
+
+settings = Settings()
+
+JOB_COLLECTION = "upload_jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Fields a client polling a job gets back
+JOB_FIELDS = {"_id": 0, "spool_path": 0, "user_id": 0, "host": 0, "worker": 0, "lease_expires_at": 0}
+
+
+class QueueFull(Exception):
+    """Raised when the upload queue is at capacity."""
+
+
+class JobProgress(StageTimer):
+    """Writes the current stage and each finished stage's timing to the job document."""
+
+    def __init__(self, db, job_id: str):
+        super().__init__()
+        self.db = db
+        self.job_id = job_id
+
+    async def _set(self, fields: dict):
+        await self.db[JOB_COLLECTION].update_one({"job_id": self.job_id}, {"$set": fields})
+
+    async def on_stage(self, name: str):
+        # Persist the previous stage's timing together with the new stage
+        await self._set({"stage": name, "stages": dict(self.timings)})
+
+    async def on_progress(self, **fields):
+        await self._set({f"progress.{key}": value for key, value in fields.items()})
+
+
+class UploadJobQueue:
+    def __init__(
+        self,
+        workers: int = 2,
+        maxsize: int = 100,
+        spool_dir: str = "data/uploads",
+        lease_seconds: float = 120.0,
+        host: Optional[str] = None
+    ):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.spool_dir = spool_dir
+        self.lease = timedelta(seconds=lease_seconds)
+        self.host = host or socket.gethostname()
+        # Tells this process's claims apart from those of a previous run on the same host
+        self.worker_id = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.db = None
+        self.processed = 0
+        self.failed = 0
+        self.recovered = 0
+
+    async def start(self, db):
+        """Start the workers and the recovery of this host's queued and abandoned jobs."""
+        self.db = db
+        # Created here so the queue belongs to the running event loop
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # In the background: a long backlog mustn't hold up startup
+        self.tasks.append(asyncio.create_task(self._requeue()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _on_this_host(self) -> dict:
+        # Jobs from before hosts were recorded can only have been spooled here
+        return {"host": {"$in": [self.host, None]}}
+
+    async def _requeue(self):
+        """Queue this host's jobs left queued by the last shutdown, then keep recovering
+        running jobs whose worker stopped renewing their lease."""
+        # A job another process on this host has queued may be queued here too; whichever
+        # worker claims it first runs it and the other skips it
+        requeued = False
+        while True:
+            try:
+                if not requeued:
+                    await self._requeue_queued()
+                    requeued = True
+                recovered = await self._recover_expired()
+                if recovered:
+                    self.recovered += recovered
+                    print(f"Requeued {recovered} upload jobs whose worker stopped")
+            except Exception as e:
+                # Keep going: one failed query mustn't end recovery until the next restart
+                print(f"Upload job recovery failed: {str(e)}")
+            await asyncio.sleep(self.lease.total_seconds())
+
+    async def _requeue_queued(self):
+        pending = await self.db[JOB_COLLECTION].find(
+            {"status": QUEUED, **self._on_this_host()}, {"job_id": 1, "spool_path": 1}
+        ).sort("created_at", 1).to_list(None)
+        for job in pending:
+            await self._enqueue(job)
+        if pending:
+            print(f"Requeued {len(pending)} queued upload jobs")
+
+    async def _recover_expired(self) -> int:
+        """Move running jobs with a lapsed lease back to queued, one atomic update each,
+        so only the process that moved a job queues it."""
+        recovered = 0
+        while True:
+            job = await self.db[JOB_COLLECTION].find_one_and_update(
+                {
+                    "status": RUNNING,
+                    **self._on_this_host(),
+                    # Jobs claimed before leases were recorded have none to renew
+                    "$or": [{"lease_expires_at": {"$lt": datetime.utcnow()}}, {"lease_expires_at": None}],
+                },
+                {"$set": {"status": QUEUED, "stage": None, "worker": None, "lease_expires_at": None}},
+                projection={"job_id": 1, "spool_path": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                return recovered
+            await self._enqueue(job)
+            recovered += 1
+
+    async def _enqueue(self, job: dict):
+        if not os.path.exists(job.get("spool_path") or ""):
+            # Only if nobody has claimed it in the meantime
+            await self.db[JOB_COLLECTION].update_one(
+                {"job_id": job["job_id"], "status": QUEUED},
+                {"$set": {
+                    "status": FAILED,
+                    "error": "Upload was lost in a restart; please upload again",
+                    "finished_at": datetime.utcnow(),
+                }}
+            )
+            return
+        # Waits for room rather than dropping jobs that were already accepted
+        await self.queue.put(job["job_id"])
+
+    async def submit(self, user_id: str, filename: str, source: BinaryIO) -> str:
+        if self.queue is None or self.queue.full():
+            raise QueueFull()
+
+        job_id = uuid.uuid4().hex
+        spool_path = os.path.join(self.spool_dir, f"{job_id}.csv")
+        await asyncio.to_thread(_spool, source, spool_path)
+
+        await self.db[JOB_COLLECTION].insert_one({
+            "job_id": job_id,
+            "user_id": user_id,
+            "filename": filename,
+            "status": QUEUED,
+            "stage": None,
+            "stages": {},
+            "progress": {},
+            "result": None,
+            "error": None,
+            "spool_path": spool_path,
+            "host": self.host,
+            "worker": None,
+            "lease_expires_at": None,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+        })
+        try:
+            self.queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            # Filled up while the file was being spooled
+            await self.db[JOB_COLLECTION].delete_one({"job_id": job_id})
+            _remove(spool_path)
+            raise QueueFull()
+        return job_id
+
+    async def get(self, user_id: str, job_id: str) -> Optional[dict]:
+        return await self.db[JOB_COLLECTION].find_one({"job_id": job_id, "user_id": user_id}, JOB_FIELDS)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Upload job {job_id} crashed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Claim the job; None means another worker got there first or it is no longer queued
+        now = datetime.utcnow()
+        job = await self.db[JOB_COLLECTION].find_one_and_update(
+            {"job_id": job_id, "status": QUEUED},
+            {"$set": {
+                "status": RUNNING,
+                "worker": self.worker_id,
+                "started_at": now,
+                "lease_expires_at": now + self.lease,
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        progress = JobProgress(self.db, job_id)
+        owned = True
+        try:
+            with open(job["spool_path"], "rb") as source:
+                result = await process_statement(self.db, job["user_id"], source, progress)
+            owned = await self._finish(job_id, SUCCEEDED, stages=progress.timings, result=result)
+            self.processed += 1
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                error = "Timed out waiting for the statement analysis"
+            else:
+                error = str(e)
+            print(f"Upload job {job_id} failed: {error}")
+            owned = await self._finish(job_id, FAILED, stages=progress.timings, error=error)
+            self.failed += 1
+        finally:
+            heartbeat.cancel()
+            # A job recovered from under this worker is someone else's to clean up now
+            if owned:
+                _remove(job["spool_path"])
+
+    async def _heartbeat(self, job_id: str):
+        """Renew the job's lease while it runs, well before it would lapse."""
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                await self.db[JOB_COLLECTION].update_one(
+                    {"job_id": job_id, "worker": self.worker_id, "status": RUNNING},
+                    {"$set": {"lease_expires_at": datetime.utcnow() + self.lease}}
+                )
+            except Exception as e:
+                # The next beat tries again; the lease outlasts a couple of misses
+                print(f"Could not renew the lease of upload job {job_id}: {str(e)}")
+
+    async def _finish(self, job_id: str, job_status: str, **fields) -> bool:
+        """Record the outcome, only while this worker still holds the job so a recovered
+        job isn't finished twice. Returns whether it did."""
+        result = await self.db[JOB_COLLECTION].update_one({"job_id": job_id, "worker": self.worker_id}, {"$set": {
+            **fields,
+            "status": job_status,
+            "stage": None,
+            "lease_expires_at": None,
+            "finished_at": datetime.utcnow(),
+        }})
+        return result.matched_count > 0
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "recovered": self.recovered,
+        }
+
+
+def _spool(source: BinaryIO, path: str):
+    source.seek(0)
+    with open(path, "wb") as target:
+        shutil.copyfileobj(source, target)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+upload_jobs = UploadJobQueue(
+    workers=settings.upload_workers,
+    maxsize=settings.upload_queue_size,
+    spool_dir=settings.upload_spool_dir,
+    lease_seconds=settings.upload_job_lease_seconds
+)
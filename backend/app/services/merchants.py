@@ -0,0 +1,87 @@
+import re
+from datetime import datetime
+from typing import Dict, Iterable
+
+from pymongo import UpdateOne
+
+from ..cache import LRUCache
+from ..config import Settings
+from .classifier import canonical_category
+
+settings = Settings()
+
+# Tokens that card processors add around the merchant name
+NOISE_TOKENS = {
+    "POS", "DEBIT", "CREDIT", "CARD", "PURCHASE", "PAYMENT", "RECURRING",
+    "ONLINE", "WWW", "COM", "SQ", "TST", "PAYPAL", "INC", "LLC", "CO",
+}
+
+
+def merchant_key(description) -> str:
+    """Reduce a raw statement description to a stable merchant key,
+    e.g. "SQ *STARBUCKS #1234 SEATTLE" -> "STARBUCKS SEATTLE"."""
+    tokens = re.sub(r"[^A-Z0-9 ]+", " ", str(description).upper()).split()
+    tokens = [
+        token for token in tokens
+        if token not in NOISE_TOKENS and not any(char.isdigit() for char in token)
+    ]
+    return " ".join(tokens[:4])
+
+
+class MerchantCategoryCache:
+    """merchant key -> category, backed by the `merchant_categories` collection
+    with an in-process LRU in front of it."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.lru = LRUCache(maxsize=maxsize)
+
+    async def lookup(self, db, keys: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        missing = []
+        for key in set(keys):
+            if not key:
+                continue
+            category = self.lru.get(key)
+            if category is None:
+                missing.append(key)
+            else:
+                found[key] = category
+
+        if missing:
+            cursor = db['merchant_categories'].find(
+                {"merchant": {"$in": missing}},
+                {"_id": 0, "merchant": 1, "category": 1}
+            )
+            async for doc in cursor:
+                category = canonical_category(doc.get("category"))
+                if category:
+                    found[doc["merchant"]] = category
+                    self.lru.set(doc["merchant"], category)
+
+        return found
+
+    async def store(self, db, categories: Dict[str, str]):
+        """Cache LLM-assigned categories. Labels outside CATEGORIES are dropped: the
+        cache is shared by every user and is the classifier's training data."""
+        categories = {key: canonical_category(category) for key, category in categories.items() if key}
+        categories = {key: category for key, category in categories.items() if category}
+        if not categories:
+            return
+
+        now = datetime.utcnow()
+        await db['merchant_categories'].bulk_write([
+            UpdateOne(
+                {"merchant": key},
+                {"$set": {"category": category, "updated_at": now}},
+                upsert=True
+            )
+            for key, category in categories.items()
+        ], ordered=False)
+        for key, category in categories.items():
+            self.lru.set(key, category)
+
+    def stats(self) -> dict:
+        return self.lru.stats()
+
+
+merchant_cache = MerchantCategoryCache(maxsize=settings.merchant_cache_size)
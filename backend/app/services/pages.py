@@ -0,0 +1,140 @@
+"""Conditional fetching of scraped provider pages.
+
+Each provider's page state lives in `scraper_pages`: the validators the server
+sent (ETag / Last-Modified) and a hash of the page's normalised visible text.
+A refresh first asks the server with If-None-Match / If-Modified-Since; when
+the page comes back anyway, its content hash decides whether anything changed.
+Only changed pages go on to LLM extraction.
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from bs4 import BeautifulSoup
+
+from ..config import Settings
+
+settings = Settings()
+
+PAGE_COLLECTION = "scraper_pages"
+
+# Elements whose content changes on every load without the offer changing
+NON_CONTENT_TAGS = ["script", "style", "noscript", "svg", "iframe", "template"]
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled client, created on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=settings.scraper_http_timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=settings.scraper_max_concurrency * 2),
+            headers={"User-Agent": settings.scraper_user_agent},
+        )
+    return _client
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]):
+    """Swap the shared client, e.g. for one pointed at a local stand-in server in tests."""
+    global _client
+    _client = client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def normalise_page(html: str) -> str:
+    """Visible text of a page with whitespace collapsed."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(NON_CONTENT_TAGS):
+        tag.decompose()
+    return " ".join(soup.get_text(" ").split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PageFetch:
+    provider: str
+    url: str
+    changed: bool
+    text: Optional[str] = None
+    content_hash: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    status_code: Optional[int] = None
+
+
+async def fetch_page(db, provider: str, url: str, force: bool = False) -> PageFetch:
+    """Fetch a provider page, reporting whether it changed since the last recorded extraction.
+
+    Unchanged pages are marked as checked straight away; changed ones are only
+    recorded by `record_page` once their cards have been stored, so a failed
+    extraction is retried on the next refresh.
+    """
+    stored = await db[PAGE_COLLECTION].find_one({"provider": provider}) or {}
+    known = not force and stored.get("url") == url
+
+    headers = {}
+    if known and stored.get("etag"):
+        headers["If-None-Match"] = stored["etag"]
+    if known and stored.get("last_modified"):
+        headers["If-Modified-Since"] = stored["last_modified"]
+
+    response = await get_http_client().get(url, headers=headers)
+    if response.status_code == 304 and known:
+        await _mark_checked(db, provider)
+        return PageFetch(provider, url, changed=False, content_hash=stored.get("content_hash"), status_code=304)
+    response.raise_for_status()
+
+    # Parsing a large page takes long enough to stall every other request, so it runs off the event loop
+    text = await asyncio.to_thread(normalise_page, response.text)
+    page = PageFetch(
+        provider,
+        url,
+        changed=True,
+        text=text,
+        content_hash=content_hash(text),
+        etag=response.headers.get("etag"),
+        last_modified=response.headers.get("last-modified"),
+        status_code=response.status_code,
+    )
+    if known and page.content_hash == stored.get("content_hash"):
+        page.changed = False
+        await _mark_checked(db, provider, etag=page.etag, last_modified=page.last_modified)
+    return page
+
+
+async def _mark_checked(db, provider: str, **validators):
+    update = {"checked_at": datetime.utcnow()}
+    update.update({key: value for key, value in validators.items() if value})
+    await db[PAGE_COLLECTION].update_one({"provider": provider}, {"$set": update})
+
+
+async def record_page(db, page: PageFetch):
+    """Remember a page's content hash and validators after its cards were stored."""
+    now = datetime.utcnow()
+    await db[PAGE_COLLECTION].update_one(
+        {"provider": page.provider},
+        {"$set": {
+            "url": page.url,
+            "content_hash": page.content_hash,
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+            "checked_at": now,
+            "changed_at": now,
+        }},
+        upsert=True
+    )
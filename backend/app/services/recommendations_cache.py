@@ -0,0 +1,37 @@
+import math
+from typing import Dict
+
+from ..cache import LRUCache
+from ..config import Settings
+
+settings = Settings()
+
+# Spend is bucketed on a log scale in steps of this ratio, so small changes
+# (one more coffee) keep the same fingerprint while real shifts don't
+PROFILE_BUCKET_RATIO = 1.1
+# Seconds to keep rankings whose reasons fell back to the template
+FALLBACK_CACHE_TTL = 300
+
+
+def profile_fingerprint(spend: Dict[str, float]) -> str:
+    """Quantised spending profile, e.g. "Dining:66|Groceries:72".
+
+    Users with near-identical profiles share a fingerprint, and so a cache entry.
+    """
+    buckets = []
+    for category in sorted(spend):
+        amount = spend[category]
+        if amount > 0:
+            buckets.append(f"{category}:{round(math.log1p(amount) / math.log(PROFILE_BUCKET_RATIO))}")
+    return "|".join(buckets)
+
+
+def recommendation_key(spend: Dict[str, float], catalog_version: int, top_k: int) -> tuple:
+    return profile_fingerprint(spend), catalog_version, top_k
+
+
+# Ranked card indexes and their LLM reasons, {"cards": [...], "reasons": {name: reason}},
+# keyed by (profile fingerprint, catalog version, top_k)
+recommendation_cache = LRUCache(
+    maxsize=settings.recommendations_cache_size, ttl=settings.recommendations_cache_ttl
+)
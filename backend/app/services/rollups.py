@@ -0,0 +1,227 @@
+"""Per-user monthly category totals, kept in `transaction_rollups`.
+
+One document per (user_id, month, category, type) holding the summed amount and
+row count, plus the month's first day as a real date (`month_start`). Uploads
+`$inc` the rollups for the rows they insert, so summaries read a few dozen small
+documents instead of the whole transaction history.
+
+A rebuild recomputes rollups from the transactions, which races with those
+`$inc`s: an increment landing between its delete and its `$merge` would be lost
+or counted twice. Uploads therefore hold a writer lease in `rollup_locks` while
+they insert transactions and increment their rollups, and a rebuild takes a
+rebuild lock there, waits for the user's writers to drain and holds new ones
+off until it is done. Leases expire, so a crashed process can't wedge either side.
+
+    python -m app.services.rollups rebuild [--user USER_ID]
+"""
+import argparse
+import asyncio
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..config import Settings
+from ..db import DATABASE_NAME
+from ..indexes import ensure_indexes
+
+settings = Settings()
+
+ROLLUP_COLLECTION = "transaction_rollups"
+LOCK_COLLECTION = "rollup_locks"
+
+# Lock scope of a rebuild over every user
+ALL_USERS = "*"
+# An upload holds its writer lease for one chunk's insert + $inc
+WRITER_LEASE = timedelta(minutes=5)
+REBUILD_LEASE = timedelta(hours=1)
+LOCK_POLL_SECONDS = 1.0
+
+
+class RebuildInProgress(Exception):
+    """Raised when another rebuild already holds the lock for the same scope."""
+
+
+def rollup_key(user_id: str, transaction: dict) -> tuple:
+    return (
+        user_id,
+        str(transaction.get("transaction_date", ""))[:7],
+        transaction.get("category", "Others"),
+        transaction.get("type", "Debit"),
+    )
+
+
+def month_start(month: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(f"{month}-01", "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+async def apply_transactions(db, user_id: str, transactions: Iterable[dict]):
+    """Add newly inserted transactions to the user's rollups in one bulk write."""
+    totals = defaultdict(lambda: [0.0, 0])
+    for transaction in transactions:
+        entry = totals[rollup_key(user_id, transaction)]
+        entry[0] += float(transaction.get("amount", 0))
+        entry[1] += 1
+
+    if not totals:
+        return
+
+    await db[ROLLUP_COLLECTION].bulk_write([
+        UpdateOne(
+            {"user_id": user, "month": month, "category": category, "type": kind},
+            {"$inc": {"total": total, "count": count}, "$set": {"month_start": month_start(month)}},
+            upsert=True
+        )
+        for (user, month, category, kind), (total, count) in totals.items()
+    ], ordered=False)
+
+
+@asynccontextmanager
+async def rollup_writer(db, user_id: str):
+    """Writer lease for inserting a user's transactions and `$inc`-ing their rollups.
+
+    Waits while a rebuild covering the user is running.
+    """
+    locks = db[LOCK_COLLECTION]
+    lease_id = uuid.uuid4().hex
+    while True:
+        now = datetime.utcnow()
+        # Register first, then look for a rebuild: a rebuild that locks after this
+        # check will see the lease and wait for it
+        await locks.insert_one({
+            "_id": lease_id, "kind": "writer", "user_id": user_id, "expires_at": now + WRITER_LEASE
+        })
+        running = await locks.find_one({
+            "kind": "rebuild", "user_id": {"$in": [user_id, ALL_USERS]}, "expires_at": {"$gt": now}
+        })
+        if running is None:
+            break
+        await locks.delete_one({"_id": lease_id})
+        await asyncio.sleep(LOCK_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        await locks.delete_one({"_id": lease_id})
+
+
+async def _acquire_rebuild_lock(db, scope: str) -> str:
+    locks = db[LOCK_COLLECTION]
+    lock_id = f"rebuild:{scope}"
+    now = datetime.utcnow()
+    try:
+        await locks.insert_one({
+            "_id": lock_id, "kind": "rebuild", "user_id": scope, "expires_at": now + REBUILD_LEASE
+        })
+    except DuplicateKeyError:
+        # Take over a lock whose holder died without releasing it
+        result = await locks.update_one(
+            {"_id": lock_id, "expires_at": {"$lte": now}},
+            {"$set": {"expires_at": now + REBUILD_LEASE}}
+        )
+        if result.modified_count == 0:
+            raise RebuildInProgress(f"A rollup rebuild for {scope} is already running")
+    return lock_id
+
+
+async def _wait_for_writers(db, user_id: Optional[str]):
+    while True:
+        query = {"kind": "writer", "expires_at": {"$gt": datetime.utcnow()}}
+        if user_id:
+            query["user_id"] = user_id
+        if not await db[LOCK_COLLECTION].count_documents(query, limit=1):
+            return
+        await asyncio.sleep(LOCK_POLL_SECONDS)
+
+
+async def rebuild(db, user_id: Optional[str] = None):
+    """Recompute rollups from the transactions collection (all users by default).
+
+    Uploads for the users being rebuilt wait until it is done; raises
+    RebuildInProgress if a rebuild of the same scope is already running.
+    """
+    lock_id = await _acquire_rebuild_lock(db, user_id or ALL_USERS)
+    try:
+        await _wait_for_writers(db, user_id)
+        await _recompute(db, user_id)
+    finally:
+        await db[LOCK_COLLECTION].delete_one({"_id": lock_id})
+
+
+async def _recompute(db, user_id: Optional[str]):
+    match = {"user_id": user_id} if user_id else {}
+    await db[ROLLUP_COLLECTION].delete_many(match)
+    await db["transactions"].aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "month": {"$substrCP": [{"$ifNull": ["$transaction_date", ""]}, 0, 7]},
+                "category": {"$ifNull": ["$category", "Others"]},
+                "type": {"$ifNull": ["$type", "Debit"]},
+            },
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "month": "$_id.month",
+            "category": "$_id.category",
+            "type": "$_id.type",
+            "month_start": {"$dateFromString": {
+                "dateString": {"$concat": ["$_id.month", "-01"]},
+                "format": "%Y-%m-%d",
+                "onError": None,
+            }},
+            "total": 1,
+            "count": 1,
+        }},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["user_id", "month", "category", "type"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]).to_list(None)
+
+
+async def backfill_if_empty(db):
+    """First deploy: build rollups for existing history so /summary isn't empty."""
+    if await db[ROLLUP_COLLECTION].estimated_document_count():
+        return
+    if await db["transactions"].estimated_document_count():
+        print("Transaction rollups are empty, backfilling from transactions")
+        try:
+            await rebuild(db)
+        except RebuildInProgress:
+            # Another worker process is already backfilling
+            pass
+
+
+async def _run(user_id: Optional[str]):
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    try:
+        db = client[DATABASE_NAME]
+        # $merge needs the unique index on its "on" fields
+        await ensure_indexes(db)
+        await rebuild(db, user_id)
+        count = await db[ROLLUP_COLLECTION].count_documents({"user_id": user_id} if user_id else {})
+        print(f"Rebuilt {count} rollup documents")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or rebuild the transaction rollups")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user", default=None, help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+    asyncio.run(_run(args.user))
@@ -0,0 +1,50 @@
+"""Per-category spending profile over a user's whole history.
+
+Read from the monthly rollups in one aggregation, so the cost depends on the
+number of (month, category) pairs rather than on the number of transactions.
+"""
+from datetime import datetime
+from typing import Dict
+
+from .rollups import ROLLUP_COLLECTION
+
+
+def _months_between(first: datetime, last: datetime) -> int:
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+
+async def spend_profile(db, user_id: str) -> Dict:
+    """Net spend per category (positive amounts, refunds netted off) and its annualised rate.
+
+    Returns {"categories": [{"category", "spend", "count", "annual_spend"}], "months": n},
+    categories sorted by spend, largest first.
+    """
+    groups = await db[ROLLUP_COLLECTION].aggregate([
+        {"$match": {"user_id": user_id, "category": {"$ne": "Income"}}},
+        {"$group": {
+            "_id": "$category",
+            "total": {"$sum": "$total"},
+            "count": {"$sum": "$count"},
+            "first": {"$min": "$month_start"},
+            "last": {"$max": "$month_start"},
+        }},
+        {"$sort": {"total": 1}},
+    ]).to_list(None)
+
+    firsts = [group["first"] for group in groups if group.get("first")]
+    lasts = [group["last"] for group in groups if group.get("last")]
+    months = _months_between(min(firsts), max(lasts)) if firsts and lasts else 1
+
+    categories = []
+    for group in groups:
+        # Debits are stored negative, so spend is the negated net total
+        spend = -group["total"]
+        if spend <= 0:
+            continue
+        categories.append({
+            "category": group["_id"],
+            "spend": round(spend, 2),
+            "count": group["count"],
+            "annual_spend": round(spend * 12 / months, 2),
+        })
+    return {"categories": categories, "months": months}
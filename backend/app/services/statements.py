@@ -0,0 +1,152 @@
+import hashlib
+from collections import Counter
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..config import Settings
+
+settings = Settings()
+
+
+def _normalise_header(name) -> str:
+    return str(name).strip().lower()
+
+
+def resolve_columns(columns: Iterable[str]) -> Dict[str, str]:
+    """Map our field names to the statement's headers using the configured candidates."""
+    by_name = {_normalise_header(column): column for column in columns}
+    candidates = {
+        "date": settings.csv_date_columns,
+        "description": settings.csv_description_columns,
+        "amount": settings.csv_amount_columns,
+    }
+
+    mapping = {}
+    for field, names in candidates.items():
+        match = next((by_name[_normalise_header(name)] for name in names if _normalise_header(name) in by_name), None)
+        if match is None:
+            raise ValueError(f"Statement has no {field} column (expected one of: {', '.join(names)})")
+        mapping[field] = match
+    return mapping
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    amounts = pd.to_numeric(values, errors="coerce")
+    # Only strings like "$1,200.00" or "(12.50)" need the slower regex clean-up
+    messy = amounts.isna() & values.notna()
+    if messy.any():
+        cleaned = values[messy].str.replace(r"[$,\s]", "", regex=True)
+        cleaned = cleaned.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+        amounts[messy] = pd.to_numeric(cleaned, errors="coerce")
+    return amounts
+
+
+def iter_statement(source: BinaryIO, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Parse an uploaded CSV statement chunk by chunk, yielding compact
+    row/date/description/amount frames of at most `chunk_size` rows. Dates are
+    normalised to YYYY-MM-DD, as they are stored.
+
+    Only the mapped columns of one chunk are materialised at a time and `row`
+    numbers run on across chunks, so callers that handle the chunks one after
+    another keep memory flat however long the statement is.
+    """
+    wanted = {
+        _normalise_header(name)
+        for name in settings.csv_date_columns + settings.csv_description_columns + settings.csv_amount_columns
+    }
+    reader = pd.read_csv(
+        source,
+        chunksize=chunk_size or settings.csv_chunk_size,
+        dtype=str,
+        usecols=lambda name: _normalise_header(name) in wanted,
+        skipinitialspace=True
+    )
+
+    mapping = None
+    next_row = 0
+    for chunk in reader:
+        if mapping is None:
+            mapping = resolve_columns(chunk.columns)
+        frame = pd.DataFrame({
+            "date": normalise_dates(chunk[mapping["date"]].fillna("").str.strip()),
+            "description": chunk[mapping["description"]].fillna("").str.strip(),
+            "amount": (parse_amounts(chunk[mapping["amount"]]) + settings.statement_amount_adjustment).round(2),
+        })
+        frame = frame[frame["amount"].notna()].reset_index(drop=True)
+        if frame.empty:
+            continue
+        frame.insert(0, "row", np.arange(next_row, next_row + len(frame)))
+        next_row += len(frame)
+        yield frame
+
+
+def file_hash(source: BinaryIO, block_size: int = 1 << 20) -> str:
+    """sha256 of the whole upload; leaves the file positioned at the start."""
+    digest = hashlib.sha256()
+    source.seek(0)
+    for block in iter(lambda: source.read(block_size), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def row_hashes(rows: pd.DataFrame, occurrences: Optional[Counter] = None) -> pd.Series:
+    """sha256 per parsed row over its date, normalised description, amount and
+    occurrence, aligned with `rows`.
+
+    The occurrence number tells apart genuinely repeated rows within one file
+    (two identical coffees on the same day), so they hash differently while a
+    re-import of the same rows still hashes the same. Pass the same `occurrences`
+    counter for every chunk of a file so the count carries across chunks. The
+    first occurrence hashes as it did before occurrences were counted.
+
+    Every input is a stored transaction field (`transaction_date`, normalised
+    `description`, `amount`), so stored rows can be rehashed the same way.
+    """
+    occurrences = Counter() if occurrences is None else occurrences
+    keys = (
+        rows["date"].astype(str) + "\x1f"
+        + rows["description"].astype(str).str.split().str.join(" ") + "\x1f"
+        + rows["amount"].map("{:.2f}".format)
+    )
+    hashes = []
+    for key in keys:
+        occurrence = occurrences[key]
+        occurrences[key] += 1
+        if occurrence:
+            key = f"{key}\x1f{occurrence}"
+        hashes.append(hashlib.sha256(key.encode()).hexdigest())
+    return pd.Series(hashes, index=rows.index, dtype=object)
+
+
+def format_rows(rows: pd.DataFrame) -> pd.Series:
+    """One "Row N: Date: ..., Description: ..., Amount: ..." line per row."""
+    return (
+        "Row " + rows["row"].astype(str)
+        + ": Date: " + rows["date"].astype(str)
+        + ", Description: " + rows["description"].astype(str)
+        + ", Amount: " + rows["amount"].astype(str)
+    )
+
+
+def normalise_dates(dates: pd.Series) -> pd.Series:
+    """YYYY-MM-DD where the date can be parsed, the original text otherwise."""
+    parsed = pd.to_datetime(dates, errors="coerce")
+    unparsed = parsed.isna() & (dates != "")
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(dates[unparsed], errors="coerce", format="mixed")
+    return parsed.dt.strftime("%Y-%m-%d").fillna(dates.astype(str))
+
+
+def build_transactions(rows: pd.DataFrame, categories: pd.Series, merchants: Optional[pd.Series] = None) -> List[dict]:
+    amounts = rows["amount"].astype(float)
+    return pd.DataFrame({
+        "transaction_date": rows["date"].values,
+        "description": rows["description"].str.split().str.join(" ").values,
+        "merchant": (merchants if merchants is not None else pd.Series("", index=rows.index)).values,
+        "category": categories.fillna("Others").values,
+        "amount": amounts.values,
+        "type": np.where(amounts > 0, "Credit", "Debit"),
+    }).to_dict("records")
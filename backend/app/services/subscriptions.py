@@ -0,0 +1,189 @@
+"""Recurring-charge detection, kept in the `subscriptions` collection.
+
+A merchant counts as a subscription when its debits arrive at a regular cadence
+(weekly, monthly, quarterly or yearly) with a stable amount. Uploads only
+re-evaluate the merchants they touched, so the collection stays current without
+rescanning the whole history; `/api/analysis/subscriptions` is then a plain read.
+Whether a subscription is still active depends on today's date, so it is worked
+out when subscriptions are read (`with_status`) rather than stored.
+
+    python -m app.services.subscriptions rebuild [--user USER_ID]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteMany, UpdateOne
+
+from ..config import Settings
+from ..db import DATABASE_NAME
+
+settings = Settings()
+
+SUBSCRIPTION_COLLECTION = "subscriptions"
+
+# cadence -> (typical interval in days, allowed deviation in days, charges per year)
+CADENCES = {
+    "weekly": (7, 2, 52),
+    "monthly": (30, 4, 12),
+    "quarterly": (91, 10, 4),
+    "yearly": (365, 20, 1),
+}
+MIN_OCCURRENCES = 3
+# Share of intervals that must fall inside the cadence's tolerance
+MIN_REGULARITY = 0.75
+# Largest relative spread of amounts around the median that still counts as "stable"
+MAX_AMOUNT_SPREAD = 0.2
+
+
+def _cadence(intervals: np.ndarray) -> Optional[str]:
+    median = np.median(intervals)
+    for name, (days, tolerance, _) in CADENCES.items():
+        if abs(median - days) <= tolerance:
+            regular = np.abs(intervals - days) <= tolerance
+            return name if regular.mean() >= MIN_REGULARITY else None
+    return None
+
+
+def detect_subscription(merchant: str, charges: List[dict]) -> Optional[dict]:
+    """Subscription summary for one merchant's debits, or None if they aren't recurring."""
+    dated = sorted(
+        (
+            (datetime.strptime(charge["transaction_date"], "%Y-%m-%d"), abs(float(charge["amount"])), charge)
+            for charge in charges
+            if _is_iso_date(charge.get("transaction_date"))
+        ),
+        # Never fall through to comparing the charge dicts on same-day, same-amount charges
+        key=lambda item: item[:2]
+    )
+    # Same-day duplicates (e.g. a retried charge) would read as a zero-day interval
+    by_day = {}
+    for day, amount, charge in dated:
+        by_day.setdefault(day, (amount, charge))
+    if len(by_day) < MIN_OCCURRENCES:
+        return None
+
+    days = sorted(by_day)
+    intervals = np.diff(np.array(days, dtype="datetime64[D]")).astype(float)
+    cadence = _cadence(intervals)
+    if cadence is None:
+        return None
+
+    amounts = np.array([by_day[day][0] for day in days])
+    amount = float(np.median(amounts))
+    if amount <= 0 or np.max(np.abs(amounts - amount)) / amount > MAX_AMOUNT_SPREAD:
+        return None
+
+    period, tolerance, per_year = CADENCES[cadence]
+    last_charge = days[-1]
+    next_expected = last_charge + timedelta(days=int(round(np.median(intervals))))
+    return {
+        "merchant": merchant,
+        "description": by_day[last_charge][1].get("description") or merchant,
+        "category": by_day[last_charge][1].get("category", "Others"),
+        "cadence": cadence,
+        "interval_days": round(float(np.median(intervals)), 1),
+        "amount": round(amount, 2),
+        "annual_cost": round(amount * per_year, 2),
+        "occurrences": len(days),
+        "first_charge": days[0].strftime("%Y-%m-%d"),
+        "last_charge": last_charge.strftime("%Y-%m-%d"),
+        "next_expected": next_expected.strftime("%Y-%m-%d"),
+    }
+
+
+def is_active(subscription: dict, today: Optional[date] = None) -> bool:
+    """Whether a stored subscription still looks live on `today` (UTC by default).
+
+    Derived at read time, because it changes with the date rather than with
+    uploads: missing more than one expected charge means it was probably cancelled.
+    """
+    period, tolerance, _ = CADENCES[subscription["cadence"]]
+    next_expected = datetime.strptime(subscription["next_expected"], "%Y-%m-%d").date()
+    return (today or datetime.utcnow().date()) <= next_expected + timedelta(days=period + tolerance)
+
+
+def with_status(subscriptions: List[dict], today: Optional[date] = None) -> List[dict]:
+    """The subscriptions with their current `active` flag set."""
+    return [{**subscription, "active": is_active(subscription, today)} for subscription in subscriptions]
+
+
+def _is_iso_date(value) -> bool:
+    try:
+        datetime.strptime(str(value), "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+async def update_subscriptions(db, user_id: str, merchants: Iterable[str]) -> Dict[str, int]:
+    """Re-evaluate the given merchants for one user and upsert/remove their subscriptions."""
+    merchants = sorted({merchant for merchant in merchants if merchant})
+    if not merchants:
+        return {"detected": 0, "removed": 0}
+
+    charges: Dict[str, List[dict]] = {merchant: [] for merchant in merchants}
+    cursor = db["transactions"].find(
+        {"user_id": user_id, "merchant": {"$in": merchants}, "type": "Debit"},
+        {"_id": 0, "merchant": 1, "description": 1, "category": 1, "transaction_date": 1, "amount": 1}
+    )
+    async for transaction in cursor:
+        charges[transaction["merchant"]].append(transaction)
+
+    now = datetime.utcnow()
+    detected = {}
+    for merchant, merchant_charges in charges.items():
+        subscription = detect_subscription(merchant, merchant_charges)
+        if subscription:
+            detected[merchant] = subscription
+
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "merchant": merchant},
+            # `active` used to be stored; it is derived on read now (see is_active)
+            {"$set": {**subscription, "user_id": user_id, "updated_at": now}, "$unset": {"active": ""}},
+            upsert=True
+        )
+        for merchant, subscription in detected.items()
+    ]
+    stale = [merchant for merchant in merchants if merchant not in detected]
+    if stale:
+        operations.append(DeleteMany({"user_id": user_id, "merchant": {"$in": stale}}))
+
+    await db[SUBSCRIPTION_COLLECTION].bulk_write(operations, ordered=False)
+    return {"detected": len(detected), "removed": len(stale)}
+
+
+async def rebuild(db, user_id: Optional[str] = None):
+    """Re-run detection over every stored merchant (all users by default)."""
+    match = {"merchant": {"$nin": [None, ""]}}
+    if user_id:
+        match["user_id"] = user_id
+    groups = await db["transactions"].aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$user_id", "merchants": {"$addToSet": "$merchant"}}},
+    ]).to_list(None)
+    for group in groups:
+        await update_subscriptions(db, group["_id"], group["merchants"])
+
+
+async def _run(user_id: Optional[str]):
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    try:
+        db = client[DATABASE_NAME]
+        await rebuild(db, user_id)
+        count = await db[SUBSCRIPTION_COLLECTION].count_documents({"user_id": user_id} if user_id else {})
+        print(f"{count} subscriptions detected")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the detected subscriptions")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user", default=None, help="Only rebuild this user's subscriptions")
+    args = parser.parse_args()
+    asyncio.run(_run(args.user))
@@ -0,0 +1,113 @@
+import calendar
+from datetime import date, datetime
+from typing import Optional
+
+from .rollups import ROLLUP_COLLECTION
+
+GRANULARITIES = ("day", "week", "month", "year")
+
+
+def _month_aligned(start_date: Optional[date], end_date: Optional[date]) -> bool:
+    if start_date and start_date.day != 1:
+        return False
+    if end_date and end_date.day != calendar.monthrange(end_date.year, end_date.month)[1]:
+        return False
+    return True
+
+
+def _period(field: str, granularity: str) -> dict:
+    trunc = {"date": field, "unit": granularity}
+    if granularity == "week":
+        trunc["startOfWeek"] = "monday"
+    return {"$dateTrunc": trunc}
+
+
+def _facets(date_field: str, amount_field: str, count_expr, granularity: str) -> dict:
+    return {"$facet": {
+        "categories": [
+            {"$group": {"_id": "$category", "total": {"$sum": amount_field}, "count": {"$sum": count_expr}}},
+            {"$sort": {"total": -1}},
+        ],
+        "periods": [
+            {"$group": {"_id": _period(date_field, granularity), "total": {"$sum": amount_field}}},
+            {"$sort": {"_id": 1}},
+        ],
+        "types": [
+            {"$group": {"_id": "$type", "total": {"$sum": amount_field}, "count": {"$sum": count_expr}}},
+        ],
+    }}
+
+
+def _rollup_pipeline(user_id: str, start_date, end_date, granularity: str) -> list:
+    match = {"user_id": user_id, "month_start": {"$ne": None}}
+    if start_date or end_date:
+        match["month_start"] = {}
+        if start_date:
+            match["month_start"]["$gte"] = datetime(start_date.year, start_date.month, 1)
+        if end_date:
+            match["month_start"]["$lte"] = datetime(end_date.year, end_date.month, 1)
+    return [{"$match": match}, _facets("$month_start", "$total", "$count", granularity)]
+
+
+def _transaction_pipeline(user_id: str, start_date, end_date, granularity: str) -> list:
+    # ISO date strings sort like dates, so the range can still use the index
+    match = {"user_id": user_id}
+    if start_date or end_date:
+        match["transaction_date"] = {}
+        if start_date:
+            match["transaction_date"]["$gte"] = start_date.isoformat()
+        if end_date:
+            match["transaction_date"]["$lte"] = end_date.isoformat()
+    return [
+        {"$match": match},
+        {"$addFields": {"date": {"$dateFromString": {
+            "dateString": "$transaction_date",
+            "format": "%Y-%m-%d",
+            "onError": None,
+            "onNull": None,
+        }}}},
+        {"$match": {"date": {"$ne": None}}},
+        _facets("$date", "$amount", 1, granularity),
+    ]
+
+
+async def build_summary(
+    db,
+    user_id: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: str = "month"
+) -> dict:
+    """Category, period and income-vs-spend breakdowns in one aggregation.
+
+    Month/year summaries over whole months read the rollups; anything finer goes
+    to the transactions themselves.
+    """
+    if granularity in ("month", "year") and _month_aligned(start_date, end_date):
+        pipeline = _rollup_pipeline(user_id, start_date, end_date, granularity)
+        collection = ROLLUP_COLLECTION
+    else:
+        pipeline = _transaction_pipeline(user_id, start_date, end_date, granularity)
+        collection = "transactions"
+
+    result = await db[collection].aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {"categories": [], "periods": [], "types": []}
+
+    types = {entry["_id"]: entry for entry in facets["types"]}
+    income = types.get("Credit", {}).get("total", 0)
+    spend = types.get("Debit", {}).get("total", 0)
+
+    return {
+        "categories": facets["categories"],
+        "periods": [
+            {"period": entry["_id"].date().isoformat(), "total": entry["total"]}
+            for entry in facets["periods"]
+        ],
+        "income_vs_spend": {
+            "income": income,
+            "spend": abs(spend),
+            "net": income + spend,
+            "income_count": types.get("Credit", {}).get("count", 0),
+            "spend_count": types.get("Debit", {}).get("count", 0),
+        },
+    }
@@ -0,0 +1,143 @@
+"""What each user has uploaded before, for idempotent re-uploads.
+
+`statement_uploads` keeps one document per (user, file sha256), so a
+byte-identical file is answered without parsing past the hash. Rows are
+recognised by the transactions themselves: a stored transaction's `hash` is its
+statement row hash, so an overlapping export only sends the rows missing from
+`transactions` down the pipeline (and so to the LLM).
+
+Transactions stored before row hashes carry md5(date + amount + type) instead,
+which no re-upload reproduces and which repeats for identical purchases, so the
+unique (user_id, hash) index can't be built over them. Rehash them once before
+starting the app:
+
+    python -m app.services.uploads rehash [--user USER_ID]
+"""
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, UpdateOne
+
+from ..config import Settings
+from ..db import DATABASE_NAME
+from ..indexes import ensure_indexes
+from . import rollups, subscriptions
+from .statements import row_hashes
+
+settings = Settings()
+
+UPLOAD_COLLECTION = "statement_uploads"
+# Row hashes are sha256 hex digests; anything else predates them
+LEGACY_HASH = {"$not": {"$regex": "^[0-9a-f]{64}$"}}
+
+# Keeps each $in query to a sensible size on huge statements
+ROW_BATCH_SIZE = 10000
+
+
+async def find_upload(db, user_id: str, file_hash: str) -> Optional[dict]:
+    return await db[UPLOAD_COLLECTION].find_one(
+        {"user_id": user_id, "file_hash": file_hash}, {"_id": 0}
+    )
+
+
+async def unseen_rows(db, user_id: str, hashes: pd.Series) -> np.ndarray:
+    """Boolean mask over `hashes` of the rows this user hasn't stored a transaction for.
+
+    Served by the unique (user_id, hash) index on `transactions`.
+    """
+    unique = list(dict.fromkeys(hashes))
+    seen = set()
+    for start in range(0, len(unique), ROW_BATCH_SIZE):
+        cursor = db["transactions"].find(
+            {"user_id": user_id, "hash": {"$in": unique[start:start + ROW_BATCH_SIZE]}},
+            {"_id": 0, "hash": 1}
+        )
+        async for doc in cursor:
+            seen.add(doc["hash"])
+    return ~hashes.isin(seen).to_numpy()
+
+
+async def remember_upload(db, user_id: str, file_hash: str, summary: dict):
+    """Record a fully processed file."""
+    await db[UPLOAD_COLLECTION].update_one(
+        {"user_id": user_id, "file_hash": file_hash},
+        {"$set": {"summary": summary, "uploaded_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+async def rehash_legacy_transactions(db, user_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """Give transactions stored before row hashes the hash `row_hashes` computes
+    for their row, so re-uploads recognise them (all users by default).
+
+    A user's legacy rows are numbered in insertion order, the way repeats within
+    one file are, so identical purchases keep distinct hashes. A legacy row whose
+    row hash is already stored was re-uploaded since and is deleted as a duplicate.
+    Returns {user_id: {"rehashed": n, "removed": n}} for the users it touched.
+    """
+    match = {"hash": LEGACY_HASH}
+    if user_id:
+        match["user_id"] = user_id
+    counts = {}
+    for user in await db["transactions"].distinct("user_id", match):
+        occurrences = Counter()
+        docs = await db["transactions"].find(
+            {**match, "user_id": user}, {"transaction_date": 1, "description": 1, "amount": 1}
+        ).sort("_id", 1).to_list(None)
+        counts[user] = {"rehashed": 0, "removed": 0}
+        for start in range(0, len(docs), ROW_BATCH_SIZE):
+            rehashed, removed = await _rehash_batch(db, user, docs[start:start + ROW_BATCH_SIZE], occurrences)
+            counts[user]["rehashed"] += rehashed
+            counts[user]["removed"] += removed
+    return counts
+
+
+async def _rehash_batch(db, user_id: str, docs: List[dict], occurrences: Counter):
+    rows = pd.DataFrame({
+        "date": [str(doc.get("transaction_date") or "") for doc in docs],
+        "description": [str(doc.get("description") or "") for doc in docs],
+        "amount": pd.to_numeric(pd.Series([doc.get("amount") for doc in docs], dtype=object), errors="coerce"),
+    })
+    hashes = row_hashes(rows, occurrences).tolist()
+    stored = set(await db["transactions"].distinct("hash", {"user_id": user_id, "hash": {"$in": hashes}}))
+    operations = [
+        DeleteOne({"_id": doc["_id"]}) if row_hash in stored
+        else UpdateOne({"_id": doc["_id"]}, {"$set": {"hash": row_hash}})
+        for doc, row_hash in zip(docs, hashes)
+    ]
+    await db["transactions"].bulk_write(operations, ordered=False)
+    removed = sum(row_hash in stored for row_hash in hashes)
+    return len(docs) - removed, removed
+
+
+async def _run(user_id: Optional[str]):
+    client = AsyncIOMotorClient(settings.mongodb_uri)
+    try:
+        db = client[DATABASE_NAME]
+        counts = await rehash_legacy_transactions(db, user_id)
+        print(
+            f"Rehashed {sum(entry['rehashed'] for entry in counts.values())} legacy transactions, "
+            f"removed {sum(entry['removed'] for entry in counts.values())} duplicates"
+        )
+        await ensure_indexes(db)
+        # Removed duplicates were counted in the derived collections
+        for user, entry in counts.items():
+            if entry["removed"]:
+                await rollups.rebuild(db, user)
+                await subscriptions.rebuild(db, user)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rehash transactions stored before row hashes")
+    parser.add_argument("command", choices=["rehash"])
+    parser.add_argument("--user", default=None, help="Only rehash this user's transactions")
+    args = parser.parse_args()
+    asyncio.run(_run(args.user))
@@ -0,0 +1,41 @@
+"""Anomaly engine latency on large histories, from transaction documents to
+anomalies (frame building included, as the insights endpoint pays for both).
+
+    cd backend && python -m benchmarks.bench_anomalies --rows 10000 100000 200000
+"""
+import argparse
+import time
+
+from app.services.anomalies import detect_anomalies
+from app.services.digest import DIGEST_FIELDS, to_frame
+from benchmarks.bench_insights_prompt import make_transactions
+
+
+def run(rows: int, repeat: int):
+    # Shaped like the insights endpoint's projected documents
+    fields = [field for field, included in DIGEST_FIELDS.items() if included]
+    transactions = [
+        {field: transaction[field] for field in fields if field in transaction}
+        for transaction in make_transactions(rows)
+    ]
+    detect_anomalies(to_frame(transactions))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        anomalies = detect_anomalies(to_frame(transactions))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(
+        f"rows={rows:>7} anomalies={len(anomalies):>3} best={timings[0] * 1000:7.1f}ms "
+        f"median={timings[len(timings) // 2] * 1000:7.1f}ms worst={timings[-1] * 1000:7.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.repeat)
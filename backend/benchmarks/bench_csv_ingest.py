@@ -0,0 +1,61 @@
+"""Time and peak memory of streamed statement parsing + row hashing + prompt formatting.
+
+Chunks are handled one at a time like the upload pipeline does, so peak memory
+should stay roughly flat as the row count grows.
+
+    cd backend && python -m benchmarks.bench_csv_ingest --rows 100000
+"""
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+from app.services.statements import format_rows, iter_statement, row_hashes
+
+MERCHANTS = ["FOOD LION #1234", "COSTCO WHSE", "STARBUCKS STORE 0042", "UBER TRIP", "AMAZON MKTPLACE", "SHELL OIL 5521"]
+
+
+def make_statement(rows: int) -> bytes:
+    lines = ["Trans. Date,Post Date,Description,Amount"]
+    for i in range(rows):
+        day = 1 + i % 28
+        lines.append(f"2024-01-{day:02d},2024-01-{day:02d},{random.choice(MERCHANTS)},{random.uniform(1, 300):.2f}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def consume(data: bytes, chunk_size: int) -> int:
+    parsed = 0
+    for chunk in iter_statement(io.BytesIO(data), chunk_size=chunk_size):
+        row_hashes(chunk)
+        parsed += len(format_rows(chunk))
+    return parsed
+
+
+def run(rows: int, chunk_size: int):
+    data = make_statement(rows)
+
+    started = time.perf_counter()
+    parsed = consume(data, chunk_size)
+    elapsed = time.perf_counter() - started
+
+    # Separate pass: tracemalloc slows allocation-heavy code down a lot.
+    # The input bytes are allocated before tracing starts, so only parsing counts
+    tracemalloc.start()
+    consume(data, chunk_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"rows={rows:>7} file={len(data) / 1e6:6.2f}MB parsed={parsed:>7} "
+        f"time={elapsed * 1000:8.1f}ms peak={peak / 1e6:6.2f}MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.chunk_size)
@@ -0,0 +1,73 @@
+"""Insights prompt size and latency: raw documents (old) vs the local digest (new).
+
+    cd backend && python -m benchmarks.bench_insights_prompt --rows 500 5000 50000
+    cd backend && python -m benchmarks.bench_insights_prompt --rows 500 --llm   # also time Gemini
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.llm import get_gateway
+from app.routers.analysis import build_insights_prompt
+from app.services.digest import build_digest, estimate_tokens
+
+CATEGORIES = ["Groceries", "Dining", "Shopping", "Entertainment", "Travel & Transport", "Bills & Utilities", "Income"]
+
+
+def make_transactions(rows: int) -> list:
+    start = datetime(2023, 1, 1)
+    transactions = []
+    for _ in range(rows):
+        category = random.choice(CATEGORIES)
+        amount = round(random.uniform(1500, 4000), 2) if category == "Income" else -round(random.lognormvariate(3, 1), 2)
+        transactions.append({
+            "_id": ObjectId(),
+            "transaction_date": (start + timedelta(days=random.randint(0, 540))).strftime("%Y-%m-%d"),
+            "category": category,
+            "amount": amount,
+            "type": "Credit" if amount > 0 else "Debit",
+            "hash": "%032x" % random.getrandbits(128),
+            "user_id": "auth0|benchmark",
+            "created_at": datetime.utcnow(),
+        })
+    return transactions
+
+
+async def time_llm(prompt: str) -> float:
+    started = time.perf_counter()
+    await get_gateway().generate(prompt)
+    return time.perf_counter() - started
+
+
+def run(rows: int, budget: int, llm: bool):
+    transactions = make_transactions(rows)
+
+    started = time.perf_counter()
+    old_prompt = build_insights_prompt(str(transactions))
+    old_build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    new_prompt = build_insights_prompt(build_digest(transactions, budget))
+    new_build = time.perf_counter() - started
+
+    line = (
+        f"rows={rows:>6} old_tokens~{estimate_tokens(old_prompt):>8} new_tokens~{estimate_tokens(new_prompt):>6} "
+        f"old_build={old_build * 1000:7.1f}ms new_build={new_build * 1000:7.1f}ms"
+    )
+    if llm:
+        line += f" old_llm={asyncio.run(time_llm(old_prompt)):6.2f}s new_llm={asyncio.run(time_llm(new_prompt)):6.2f}s"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 5000, 50000])
+    parser.add_argument("--budget", type=int, default=2000)
+    parser.add_argument("--llm", action="store_true", help="Send both prompts to Gemini (needs GEMINI_API_KEY)")
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.budget, args.llm)
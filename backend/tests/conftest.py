@@ -0,0 +1,49 @@
+import os
+import sys
+
+# Settings are read at import time; the values only need to exist, nothing connects to them
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:1")
+os.environ.setdefault("AUTH0_DOMAIN", "example.auth0.com")
+os.environ.setdefault("AUTH0_API_AUDIENCE", "test-audience")
+os.environ.setdefault("AUTH0_CLIENT_ID", "test-client")
+os.environ.setdefault("AUTH0_CLIENT_SECRET", "test-secret")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from app.llm import LLMGateway, set_gateway  # noqa: E402
+from app.services import ingest  # noqa: E402
+from app.services.merchants import merchant_cache  # noqa: E402
+from tests.fakes import FakeDB, FakeLLMBackend  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def llm():
+    """A fake LLM behind a real gateway, installed as the shared one."""
+    backend = FakeLLMBackend(categories={"COFFEE": "Dining", "GROCER": "Groceries", "SALARY": "Income"})
+    set_gateway(LLMGateway(backend, rate_per_second=1000, burst=1000, backoff_base=0, timeout=5, total_timeout=5))
+    merchant_cache.lru.clear()
+    yield backend
+    set_gateway(None)
+    merchant_cache.lru.clear()
+
+
+@pytest.fixture
+def ingest_db(db, llm, monkeypatch):
+    """A database for `process_statement`, with the aggregation-backed stages stubbed out."""
+    async def no_challenges(db, user_id, today=None):
+        return {ingest.COMPLETED: 0, ingest.FAILED: 0}
+
+    async def no_subscriptions(db, user_id, merchants):
+        return None
+
+    monkeypatch.setattr(ingest, "evaluate_challenges", no_challenges)
+    monkeypatch.setattr(ingest, "update_subscriptions", no_subscriptions)
+    return db
@@ -0,0 +1,474 @@
+"""In-memory stand-ins for Motor, the LLM backend and the JWKS endpoint.
+
+`FakeDB` implements the subset of the Motor collection API the services use,
+with the query operators they rely on. Unique indexes are taken from
+`app.indexes.INDEXES`, so duplicate-key behaviour matches a real database.
+Aggregation covers the stages the services' simple pipelines use ($match,
+$group with the common accumulators, $sort, $limit and $facet); tests stub the
+few that need more (date operators, $merge).
+"""
+import copy
+import itertools
+import json
+import re
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.indexes import INDEXES
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _has(doc: dict, path: str) -> bool:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def _set(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if operator == "$exists":
+        return (value is not None) == bool(operand)
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    raise NotImplementedError(f"Query operator {operator}")
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and any(name.startswith("$") for name in condition):
+            value = _get(doc, key)
+            for operator, operand in condition.items():
+                if operator == "$regex":
+                    flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                    if not isinstance(value, str) or not re.search(operand, value, flags):
+                        return False
+                elif operator == "$options":
+                    continue
+                elif operator == "$not":
+                    if matches(doc, {key: operand}):
+                        return False
+                elif not _compare(value, operator, operand):
+                    return False
+        elif _get(doc, key) != condition:
+            return False
+    return True
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [key for key, value in projection.items() if value and key != "_id"]
+    if included:
+        result = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    for key, value in projection.items():
+        if not value:
+            doc.pop(key, None)
+    return doc
+
+
+def _evaluate(doc: dict, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(doc, expression[1:])
+    if isinstance(expression, dict):
+        return {key: _evaluate(doc, value) for key, value in expression.items()}
+    return expression
+
+
+def _accumulate(operator: str, values: list):
+    if operator == "$sum":
+        return sum(value for value in values if isinstance(value, (int, float)))
+    present = [value for value in values if value is not None]
+    if operator == "$min":
+        return min(present) if present else None
+    if operator == "$max":
+        return max(present) if present else None
+    if operator == "$addToSet":
+        return list(dict.fromkeys(present))
+    if operator == "$first":
+        return values[0] if values else None
+    raise NotImplementedError(f"Accumulator {operator}")
+
+
+def _group(docs: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[str, tuple] = {}
+    for doc in docs:
+        key = _evaluate(doc, spec["_id"])
+        groups.setdefault(json.dumps(key, sort_keys=True, default=str), (key, []))[1].append(doc)
+
+    results = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (operator, expression), = accumulator.items()
+            result[field] = _accumulate(operator, [_evaluate(doc, expression) for doc in members])
+        results.append(result)
+    return results
+
+
+def run_pipeline(docs: List[dict], pipeline: list) -> List[dict]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$group":
+            docs = _group(docs, spec)
+        elif name == "$sort":
+            docs = FakeCursor(docs).sort(list(spec.items())).docs
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$facet":
+            docs = [{field: run_pipeline(copy.deepcopy(docs), stages) for field, stages in spec.items()}]
+        else:
+            raise NotImplementedError(f"Aggregation stage {name}")
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for name, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (_get(doc, name) is not None, _get(doc, name)), reverse=order < 0)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.docs if length is None else self.docs[:length])
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.docs: List[dict] = []
+        self.unique = [
+            [field for field, _ in model.document["key"].items()]
+            for model in INDEXES.get(name, [])
+            if model.document.get("unique")
+        ]
+
+    # -- helpers -----------------------------------------------------------------
+
+    def _conflicts(self, doc: dict, ignore: Optional[dict] = None) -> bool:
+        for other in self.docs:
+            if other is ignore:
+                continue
+            if other.get("_id") == doc.get("_id"):
+                return True
+            for fields in self.unique:
+                if all(_has(doc, field) for field in fields) and all(
+                    _get(other, field) == _get(doc, field) for field in fields
+                ):
+                    return True
+        return False
+
+    def _insert(self, doc: dict) -> dict:
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        if self._conflicts(doc):
+            raise DuplicateKeyError("E11000 duplicate key error", DUPLICATE_KEY_ERROR)
+        self.docs.append(doc)
+        return doc
+
+    @staticmethod
+    def _apply(doc: dict, update: dict, inserting: bool):
+        for path, value in update.get("$set", {}).items():
+            _set(doc, path, copy.deepcopy(value))
+        for path, value in update.get("$inc", {}).items():
+            _set(doc, path, (_get(doc, path) or 0) + value)
+        if inserting:
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set(doc, path, copy.deepcopy(value))
+        for path in update.get("$unset", {}):
+            parts = path.split(".")
+            parent = _get(doc, ".".join(parts[:-1])) if len(parts) > 1 else doc
+            if isinstance(parent, dict):
+                parent.pop(parts[-1], None)
+
+    def _upsert_doc(self, query: dict) -> dict:
+        return {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+
+    # -- reads -------------------------------------------------------------------
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor([project(doc, projection) for doc in self.docs if matches(doc, query)])
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        for doc in self.docs:
+            if matches(doc, query):
+                return project(doc, projection)
+        return None
+
+    async def count_documents(self, query: dict, limit: int = 0) -> int:
+        count = sum(1 for doc in self.docs if matches(doc, query))
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self) -> int:
+        return len(self.docs)
+
+    async def distinct(self, key: str, query: Optional[dict] = None) -> list:
+        values = []
+        for doc in self.docs:
+            value = _get(doc, key)
+            if matches(doc, query) and value is not None and value not in values:
+                values.append(value)
+        return values
+
+    def aggregate(self, pipeline: list) -> FakeCursor:
+        return FakeCursor(run_pipeline([copy.deepcopy(doc) for doc in self.docs], pipeline))
+
+    # -- writes ------------------------------------------------------------------
+
+    async def insert_one(self, doc: dict):
+        inserted = self._insert(doc)
+        doc.setdefault("_id", inserted["_id"])
+        return SimpleNamespace(inserted_id=inserted["_id"])
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        errors = []
+        for index, doc in enumerate(docs):
+            try:
+                inserted = self._insert(doc)
+                doc.setdefault("_id", inserted["_id"])
+            except DuplicateKeyError:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                self._apply(doc, update, inserting=False)
+                return SimpleNamespace(matched_count=1, modified_count=int(before != doc), upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query)
+            self._apply(doc, update, inserting=True)
+            inserted = self._insert(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=inserted["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict):
+        modified = 0
+        for doc in self.docs:
+            if matches(doc, query):
+                self._apply(doc, update, inserting=False)
+                modified += 1
+        return SimpleNamespace(matched_count=modified, modified_count=modified)
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        projection: Optional[dict] = None,
+        upsert: bool = False,
+        return_document=ReturnDocument.BEFORE
+    ):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = project(doc, projection)
+                self._apply(doc, update, inserting=False)
+                return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+        if upsert:
+            await self.update_one(query, update, upsert=True)
+            return await self.find_one(self._upsert_doc(query), projection) if return_document == ReturnDocument.AFTER else None
+        return None
+
+    async def delete_one(self, query: dict):
+        for doc in self.docs:
+            if matches(doc, query):
+                self.docs.remove(doc)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query: dict):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, operations: list, ordered: bool = True):
+        upserted = modified = inserted = deleted = 0
+        for operation in operations:
+            if isinstance(operation, UpdateOne):
+                result = await self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+                upserted += result.upserted_id is not None
+                modified += result.modified_count
+            elif isinstance(operation, InsertOne):
+                await self.insert_one(operation._doc)
+                inserted += 1
+            elif isinstance(operation, DeleteOne):
+                deleted += (await self.delete_one(operation._filter)).deleted_count
+            elif isinstance(operation, DeleteMany):
+                deleted += (await self.delete_many(operation._filter)).deleted_count
+            else:
+                raise NotImplementedError(type(operation).__name__)
+        return SimpleNamespace(
+            upserted_count=upserted, modified_count=modified, inserted_count=inserted, deleted_count=deleted
+        )
+
+    async def create_indexes(self, models):
+        return [model.document["name"] for model in models]
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+
+class FakeLLMBackend:
+    """Answers prompts with `respond(prompt)`, recording every prompt it was sent.
+
+    The default answer categorises statement lines ("Row N: Date: ..., Description:
+    ..., Amount: ...") by `categories` keyword and proposes one four-week challenge,
+    starting on the prompt's "Today is" date, for challenge prompts.
+    """
+
+    ROW_LINE = re.compile(r"Row (\d+): Date: ([^,]*), Description: (.*?), Amount: (\S+)")
+    TODAY = re.compile(r"Today is (\d{4}-\d{2}-\d{2})")
+
+    def __init__(self, respond: Optional[Callable[[str], object]] = None, categories: Optional[dict] = None):
+        self.prompts: List[str] = []
+        self.respond = respond or self.default_response
+        self.categories = categories or {}
+        self.started = 0
+        self.cancelled = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        self.started += 1
+        reply = self.respond(prompt)
+        if hasattr(reply, "__await__"):
+            try:
+                reply = await reply
+            except BaseException as e:
+                if type(e).__name__ == "CancelledError":
+                    self.cancelled += 1
+                raise
+        return reply if isinstance(reply, str) else json.dumps(reply)
+
+    def category_for(self, description: str) -> str:
+        for keyword, category in self.categories.items():
+            if keyword in description.upper():
+                return category
+        return "Others"
+
+    def default_response(self, prompt: str):
+        if "challenges" in prompt:
+            today = self.TODAY.search(prompt)
+            start = date.fromisoformat(today.group(1)) if today else date(2024, 2, 1)
+            return [{
+                "name": "Cut back on dining",
+                "target_amount": 40,
+                "category": "Dining",
+                "start_date": start.isoformat(),
+                "end_date": (start + timedelta(days=28)).isoformat(),
+                "status": "Active",
+            }]
+        return [
+            {
+                "row": int(row),
+                "transaction_date": date,
+                "category": self.category_for(description),
+                "amount": float(amount),
+                "type": "Credit" if float(amount) > 0 else "Debit",
+            }
+            for row, date, description, amount in self.ROW_LINE.findall(prompt)
+        ]
+
+    @property
+    def categorisation_prompts(self) -> List[str]:
+        return [prompt for prompt in self.prompts if "Row " in prompt]
+
+
+class FakeJWKS:
+    """Stand-in for the Auth0 JWKS endpoint: serves whatever keys are currently set."""
+
+    def __init__(self, keys: Optional[list] = None):
+        self.keys = list(keys or [])
+        self.fetches = 0
+        self.fail = False
+
+    async def __call__(self, url: str) -> dict:
+        self.fetches += 1
+        if self.fail:
+            raise ConnectionError("JWKS endpoint unreachable")
+        return {"keys": copy.deepcopy(self.keys)}
+
+
+_kids = itertools.count(1)
+
+
+def jwk(kid: Optional[str] = None) -> dict:
+    """A syntactically valid RSA JWK; its modulus is a placeholder, not a real key."""
+    return {"kty": "RSA", "kid": kid or f"key-{next(_kids)}", "use": "sig", "n": "sXch", "e": "AQAB"}
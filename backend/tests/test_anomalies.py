@@ -0,0 +1,58 @@
+from app.services.anomalies import detect_anomalies, monthly_spikes, transaction_outliers
+from app.services.digest import to_frame
+
+
+def spend(day: str, amount: float, category: str = "Dining") -> dict:
+    return {"transaction_date": day, "amount": -amount, "category": category, "type": "Debit"}
+
+
+def test_spike_is_compared_with_the_previous_calendar_month():
+    history = [spend(f"2024-{month:02d}-10", 100) for month in range(1, 7)]
+    # Nothing in July, then a big August
+    history.append(spend("2024-08-10", 900))
+
+    spikes = monthly_spikes(to_frame(history))
+
+    assert spikes["month"].tolist() == ["2024-08"]
+    # July had no dining spend, so August is compared with 0, not with June's 100
+    assert spikes["previous"].tolist() == [0.0]
+
+
+def test_first_month_of_a_category_is_never_a_spike():
+    history = [spend("2024-01-10", 5000)] + [spend(f"2024-{month:02d}-10", 100) for month in range(2, 8)]
+    assert "2024-01" not in monthly_spikes(to_frame(history))["month"].tolist()
+
+
+def test_single_large_transaction_is_flagged():
+    history = [spend(f"2024-01-{day:02d}", 20 + day % 5) for day in range(1, 21)]
+    history.append(spend("2024-01-25", 400))
+
+    outliers = transaction_outliers(to_frame(history))
+
+    assert outliers["amount"].tolist() == [-400]
+    assert outliers["transaction_date"].tolist() == ["2024-01-25"]
+
+
+def test_income_and_small_categories_are_not_scored():
+    history = [spend(f"2024-01-{day:02d}", 20) for day in range(1, 4)] + [spend("2024-01-05", 900)]
+    history += [{"transaction_date": "2024-01-31", "amount": 99999, "category": "Income", "type": "Credit"}]
+    assert detect_anomalies(to_frame(history)) == []
+
+
+def test_uncategorised_transactions_count_as_others():
+    history = [spend(f"2024-01-{day:02d}", 20 + day % 5, category=None) for day in range(1, 21)]
+    history.append(spend("2024-01-25", 400, category=None))
+    df = to_frame(history)
+
+    assert set(df["category"]) == {"Others"}
+    assert transaction_outliers(df)["category"].tolist() == ["Others"]
+
+
+def test_frame_defaults_for_missing_fields():
+    df = to_frame([{"amount": -5}, {"transaction_date": "not a date", "amount": "n/a", "type": "Credit"}])
+
+    assert df["category"].tolist() == ["Others", "Others"]
+    assert df["amount"].tolist() == [-5.0, 0.0]
+    assert df["month"].tolist() == ["unknown", "unknown"]
+    assert df["is_income"].tolist() == [False, True]
+    assert "merchant" not in df and "description" not in df
@@ -0,0 +1,42 @@
+from app.services.cards import SPEND_CATEGORIES, parse_apr, parse_card, parse_fee, parse_rate, rank_cards, spend_vector
+
+CARDS = [
+    {"name": "Dining Card", "provider": "Bank A", "cashback": {"dining": "5%"}, "annual_fee": "$0"},
+    {"name": "Grocery Card", "provider": "Bank B", "cashback": {"groceries": "3%"}, "annual_fee": "$0"},
+    {"name": "Premium Card", "provider": "Bank C", "cashback": {"everything else": "2%"}, "annual_fee": "$550"},
+]
+SPEND = {"Dining": 1000.0, "Groceries": 500.0}
+
+
+def test_reward_terms_are_parsed():
+    assert parse_rate("5% cash back") == 0.05
+    assert parse_rate("3x points") == 0.03
+    assert parse_fee("$0 intro annual fee for the first year, then $95") == 95.0
+    assert parse_fee("No annual fee") == 0.0
+    assert parse_apr("0% intro APR for 15 months, then 18.24%-28.99% variable") == (18.24, 28.99)
+
+
+def test_cashback_keys_map_to_our_categories():
+    rewards = parse_card({"cashback": {"Restaurants & takeout": "4%", "Gas stations": "3%", "All other purchases": "1%"}})
+    assert rewards["rates"] == {"Dining": 0.04, "Travel & Transport": 0.03}
+    assert rewards["base_rate"] == 0.01
+
+
+def test_income_is_not_spend():
+    vector = spend_vector({"Income": 5000, "Dining": 100, "Pets": 50})
+    assert vector.sum() == 150
+    assert vector[SPEND_CATEGORIES.index("Others")] == 50
+
+
+def test_ranking_puts_the_best_net_reward_first():
+    cards = [{**card, "rewards": parse_card(card)} for card in CARDS]
+    ranked = rank_cards(SPEND, cards, top_k=3)
+
+    assert [entry["card"]["name"] for entry in ranked] == ["Dining Card", "Grocery Card", "Premium Card"]
+    assert [entry["net_reward"] for entry in ranked] == [50.0, 15.0, -520.0]
+    assert ranked[0]["top_categories"] == [{"category": "Dining", "rate": 0.05, "reward": 50.0}]
+
+
+def test_equal_scores_keep_catalog_order():
+    cards = [{**CARDS[0], "name": name} for name in ("First", "Second")]
+    assert [entry["card"]["name"] for entry in rank_cards(SPEND, cards, top_k=2)] == ["First", "Second"]
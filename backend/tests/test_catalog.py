@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.services.catalog import CARD_CATALOG, CardCatalog, bump_catalog_version, catalog_version
+
+DINING = {"name": "Dining Card", "provider": "Bank A", "cashback": {"dining": "5%"}, "annual_fee": "$0"}
+GROCERY = {"name": "Grocery Card", "provider": "Bank B", "cashback": {"groceries": "3%"}, "annual_fee": "$95"}
+
+
+def publish(db, *cards):
+    """What the scraper does: write the cards, then bump the version."""
+    async def run():
+        await db[CARD_CATALOG].insert_many([dict(card) for card in cards])
+        return await bump_catalog_version(db)
+    return asyncio.run(run())
+
+
+def test_versions_count_up_from_zero(db):
+    assert asyncio.run(catalog_version(db)) == 0
+    assert publish(db, DINING) == 1
+    assert publish(db, GROCERY) == 2
+
+
+def test_snapshot_is_swapped_only_when_the_version_moves(db):
+    catalog = CardCatalog()
+    publish(db, DINING)
+
+    assert asyncio.run(catalog.refresh_if_changed(db)) is True
+    first = catalog.snapshot
+    assert asyncio.run(catalog.refresh_if_changed(db)) is False
+    assert catalog.snapshot is first
+
+    publish(db, GROCERY)
+    assert asyncio.run(catalog.refresh_if_changed(db)) is True
+
+    assert catalog.snapshot is not first
+    assert catalog.stats()["version"] == 2 and catalog.reloads == 2
+    assert [card["name"] for card in catalog.snapshot.cards] == ["Dining Card", "Grocery Card"]
+    assert catalog.snapshot.rates.shape[0] == len(catalog.snapshot.prompt_lines) == 2
+    # A request still holding the old snapshot keeps a consistent view
+    assert [card["name"] for card in first.cards] == ["Dining Card"]
+    assert first.rates.shape[0] == len(first.prompt_lines) == 1
+
+
+def test_snapshot_matrix_is_read_only(db):
+    catalog = CardCatalog()
+    publish(db, DINING)
+    snapshot = asyncio.run(catalog.reload(db))
+
+    with pytest.raises(ValueError):
+        snapshot.rates[0, 0] = 1.0
+    with pytest.raises(ValueError):
+        snapshot.fees[0] = 0.0
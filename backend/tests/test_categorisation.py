@@ -0,0 +1,87 @@
+import asyncio
+
+from app.llm import LLMGateway, set_gateway
+from app.services.categorisation import categorise_batch
+from tests.fakes import FakeLLMBackend
+from tests.test_ingest import upload
+
+LINES = [
+    "Row 3: Date: 2024-01-05, Description: COFFEE SHOP, Amount: -4.5",
+    "Row 4: Date: 2024-01-06, Description: GROCER, Amount: -52.1",
+]
+
+
+def with_replies(*replies):
+    replies = iter(replies)
+    backend = FakeLLMBackend(lambda prompt: next(replies))
+    set_gateway(LLMGateway(backend, rate_per_second=1000, burst=1000, timeout=5, total_timeout=5))
+    return backend
+
+
+def teardown_function():
+    set_gateway(None)
+
+
+def item(row, category="Dining"):
+    return {"row": row, "transaction_date": "2024-01-05", "category": category, "amount": -4.5, "type": "Debit"}
+
+
+def test_row_ids_echoed_as_strings_are_accepted():
+    with_replies([item("4"), item(3)])
+    result = asyncio.run(categorise_batch(LINES, [3, 4]))
+    assert [entry["row"] for entry in result] == [3, 4]
+
+
+def test_unknown_and_unusable_row_ids_are_dropped():
+    with_replies([item(3), item(4), item(99), item(None), item("four")])
+    result = asyncio.run(categorise_batch(LINES, [3, 4]))
+    assert [entry["row"] for entry in result] == [3, 4]
+
+
+def test_missing_rows_are_asked_for_again():
+    backend = with_replies([item(3)], [item(3), item(4)])
+    result = asyncio.run(categorise_batch(LINES, [3, 4]))
+    assert [entry["row"] for entry in result] == [3, 4]
+    assert backend.started == 2
+
+
+def test_rows_still_missing_after_the_retries_are_left_out():
+    backend = with_replies([item(3)], [item(3)], [item(3)])
+    result = asyncio.run(categorise_batch(LINES, [3, 4]))
+    assert [entry["row"] for entry in result] == [3]
+    assert backend.started == 3
+
+
+def test_a_batch_that_keeps_failing_falls_back_instead_of_raising():
+    backend = with_replies("not json", "still not json", {"rows": []})
+    assert asyncio.run(categorise_batch(LINES, [3, 4])) == []
+    assert backend.started == 3
+
+
+def test_gateway_errors_are_retried_at_batch_level():
+    replies = iter([asyncio.TimeoutError(), [item(3), item(4)]])
+
+    def respond(prompt):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    set_gateway(LLMGateway(FakeLLMBackend(respond), rate_per_second=1000, burst=1000, max_retries=0, timeout=5, total_timeout=5))
+    result = asyncio.run(categorise_batch(LINES, [3, 4]))
+    assert [entry["row"] for entry in result] == [3, 4]
+
+
+def test_failed_batches_leave_their_rows_to_the_default_category(ingest_db, llm, monkeypatch):
+    def respond(prompt):
+        if "Row " in prompt:
+            raise ValueError("provider rejected the request")
+        return llm.default_response(prompt)
+
+    llm.respond = respond
+    result = upload(ingest_db, "2024-01-05,COFFEE SHOP 123,-4.50\n")
+
+    assert result["inserted"] == 1
+    assert [doc["category"] for doc in ingest_db["transactions"].docs] == ["Others"]
+    # Nothing was learned from the failed batch
+    assert ingest_db["merchant_categories"].docs == []
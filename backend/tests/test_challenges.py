@@ -0,0 +1,112 @@
+import asyncio
+from datetime import date
+
+from app.services.challenges import ACTIVE, COMPLETED, FAILED, evaluate_challenges, prepare_challenges, settle
+from app.services.ingest import build_challenge_prompt
+from tests.test_ingest import COFFEE, upload
+
+USER = "user-1"
+TODAY = date(2024, 3, 10)
+
+
+def challenge(**fields) -> dict:
+    return {
+        "name": "Dine in more",
+        "category": "Dining",
+        "target_amount": 50,
+        "start_date": "2024-03-01",
+        "end_date": "2024-03-31",
+        "status": ACTIVE,
+        **fields,
+    }
+
+
+def test_spend_over_the_cap_fails_straight_away():
+    assert settle(challenge(), 50.01, TODAY) == FAILED
+
+
+def test_spend_within_the_cap_stays_active_until_the_window_ends():
+    assert settle(challenge(), 50.0, TODAY) == ACTIVE
+    assert settle(challenge(), 50.0, date(2024, 4, 1)) == COMPLETED
+
+
+def test_unusable_target_stays_active():
+    assert settle(challenge(target_amount="fifty"), 999, TODAY) == ACTIVE
+
+
+def spend(day: str, amount: float, category: str = "Dining") -> dict:
+    return {"user_id": USER, "transaction_date": day, "amount": amount, "category": category}
+
+
+def test_evaluation_sums_each_window_and_writes_the_results(db):
+    async def run():
+        await db["transactions"].insert_many([
+            spend("2024-03-02", -30.0),
+            spend("2024-03-05", -40.0, "dining"),
+            spend("2024-03-06", 15.0),                  # refund counts back
+            spend("2024-02-28", -500.0),                # before the window
+            spend("2024-03-03", -500.0, "Groceries"),   # other category
+            {**spend("2024-03-04", -500.0), "user_id": "user-2"},
+        ])
+        await db["challenges"].insert_many([
+            {**challenge(target_amount=60), "user_id": USER},
+            {**challenge(name="Groceries", category="groceries", target_amount=100), "user_id": USER},
+            {**challenge(name="Done", start_date="2024-02-01", end_date="2024-02-10"), "user_id": USER},
+        ])
+        return await evaluate_challenges(db, USER, TODAY)
+
+    counts = asyncio.run(run())
+    by_name = {doc["name"]: doc for doc in db["challenges"].docs}
+
+    assert counts == {COMPLETED: 1, FAILED: 1}
+    assert (by_name["Dine in more"]["spent"], by_name["Dine in more"]["status"]) == (55.0, ACTIVE)
+    assert (by_name["Groceries"]["spent"], by_name["Groceries"]["status"]) == (500.0, FAILED)
+    assert (by_name["Done"]["spent"], by_name["Done"]["status"]) == (0.0, COMPLETED)
+
+
+def test_settled_challenges_are_not_evaluated_again(db):
+    async def run():
+        await db["challenges"].insert_one({**challenge(status=FAILED), "user_id": USER})
+        return await evaluate_challenges(db, USER, TODAY)
+
+    assert asyncio.run(run()) == {COMPLETED: 0, FAILED: 0}
+    assert "spent" not in db["challenges"].docs[0]
+
+
+def test_generated_windows_in_the_past_are_dropped_and_early_starts_moved_to_today():
+    prepared = prepare_challenges([
+        challenge(name="Over", start_date="2024-02-01", end_date="2024-02-29"),
+        challenge(name="Started", start_date="2024-03-01", end_date="2024-03-31"),
+        challenge(name="Upcoming", start_date="2024-03-15", end_date="2024-04-14", category="groceries"),
+    ], TODAY)
+
+    assert [(item["name"], item["start_date"], item["category"]) for item in prepared] == [
+        ("Started", "2024-03-10", "Dining"),
+        ("Upcoming", "2024-03-15", "Groceries"),
+    ]
+
+
+def test_unusable_generated_challenges_are_dropped():
+    assert prepare_challenges([
+        challenge(category="Hobbies"),
+        challenge(category="Income"),
+        challenge(target_amount=0),
+        challenge(target_amount="a lot"),
+        challenge(start_date="next week"),
+        challenge(start_date="2024-03-20", end_date="2024-03-15"),
+    ], TODAY) == []
+
+
+def test_prompt_asks_for_a_spending_cap_starting_today():
+    prompt = build_challenge_prompt("{}", TODAY)
+    assert "Today is 2024-03-10" in prompt
+    assert "maximum amount the user may spend" in prompt
+
+
+def test_upload_stores_the_generated_challenges(ingest_db):
+    upload(ingest_db, COFFEE)
+    (stored,) = ingest_db["challenges"].docs
+
+    assert stored["user_id"] == USER
+    assert stored["start_date"] == date.today().isoformat()
+    assert stored["status"] == ACTIVE
@@ -0,0 +1,64 @@
+import numpy as np
+
+from app.services import classifier
+from app.services.classifier import TransactionClassifier, canonical_category, load_classifier
+
+TRAINING = [
+    ("STARBUCKS COFFEE", "Dining"), ("BLUE BOTTLE COFFEE", "Dining"), ("PIZZA HUT", "Dining"),
+    ("WHOLE FOODS MARKET", "Groceries"), ("TRADER JOES MARKET", "Groceries"), ("SAFEWAY GROCERY", "Groceries"),
+    ("UBER TRIP", "Travel & Transport"), ("LYFT RIDE", "Travel & Transport"), ("DELTA AIRLINES", "Travel & Transport"),
+    ("ACME PAYROLL", "Income"), ("SALARY DEPOSIT", "Income"), ("MYSTERY THING", "Not a category"),
+]
+
+
+def trained() -> TransactionClassifier:
+    texts, labels = zip(*TRAINING)
+    return TransactionClassifier(n_features=2 ** 12).fit(texts, labels)
+
+
+def test_predicts_the_category_of_similar_merchants():
+    categories, confidence = trained().predict(["PEETS COFFEE", "FOODS MARKET", "UBER EATS TRIP", "PAYROLL"])
+
+    assert categories == ["Dining", "Groceries", "Travel & Transport", "Income"]
+    assert confidence.shape == (4,)
+    assert ((confidence > 0) & (confidence <= 1)).all()
+
+
+def test_unknown_labels_train_as_others():
+    categories, _ = trained().predict(["MYSTERY THING"])
+    assert categories == ["Others"]
+
+
+def test_empty_input_predicts_nothing():
+    categories, confidence = trained().predict([])
+    assert categories == [] and confidence.shape == (0,)
+
+
+def test_saved_model_predicts_the_same(tmp_path):
+    model = trained()
+    path = str(tmp_path / "models" / "classifier.npz")
+    model.save(path)
+    loaded = TransactionClassifier.load(path)
+    texts = ["PEETS COFFEE", "FOODS MARKET", "RANDOM SHOP"]
+
+    assert (loaded.n_features, loaded.ngram_range, loaded.alpha) == (model.n_features, model.ngram_range, model.alpha)
+    expected, expected_confidence = model.predict(texts)
+    categories, confidence = loaded.predict(texts)
+    assert categories == expected
+    np.testing.assert_array_equal(confidence, expected_confidence)
+
+
+def test_load_classifier_installs_the_shared_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(classifier, "_classifier", None)
+    path = str(tmp_path / "classifier.npz")
+
+    assert load_classifier(path) is None and classifier.get_classifier() is None
+    trained().save(path)
+    assert load_classifier(path) is classifier.get_classifier()
+    assert classifier.get_classifier().predict(["PEETS COFFEE"])[0] == ["Dining"]
+
+
+def test_category_names_are_canonicalised():
+    assert canonical_category(" dining ") == "Dining"
+    assert canonical_category("Snacks") is None
+    assert canonical_category(None) is None
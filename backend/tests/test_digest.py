@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from app.services.digest import StatementTally, build_digest, estimate_tokens
+
+CATEGORIES = ["Dining", "Groceries", "Travel", "Bills"]
+
+
+def history(months: int = 24) -> list:
+    """Two years of daily spend across many merchants, plus a monthly salary."""
+    transactions = []
+    for month in range(months):
+        prefix = f"{2022 + month // 12}-{month % 12 + 1:02d}"
+        transactions += [
+            {"transaction_date": f"{prefix}-{day:02d}", "amount": -(day * 3 + month), "category": CATEGORIES[day % 4],
+             "type": "Debit", "merchant": f"MERCHANT NUMBER {day}"}
+            for day in range(1, 28)
+        ]
+        transactions.append({"transaction_date": f"{prefix}-28", "amount": 3000, "category": "Income", "type": "Credit", "merchant": "SALARY"})
+    return transactions
+
+
+@pytest.mark.parametrize("token_budget", [200, 400, 800])
+def test_digest_stays_within_the_token_budget(token_budget):
+    text = build_digest(history(), token_budget=token_budget)
+
+    assert estimate_tokens(text) <= token_budget
+    # Trimming drops detail, never the totals
+    digest = json.loads(text)
+    assert digest["period"]["transactions"] == 24 * 28
+    assert len(digest["categories"]) == 5
+
+
+def test_a_generous_budget_keeps_every_section():
+    digest = json.loads(build_digest(history(), token_budget=5000))
+
+    assert len(digest["monthly"]) == 12
+    assert len(digest["top_merchants"]) == 15
+
+
+def test_an_impossible_budget_gives_the_smallest_digest():
+    digest = json.loads(build_digest(history(), token_budget=10))
+
+    assert len(digest["monthly"]) == 1
+    assert digest["top_merchants"] == digest["anomalies"] == []
+
+
+@pytest.mark.parametrize("token_budget", [200, 400])
+def test_statement_tally_stays_within_the_token_budget(token_budget):
+    transactions = history()
+    tally = StatementTally()
+    tally.add(transactions[:300])
+    tally.add(transactions[300:])
+    text = tally.render(token_budget=token_budget)
+
+    assert estimate_tokens(text) <= token_budget
+    assert json.loads(text)["period"] == {"from": "2022-01-01", "to": "2023-12-28", "transactions": 24 * 28}
@@ -0,0 +1,116 @@
+import asyncio
+import io
+
+from app.services import ingest, statements
+from app.services.ingest import process_statement
+from app.services.statements import iter_statement, row_hashes
+
+USER = "user-1"
+
+HEADER = "Transaction Date,Description,Amount\n"
+COFFEE = "2024-01-05,COFFEE SHOP 123,-4.50\n"
+GROCER = "2024-01-06,GROCER MARKET,-52.10\n"
+SALARY = "2024-01-31,SALARY ACME,2500.00\n"
+
+
+def statement(*lines: str) -> io.BytesIO:
+    return io.BytesIO((HEADER + "".join(lines)).encode())
+
+
+def upload(db, *lines: str) -> dict:
+    return asyncio.run(process_statement(db, USER, statement(*lines)))
+
+
+def stored(db) -> list:
+    return db["transactions"].docs
+
+
+def test_repeated_identical_purchases_are_all_kept(ingest_db):
+    result = upload(ingest_db, COFFEE, COFFEE, GROCER)
+
+    assert result["inserted"] == 3
+    assert result["duplicates"] == 0
+    assert [doc["description"] for doc in stored(ingest_db)].count("COFFEE SHOP 123") == 2
+    assert len({doc["hash"] for doc in stored(ingest_db)}) == 3
+
+
+def test_reimporting_the_same_rows_adds_nothing(ingest_db):
+    upload(ingest_db, COFFEE, COFFEE, GROCER)
+    # Same rows in a different file (e.g. re-exported with a trailing newline)
+    result = upload(ingest_db, COFFEE, COFFEE, GROCER, "\n")
+
+    assert result["inserted"] == 0
+    assert result["duplicates"] == 3
+    assert len(stored(ingest_db)) == 3
+
+
+def test_a_third_identical_purchase_is_new(ingest_db):
+    upload(ingest_db, COFFEE, COFFEE)
+    result = upload(ingest_db, COFFEE, COFFEE, COFFEE)
+
+    assert result["inserted"] == 1
+    assert len(stored(ingest_db)) == 3
+
+
+def test_occurrences_carry_across_chunks(ingest_db, monkeypatch):
+    monkeypatch.setattr(statements.settings, "csv_chunk_size", 1)
+    result = upload(ingest_db, COFFEE, COFFEE, COFFEE)
+
+    assert result["inserted"] == 3
+    assert len({doc["hash"] for doc in stored(ingest_db)}) == 3
+
+
+def test_rows_stored_by_another_upload_are_reported_as_rejected(ingest_db, monkeypatch, capsys):
+    # A concurrent upload of the same row stores it after this one checked for seen rows
+    rows = next(iter_statement(statement(COFFEE)))
+    existing_hash = row_hashes(rows).iloc[0]
+    check = ingest.unseen_rows
+
+    async def unseen_then_raced(db, user_id, hashes):
+        unseen = await check(db, user_id, hashes)
+        await db["transactions"].insert_one({"user_id": USER, "hash": existing_hash, "description": "COFFEE SHOP 123"})
+        return unseen
+
+    monkeypatch.setattr(ingest, "unseen_rows", unseen_then_raced)
+    result = upload(ingest_db, COFFEE, GROCER)
+
+    assert result["inserted"] == 1
+    assert result["rejected"] == 1
+    assert result["rejected_rows"][0]["hash"] == existing_hash
+    assert result["rejected_rows"][0]["description"] == "COFFEE SHOP 123"
+    # One summary line per upload, not one per rejected row
+    logged = [line for line in capsys.readouterr().out.splitlines() if "rejected" in line]
+    assert len(logged) == 1 and "rejected 1 duplicate transactions" in logged[0]
+
+
+def test_stored_transactions_mark_their_rows_as_seen(ingest_db, llm):
+    upload(ingest_db, COFFEE, GROCER)
+    llm.prompts.clear()
+    result = upload(ingest_db, GROCER, COFFEE, "\n")
+
+    assert result["inserted"] == 0
+    assert result["duplicates"] == 2
+    assert not llm.categorisation_prompts
+    assert "statement_rows" not in ingest_db.collections
+
+
+def test_identical_file_is_answered_before_parsing(ingest_db, llm):
+    upload(ingest_db, COFFEE, GROCER)
+    prompts = len(llm.prompts)
+    result = upload(ingest_db, COFFEE, GROCER)
+
+    assert result["message"] == "This statement was already uploaded"
+    assert result["duplicates"] == 2
+    assert len(llm.prompts) == prompts
+    assert len(stored(ingest_db)) == 2
+
+
+def test_overlapping_file_only_sends_new_rows_to_the_llm(ingest_db, llm):
+    upload(ingest_db, COFFEE, GROCER)
+    llm.prompts.clear()
+    result = upload(ingest_db, COFFEE, GROCER, SALARY)
+
+    assert result["inserted"] == 1
+    assert result["duplicates"] == 2
+    row_lines = [line for prompt in llm.categorisation_prompts for line in prompt.splitlines() if "Row " in line]
+    assert len(row_lines) == 1 and "SALARY ACME" in row_lines[0]
@@ -0,0 +1,78 @@
+import asyncio
+
+from app.services.insights_cache import InsightsCache, transactions_fingerprint
+
+USER = "user-1"
+
+
+def fingerprint(db, query=None) -> str:
+    return asyncio.run(transactions_fingerprint(db, query or {"user_id": USER}))
+
+
+def add_transaction(db, day: str):
+    asyncio.run(db["transactions"].insert_one({"user_id": USER, "transaction_date": day, "amount": -5.0}))
+
+
+def test_fingerprint_changes_when_transactions_are_added(db):
+    assert fingerprint(db) == "0:"
+    add_transaction(db, "2024-01-05")
+    first = fingerprint(db)
+    add_transaction(db, "2024-01-06")
+
+    assert first.startswith("1:")
+    assert fingerprint(db).startswith("2:")
+    assert fingerprint(db) != first
+
+
+def test_fingerprint_only_covers_the_query(db):
+    add_transaction(db, "2024-01-05")
+    january = fingerprint(db, {"user_id": USER, "transaction_date": {"$lte": "2024-01-31"}})
+    add_transaction(db, "2024-02-05")
+
+    assert fingerprint(db, {"user_id": USER, "transaction_date": {"$lte": "2024-01-31"}}) == january
+
+
+def test_entries_are_fresh_until_the_fingerprint_changes():
+    cache = InsightsCache()
+    cache.set(USER, None, None, "1:a", {"message": "ok"})
+
+    assert cache.get(USER, None, None, "1:a") == ({"message": "ok"}, True)
+    assert cache.get(USER, None, None, "2:b") == ({"message": "ok"}, False)
+
+
+def test_an_upload_makes_the_users_entries_stale():
+    cache = InsightsCache()
+    cache.set(USER, None, None, "1:a", {"message": "ok"})
+    cache.set("user-2", None, None, "1:a", {"message": "other"})
+    cache.invalidate_user(USER)
+
+    assert cache.get(USER, None, None, "1:a") == ({"message": "ok"}, False)
+    assert cache.get("user-2", None, None, "1:a") == ({"message": "other"}, True)
+    # Stored after the upload, the entry is fresh again
+    cache.set(USER, None, None, "1:a", {"message": "new"})
+    assert cache.get(USER, None, None, "1:a") == ({"message": "new"}, True)
+
+
+def test_one_background_refresh_per_entry():
+    cache = InsightsCache()
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def refresh():
+            calls.append(1)
+            await release.wait()
+
+        cache.refresh_in_background(USER, None, None, refresh)
+        cache.refresh_in_background(USER, None, None, refresh)
+        await asyncio.sleep(0)
+        running = (len(cache.tasks), set(cache.refreshing))
+        release.set()
+        await asyncio.sleep(0.01)
+        return running
+
+    running = asyncio.run(run())
+    assert calls == [1]
+    assert running == (1, {(USER, None, None)})
+    assert not cache.tasks and not cache.refreshing
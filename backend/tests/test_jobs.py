@@ -0,0 +1,150 @@
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import jobs
+from app.services.jobs import FAILED, JOB_COLLECTION, QUEUED, RUNNING, SUCCEEDED, UploadJobQueue
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Records every statement the jobs process instead of running the pipeline."""
+    runs = []
+
+    async def process_statement(db, user_id, source, progress):
+        runs.append(source.read())
+        await asyncio.sleep(0.01)
+        return {"inserted": 1}
+
+    monkeypatch.setattr(jobs, "process_statement", process_statement)
+    return runs
+
+
+def make_queue(db, spool_dir, host="host-a", lease_seconds=60.0) -> UploadJobQueue:
+    queue = UploadJobQueue(workers=1, spool_dir=str(spool_dir), lease_seconds=lease_seconds, host=host)
+    queue.db = db
+    queue.queue = asyncio.Queue()
+    return queue
+
+
+def job(db, job_id):
+    return next(doc for doc in db[JOB_COLLECTION].docs if doc["job_id"] == job_id)
+
+
+def test_a_job_is_run_by_one_worker_only(db, tmp_path, processed):
+    async def run():
+        first, second = make_queue(db, tmp_path), make_queue(db, tmp_path)
+        job_id = await first.submit("user-1", "statement.csv", io.BytesIO(b"data"))
+        await asyncio.gather(first._run(job_id), second._run(job_id))
+        return job_id
+
+    job_id = asyncio.run(run())
+    assert processed == [b"data"]
+    assert job(db, job_id)["status"] == SUCCEEDED
+    assert not list(tmp_path.iterdir())
+
+
+def test_running_jobs_with_a_live_lease_are_left_alone(db, tmp_path, processed):
+    async def run():
+        queue = make_queue(db, tmp_path)
+        job_id = await queue.submit("user-1", "statement.csv", io.BytesIO(b"data"))
+        await db[JOB_COLLECTION].update_one({"job_id": job_id}, {"$set": {
+            "status": RUNNING, "worker": "elsewhere", "lease_expires_at": datetime.utcnow() + timedelta(minutes=1)
+        }})
+        return job_id, await make_queue(db, tmp_path)._recover_expired()
+
+    job_id, recovered = asyncio.run(run())
+    assert recovered == 0
+    assert job(db, job_id)["status"] == RUNNING
+
+
+def test_jobs_with_a_lapsed_lease_are_recovered_once(db, tmp_path, processed):
+    async def run():
+        queue = make_queue(db, tmp_path)
+        job_id = await queue.submit("user-1", "statement.csv", io.BytesIO(b"data"))
+        await queue.queue.get()
+        await db[JOB_COLLECTION].update_one({"job_id": job_id}, {"$set": {
+            "status": RUNNING, "worker": "dead", "lease_expires_at": datetime.utcnow() - timedelta(seconds=1)
+        }})
+        first, second = make_queue(db, tmp_path), make_queue(db, tmp_path)
+        recovered = [await first._recover_expired(), await second._recover_expired()]
+        await first._run(await first.queue.get())
+        return job_id, recovered
+
+    job_id, recovered = asyncio.run(run())
+    assert recovered == [1, 0]
+    assert job(db, job_id)["status"] == SUCCEEDED
+    assert processed == [b"data"]
+
+
+def test_other_hosts_jobs_are_not_recovered(db, tmp_path, processed):
+    async def run():
+        await db[JOB_COLLECTION].insert_one({
+            "job_id": "remote", "status": RUNNING, "host": "host-b", "spool_path": "elsewhere.csv",
+            "lease_expires_at": datetime.utcnow() - timedelta(seconds=1),
+        })
+        return await make_queue(db, tmp_path, host="host-a")._recover_expired()
+
+    assert asyncio.run(run()) == 0
+    assert job(db, "remote")["status"] == RUNNING
+
+
+def test_queued_job_whose_file_is_gone_fails(db, tmp_path, processed):
+    async def run():
+        await db[JOB_COLLECTION].insert_one({
+            "job_id": "lost", "status": QUEUED, "host": "host-a", "spool_path": str(tmp_path / "lost.csv"),
+            "created_at": datetime.utcnow(),
+        })
+        queue = make_queue(db, tmp_path)
+        task = asyncio.ensure_future(queue._requeue())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert job(db, "lost")["status"] == FAILED
+
+
+def test_heartbeat_keeps_a_long_job_claimed(db, tmp_path, monkeypatch):
+    async def slow(db, user_id, source, progress):
+        await asyncio.sleep(0.5)
+        return {}
+
+    monkeypatch.setattr(jobs, "process_statement", slow)
+
+    async def run():
+        queue = make_queue(db, tmp_path, lease_seconds=0.2)
+        job_id = await queue.submit("user-1", "statement.csv", io.BytesIO(b"data"))
+        running = asyncio.ensure_future(queue._run(job_id))
+        await asyncio.sleep(0.35)
+        recovered = await make_queue(db, tmp_path)._recover_expired()
+        await running
+        return job_id, recovered
+
+    job_id, recovered = asyncio.run(run())
+    assert recovered == 0
+    assert job(db, job_id)["status"] == SUCCEEDED
+
+
+def test_recovery_keeps_running_after_an_error(db, tmp_path, monkeypatch, processed):
+    queue = make_queue(db, tmp_path, lease_seconds=0.01)
+    sweeps = []
+
+    async def recover_expired():
+        sweeps.append(len(sweeps))
+        if len(sweeps) == 1:
+            raise ConnectionError("primary stepped down")
+        return 0
+
+    monkeypatch.setattr(queue, "_recover_expired", recover_expired)
+
+    async def run():
+        task = asyncio.ensure_future(queue._requeue())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert len(sweeps) > 1
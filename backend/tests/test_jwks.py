@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.dependencies import JWKSCache
+from tests.fakes import FakeJWKS, jwk
+
+
+def make_cache(keys, **options):
+    endpoint = FakeJWKS(keys)
+    options = {"ttl": 3600, "min_refresh_interval": 30, **options}
+    return endpoint, JWKSCache("https://example.auth0.com/.well-known/jwks.json", fetch=endpoint, **options)
+
+
+def test_keys_are_fetched_once_and_served_from_cache():
+    endpoint, cache = make_cache([jwk("a")])
+
+    async def run():
+        return [await cache.get_key("a") for _ in range(3)]
+
+    keys = asyncio.run(run())
+    assert all(key["kid"] == "a" for key in keys)
+    assert endpoint.fetches == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_unknown_kid_forces_a_refresh_after_rotation():
+    endpoint, cache = make_cache([jwk("old")], min_refresh_interval=0)
+
+    async def run():
+        await cache.get_key("old")
+        # Auth0 rotates its signing key; tokens now carry the new kid
+        endpoint.keys = [jwk("new")]
+        return await cache.get_key("new")
+
+    key = asyncio.run(run())
+    assert key["kid"] == "new"
+    assert endpoint.fetches == 2
+
+
+def test_first_forced_refresh_is_not_rate_limited():
+    # fetched_at starts at -inf, so even right after boot the forced refresh goes through
+    endpoint, cache = make_cache([jwk("a")], min_refresh_interval=10 ** 9)
+
+    assert asyncio.run(cache.get_key("a"))["kid"] == "a"
+    asyncio.run(cache.refresh(force=True))
+    assert endpoint.fetches == 1
+
+
+def test_forced_refreshes_are_rate_limited():
+    endpoint, cache = make_cache([jwk("a")], min_refresh_interval=60)
+
+    async def run():
+        await cache.get_key("a")
+        return [await cache.get_key(f"bogus-{i}") for i in range(5)]
+
+    assert asyncio.run(run()) == [None] * 5
+    # The first fetch loaded the keys; bogus kids within the interval don't trigger more
+    assert endpoint.fetches == 1
+
+
+def test_cached_keys_are_served_when_a_refresh_fails():
+    endpoint, cache = make_cache([jwk("a")], ttl=0, min_refresh_interval=0)
+
+    async def run():
+        await cache.get_key("a")
+        endpoint.fail = True
+        return await cache.get_key("a")
+
+    assert asyncio.run(run())["kid"] == "a"
+    assert endpoint.fetches >= 2
+
+
+def test_failure_without_cached_keys_is_raised():
+    endpoint, cache = make_cache([jwk("a")])
+    endpoint.fail = True
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get_key("a"))
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from app.llm import LLMGateway
+from tests.fakes import FakeLLMBackend
+
+
+def make_gateway(respond, **options):
+    backend = FakeLLMBackend(respond)
+    options = {"rate_per_second": 1000, "burst": 1000, "backoff_base": 0, "timeout": 5, "total_timeout": 5, **options}
+    return backend, LLMGateway(backend, **options)
+
+
+def slow_reply(release: asyncio.Event, reply: str = "ok"):
+    async def respond(prompt):
+        await release.wait()
+        return reply
+    return respond
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    async def run():
+        release = asyncio.Event()
+        backend, gateway = make_gateway(lambda prompt: slow_reply(release)(prompt))
+        callers = [asyncio.ensure_future(gateway.generate("same prompt")) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        return backend, gateway, await asyncio.gather(*callers)
+
+    backend, gateway, results = asyncio.run(run())
+    assert results == ["ok"] * 5
+    assert backend.started == 1
+    assert gateway.coalesced == 4
+    assert gateway.stats()["inflight"] == 0
+
+
+def test_different_prompts_are_not_coalesced():
+    async def run():
+        backend, gateway = make_gateway(lambda prompt: prompt.upper())
+        return backend, await asyncio.gather(gateway.generate("a"), gateway.generate("b"))
+
+    backend, results = asyncio.run(run())
+    assert results == ["A", "B"]
+    assert backend.started == 2
+
+
+def test_transient_errors_are_retried():
+    class Unavailable(Exception):
+        code = 503
+
+    replies = iter([Unavailable(), Unavailable(), "ok"])
+
+    def respond(prompt):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    async def run():
+        backend, gateway = make_gateway(respond)
+        return gateway, await gateway.generate("prompt")
+
+    gateway, result = asyncio.run(run())
+    assert result == "ok"
+    assert gateway.retries == 2
+
+
+def test_other_errors_are_not_retried():
+    def respond(prompt):
+        raise ValueError("bad request")
+
+    async def run():
+        backend, gateway = make_gateway(respond)
+        with pytest.raises(ValueError):
+            await gateway.generate("prompt")
+        return backend
+
+    assert asyncio.run(run()).started == 1
+
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    async def run():
+        release = asyncio.Event()
+        backend, gateway = make_gateway(lambda prompt: slow_reply(release)(prompt))
+        first = asyncio.ensure_future(gateway.generate("prompt"))
+        second = asyncio.ensure_future(gateway.generate("prompt"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        return backend, gateway, first, await second
+
+    backend, gateway, first, result = asyncio.run(run())
+    assert first.cancelled()
+    assert result == "ok"
+    assert backend.cancelled == 0
+    assert gateway.abandoned == 0
+
+
+def test_call_is_cancelled_when_its_last_waiter_leaves():
+    async def run():
+        release = asyncio.Event()
+        backend, gateway = make_gateway(lambda prompt: slow_reply(release)(prompt))
+        callers = [asyncio.ensure_future(gateway.generate("prompt")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return backend, gateway
+
+    backend, gateway = asyncio.run(run())
+    assert backend.cancelled == 1
+    assert gateway.abandoned == 1
+    assert gateway.stats()["inflight"] == 0
+
+
+def test_a_new_call_after_abandonment_starts_fresh():
+    async def run():
+        release = asyncio.Event()
+        backend, gateway = make_gateway(lambda prompt: slow_reply(release)(prompt))
+        abandoned = asyncio.ensure_future(gateway.generate("prompt"))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        await asyncio.gather(abandoned, return_exceptions=True)
+        release.set()
+        return backend, await gateway.generate("prompt")
+
+    backend, result = asyncio.run(run())
+    assert result == "ok"
+    assert backend.started == 2
+
+
+def test_total_timeout_bounds_retries():
+    async def run():
+        async def never(prompt):
+            await asyncio.sleep(10)
+
+        backend, gateway = make_gateway(never, timeout=0.05, total_timeout=0.12, max_retries=10)
+        with pytest.raises(asyncio.TimeoutError):
+            await gateway.generate("prompt")
+        return backend, gateway
+
+    backend, gateway = asyncio.run(run())
+    # Each attempt times out after 0.05s and is retried, until the whole call runs out of time
+    assert 2 <= backend.started < 10
+    assert gateway.stats()["inflight"] == 0
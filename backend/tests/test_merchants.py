@@ -0,0 +1,49 @@
+import asyncio
+import io
+
+from app.services.classifier import canonical_category
+from app.services.ingest import process_statement
+from app.services.merchants import merchant_cache
+
+USER = "user-1"
+
+COFFEE = "2024-01-05,COFFEE SHOP 123,-4.50\n"
+GROCER = "2024-01-06,GROCER MARKET,-52.10\n"
+SALARY = "2024-01-31,SALARY ACME,2500.00\n"
+
+
+def upload(db, *lines: str) -> dict:
+    source = io.BytesIO(("Transaction Date,Description,Amount\n" + "".join(lines)).encode())
+    return asyncio.run(process_statement(db, USER, source))
+
+
+def stored(db) -> list:
+    return db["transactions"].docs
+
+
+def test_canonical_category():
+    assert canonical_category("dining ") == "Dining"
+    assert canonical_category("HEALTH & WELLNESS") == "Health & Wellness"
+    assert canonical_category("Restaurants") is None
+    assert canonical_category(None) is None
+
+
+def test_merchant_cache_only_stores_known_categories(db):
+    merchant_cache.lru.clear()
+    asyncio.run(merchant_cache.store(db, {"COFFEE SHOP": "dining", "MYSTERY": "Hobbies"}))
+
+    assert {doc["merchant"]: doc["category"] for doc in db["merchant_categories"].docs} == {"COFFEE SHOP": "Dining"}
+    merchant_cache.lru.clear()
+    assert asyncio.run(merchant_cache.lookup(db, ["COFFEE SHOP", "MYSTERY"])) == {"COFFEE SHOP": "Dining"}
+    merchant_cache.lru.clear()
+
+
+def test_rows_are_categorised_by_the_llm_and_cached_by_merchant(ingest_db, llm):
+    upload(ingest_db, COFFEE, GROCER, SALARY)
+    categories = {doc["description"]: doc["category"] for doc in stored(ingest_db)}
+    assert categories == {"COFFEE SHOP 123": "Dining", "GROCER MARKET": "Groceries", "SALARY ACME": "Income"}
+
+    llm.prompts.clear()
+    result = upload(ingest_db, "2024-02-05,COFFEE SHOP 123,-3.75\n")
+    assert result["merchant_cache"]["hits"] == 1
+    assert llm.categorisation_prompts == []
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.services import pages
+from app.services.pages import PAGE_COLLECTION, fetch_page, record_page
+
+PROVIDER = "Bank A"
+OFFER = "<html><body><h1>Dining Card</h1><p>5% on dining</p>{extra}</body></html>"
+
+
+class ProviderSite:
+    """A local stand-in for a provider's page: serves `body` with an ETag and
+    answers 304 to a matching If-None-Match when `honours_etag` is set."""
+
+    def __init__(self):
+        self.body = OFFER.format(extra="")
+        self.etag = '"v1"'
+        self.honours_etag = True
+        self.requests = []
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append(dict(self.headers))
+                if site.honours_etag and self.headers.get("If-None-Match") == site.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = site.body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", site.etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def site():
+    site = ProviderSite()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), site.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.url = f"http://127.0.0.1:{server.server_address[1]}/cards"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(db, site, record=False, **options):
+    async def run():
+        pages.set_http_client(httpx.AsyncClient(trust_env=False))
+        try:
+            page = await fetch_page(db, PROVIDER, site.url, **options)
+            if record and page.changed:
+                await record_page(db, page)
+            return page
+        finally:
+            await pages.close_http_client()
+    return asyncio.run(run())
+
+
+def stored(db):
+    return asyncio.run(db[PAGE_COLLECTION].find_one({"provider": PROVIDER}))
+
+
+def test_first_fetch_is_a_change(db, site):
+    page = fetch(db, site, record=True)
+
+    assert page.changed and page.status_code == 200
+    assert page.text == "Dining Card 5% on dining"
+    assert stored(db)["etag"] == '"v1"'
+    assert "If-None-Match" not in site.requests[0]
+
+
+def test_not_modified_page_is_skipped(db, site):
+    fetch(db, site, record=True)
+    changed_at = stored(db)["changed_at"]
+    page = fetch(db, site)
+
+    assert site.requests[-1]["If-None-Match"] == '"v1"'
+    assert not page.changed and page.status_code == 304
+    assert page.content_hash == stored(db)["content_hash"]
+    assert stored(db)["changed_at"] == changed_at
+    assert stored(db)["checked_at"] >= changed_at
+
+
+def test_unchanged_text_is_skipped_when_the_server_ignores_validators(db, site):
+    fetch(db, site, record=True)
+    first_hash = stored(db)["content_hash"]
+    # New markup and ETag, same visible offer
+    site.honours_etag = False
+    site.body = OFFER.format(extra="<script>var t = 123;</script>")
+    site.etag = '"v2"'
+    page = fetch(db, site)
+
+    assert page.status_code == 200 and not page.changed
+    assert page.content_hash == first_hash
+    # The new validators are kept so the next check can be conditional
+    assert stored(db)["etag"] == '"v2"'
+
+
+def test_changed_text_is_reported(db, site):
+    fetch(db, site, record=True)
+    site.body = OFFER.format(extra="<p>Now 6% on travel</p>")
+    site.etag = '"v2"'
+    page = fetch(db, site)
+
+    assert page.changed
+    assert page.content_hash != stored(db)["content_hash"]
+
+
+def test_forced_fetch_is_unconditional(db, site):
+    fetch(db, site, record=True)
+    page = fetch(db, site, force=True)
+
+    assert "If-None-Match" not in site.requests[-1]
+    assert page.changed and page.status_code == 200
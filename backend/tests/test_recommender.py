@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.routers import recommender
+from app.services.cards import describe_card, parse_card, reward_matrix
+from app.services.recommendations_cache import profile_fingerprint, recommendation_cache
+
+CARDS = [
+    {"name": "Dining Card", "provider": "Bank A", "cashback": {"dining": "5%"}, "annual_fee": "$0"},
+    {"name": "Grocery Card", "provider": "Bank B", "cashback": {"groceries": "3%"}, "annual_fee": "$0"},
+    {"name": "Premium Card", "provider": "Bank C", "cashback": {"everything else": "2%"}, "annual_fee": "$550"},
+]
+PROFILES = {
+    "user-1": {"Dining": 1000.0, "Groceries": 500.0},
+    "user-2": {"Dining": 990.0, "Groceries": 505.0},
+}
+
+
+@pytest.fixture
+def llm_prompts(monkeypatch):
+    cards = [{**card, "rewards": parse_card(card)} for card in CARDS]
+    catalog = SimpleNamespace(
+        version=1, cards=cards, matrix=reward_matrix(cards), prompt_lines=[describe_card(card) for card in cards]
+    )
+    prompts = []
+
+    class Gateway:
+        async def generate_json(self, prompt):
+            prompts.append(prompt)
+            return {"reasons": [{"card_name": "Dining Card", "reason": "Strong on dining."}]}
+
+    async def get_transaction_info(user_id, request):
+        return {"categories": [
+            {"category": category, "annual_spend": amount} for category, amount in PROFILES[user_id].items()
+        ]}
+
+    monkeypatch.setattr(recommender, "card_catalog", SimpleNamespace(snapshot=catalog))
+    monkeypatch.setattr(recommender, "get_gateway", lambda: Gateway())
+    monkeypatch.setattr(recommender, "get_transaction_info", get_transaction_info)
+    recommendation_cache.clear()
+    yield prompts
+    recommendation_cache.clear()
+
+
+def suggest(user_id: str) -> dict:
+    return asyncio.run(recommender.suggest_credit_cards(None, {"sub": user_id}))
+
+
+def test_users_in_one_bucket_share_reasons_but_not_figures(llm_prompts):
+    assert profile_fingerprint(PROFILES["user-1"]) == profile_fingerprint(PROFILES["user-2"])
+
+    first = suggest("user-1")["suggestions"]
+    second = suggest("user-2")["suggestions"]
+
+    assert len(llm_prompts) == 1
+    assert [item["reason"] for item in first][0] == [item["reason"] for item in second][0] == "Strong on dining."
+    assert [item["estimated_annual_reward"] for item in first[:2]] == [50.0, 15.0]
+    assert [item["estimated_annual_reward"] for item in second[:2]] == [49.5, 15.15]
+    # Templated fallback reasons quote each user's own figures
+    assert "$15.15" in second[1]["reason"]
+
+
+def test_reasons_prompt_carries_no_dollar_amounts_from_the_profile(llm_prompts):
+    suggest("user-1")
+    assert "1000" not in llm_prompts[0]
+    assert "50.00" not in llm_prompts[0]
@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+from app.services.statements import file_hash, iter_statement, settings
+
+ADJUSTMENT = settings.statement_amount_adjustment
+
+
+def statement(text: str) -> io.BytesIO:
+    return io.BytesIO(text.encode())
+
+
+def test_rows_are_numbered_across_chunks():
+    source = statement("Date,Description,Amount\n" + "".join(f"2024-01-{day:02d},SHOP {day},-{day}.00\n" for day in range(1, 8)))
+    chunks = list(iter_statement(source, chunk_size=3))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert [row for chunk in chunks for row in chunk["row"]] == list(range(7))
+    assert list(chunks[0].columns) == ["row", "date", "description", "amount"]
+
+
+def test_headers_are_matched_case_insensitively_and_extra_columns_ignored():
+    source = statement("posted date,Memo,MERCHANT,Transaction Amount\n2024-01-05,ignored, Coffee Shop ,-4.50\n")
+    (chunk,) = iter_statement(source)
+
+    assert chunk.loc[0, "description"] == "Coffee Shop"
+    assert chunk.loc[0, "amount"] == round(-4.50 + ADJUSTMENT, 2)
+
+
+def test_messy_amounts_are_cleaned_and_unparseable_rows_dropped():
+    source = statement('Date,Description,Amount\n2024-01-05,A,"$1,200.00"\n2024-01-06,B,(12.50)\n2024-01-07,C,n/a\n')
+    (chunk,) = iter_statement(source)
+
+    assert chunk["description"].tolist() == ["A", "B"]
+    assert chunk["amount"].tolist() == [round(1200 + ADJUSTMENT, 2), round(-12.5 + ADJUSTMENT, 2)]
+
+
+def test_missing_column_is_reported():
+    with pytest.raises(ValueError, match="amount"):
+        list(iter_statement(statement("Date,Description\n2024-01-05,A\n")))
+
+
+def test_file_hash_leaves_the_file_at_the_start():
+    source = statement("Date,Description,Amount\n2024-01-05,A,-1\n")
+    assert file_hash(source) == file_hash(statement("Date,Description,Amount\n2024-01-05,A,-1\n"))
+    assert source.read().startswith(b"Date")
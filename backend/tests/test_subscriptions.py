@@ -0,0 +1,27 @@
+from datetime import date
+
+from app.services.subscriptions import detect_subscription, is_active, with_status
+
+
+def charge(day: str, amount: float = -9.99) -> dict:
+    return {"transaction_date": day, "amount": amount, "description": "STREAMING CO", "category": "Entertainment"}
+
+
+def test_monthly_subscription_is_detected():
+    subscription = detect_subscription("STREAMING CO", [charge("2024-01-05"), charge("2024-02-05"), charge("2024-03-06")])
+    assert subscription["cadence"] == "monthly"
+    assert subscription["amount"] == 9.99
+    assert "active" not in subscription
+
+
+def test_same_day_duplicate_charges_are_counted_once():
+    charges = [charge("2024-01-05"), charge("2024-01-05"), charge("2024-02-05"), charge("2024-03-05")]
+    assert detect_subscription("STREAMING CO", charges)["occurrences"] == 3
+
+
+def test_activity_is_derived_from_today():
+    subscription = detect_subscription("STREAMING CO", [charge("2024-01-05"), charge("2024-02-05"), charge("2024-03-06")])
+
+    assert is_active(subscription, date(2024, 4, 10))
+    assert not is_active(subscription, date(2024, 6, 1))
+    assert [item["active"] for item in with_status([subscription], date(2024, 6, 1))] == [False]
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers.analysis import get_summary
+from app.services.rollups import ROLLUP_COLLECTION
+from app.services.summary import _month_aligned, build_summary
+from tests.fakes import FakeCursor
+
+USER = "user-1"
+FACETS = {
+    "categories": [{"_id": "Groceries", "total": -30.0, "count": 2}],
+    "periods": [{"_id": datetime(2024, 1, 1), "total": 70.0}],
+    "types": [{"_id": "Credit", "total": 100.0, "count": 1}, {"_id": "Debit", "total": -30.0, "count": 2}],
+}
+
+
+class RecordingDB:
+    """Records which collection each aggregation runs on, answering with fixed facets."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getitem__(self, name):
+        return SimpleNamespace(aggregate=lambda pipeline: self.record(name, pipeline))
+
+    def record(self, name, pipeline):
+        self.calls.append((name, pipeline))
+        return FakeCursor([FACETS])
+
+
+def summarise(granularity, start_date=None, end_date=None):
+    db = RecordingDB()
+    summary = asyncio.run(build_summary(db, USER, start_date, end_date, granularity))
+    (collection, pipeline), = db.calls
+    return collection, pipeline, summary
+
+
+@pytest.mark.parametrize("start_date, end_date, aligned", [
+    (None, None, True),
+    (date(2024, 1, 1), date(2024, 2, 29), True),
+    (date(2024, 1, 2), None, False),
+    (None, date(2024, 2, 28), False),
+])
+def test_month_alignment(start_date, end_date, aligned):
+    assert _month_aligned(start_date, end_date) is aligned
+
+
+@pytest.mark.parametrize("granularity", ["month", "year"])
+def test_whole_months_read_the_rollups(granularity):
+    collection, pipeline, _ = summarise(granularity, date(2024, 1, 1), date(2024, 3, 31))
+
+    assert collection == ROLLUP_COLLECTION
+    assert pipeline[0]["$match"]["month_start"] == {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 3, 1)}
+    assert pipeline[-1]["$facet"]["periods"][0]["$group"]["_id"] == {"$dateTrunc": {"date": "$month_start", "unit": granularity}}
+
+
+@pytest.mark.parametrize("granularity, start_date, end_date", [
+    ("day", None, None),
+    ("week", date(2024, 1, 1), date(2024, 1, 31)),
+    ("month", date(2024, 1, 15), None),
+])
+def test_finer_or_partial_ranges_read_transactions(granularity, start_date, end_date):
+    collection, pipeline, _ = summarise(granularity, start_date, end_date)
+
+    assert collection == "transactions"
+    assert "$dateFromString" in pipeline[1]["$addFields"]["date"]
+    if start_date:
+        assert pipeline[0]["$match"]["transaction_date"]["$gte"] == start_date.isoformat()
+    if granularity == "week":
+        assert pipeline[-1]["$facet"]["periods"][0]["$group"]["_id"]["$dateTrunc"]["startOfWeek"] == "monday"
+
+
+def test_facets_are_shaped_for_the_dashboard():
+    _, _, summary = summarise("month")
+
+    assert summary["periods"] == [{"period": "2024-01-01", "total": 70.0}]
+    assert summary["income_vs_spend"] == {"income": 100.0, "spend": 30.0, "net": 70.0, "income_count": 1, "spend_count": 2}
+
+
+def test_unknown_granularity_is_rejected():
+    request = SimpleNamespace(app=SimpleNamespace(mongodb=RecordingDB()))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_summary(request, granularity="quarter", current_user={"sub": USER}))
+
+    assert error.value.status_code == 400
+    assert request.app.mongodb.calls == []
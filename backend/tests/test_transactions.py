@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.routers import transactions
+from app.routers.transactions import decode_cursor, encode_cursor, get_transactions
+
+USER = {"sub": "user-1"}
+
+
+def add_transactions(db, days):
+    docs = [
+        {"user_id": USER["sub"], "transaction_date": day, "description": f"SHOP {i}", "category": "Groceries",
+         "amount": -float(i + 1), "type": "Debit", "hash": f"h{i}"}
+        for i, day in enumerate(days)
+    ]
+    asyncio.run(db["transactions"].insert_many(docs))
+
+
+def list_page(db, **params):
+    request = SimpleNamespace(app=SimpleNamespace(mongodb=db))
+    return asyncio.run(get_transactions(request, current_user=USER, **params))
+
+
+def all_pages(db, **params):
+    pages, cursor = [], None
+    while True:
+        page = list_page(db, cursor=cursor, **params)
+        pages.append([(t.transaction_date, t.description) for t in page.transactions])
+        cursor = page.next_cursor
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    object_id = ObjectId()
+    cursor = encode_cursor({"transaction_date": "2024-01-05", "_id": object_id})
+
+    assert decode_cursor(cursor) == ("2024-01-05", object_id)
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", encode_cursor({"transaction_date": "2024-01-05", "_id": "x"})])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_pages_cover_every_transaction_once_newest_first(db):
+    # Several transactions share a date, so pages must break ties on _id
+    add_transactions(db, ["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-04"])
+    pages = all_pages(db, limit=3)
+    rows = [row for page in pages for row in page]
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert len(set(rows)) == 7
+    assert [day for day, _ in rows] == sorted((day for day, _ in rows), reverse=True)
+
+
+def test_a_full_last_page_has_no_cursor(db):
+    add_transactions(db, ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"])
+
+    assert [len(page) for page in all_pages(db, limit=2)] == [2, 2]
+    assert list_page(db, limit=10).next_cursor is None
+
+
+def test_pages_respect_the_date_range(db):
+    add_transactions(db, ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"])
+    pages = all_pages(db, limit=2, start_date="2024-01-02", end_date="2024-01-04")
+
+    assert [day for page in pages for day, _ in page] == ["2024-01-04", "2024-01-03", "2024-01-02"]
+
+
+def test_page_size_is_capped(db, monkeypatch):
+    monkeypatch.setattr(transactions.settings, "transactions_page_max", 2)
+    add_transactions(db, ["2024-01-01", "2024-01-02", "2024-01-03"])
+
+    assert len(list_page(db, limit=100).transactions) == 2
+    assert len(list_page(db, limit=0).transactions) == 1
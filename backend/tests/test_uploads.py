@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from app.indexes import ensure_indexes
+from app.services.statements import settings
+from app.services.uploads import rehash_legacy_transactions
+from tests.test_ingest import COFFEE, GROCER, USER, stored, upload
+
+ADJUSTMENT = settings.statement_amount_adjustment
+
+
+def legacy(day: str, description: str, amount: float) -> dict:
+    amount = round(amount + ADJUSTMENT, 2)
+    kind = "Credit" if amount > 0 else "Debit"
+    return {
+        "_id": ObjectId(),
+        "user_id": USER,
+        "transaction_date": day,
+        "description": description,
+        "amount": amount,
+        "type": kind,
+        "category": "Others",
+        "hash": hashlib.md5(f"{day}{amount}{kind}".encode()).hexdigest(),
+    }
+
+
+def rehash(db) -> dict:
+    return asyncio.run(rehash_legacy_transactions(db))
+
+
+def test_rehashed_legacy_rows_are_recognised_on_reupload(ingest_db):
+    ingest_db["transactions"].docs.extend([
+        legacy("2024-01-05", "COFFEE SHOP 123", -4.50),
+        legacy("2024-01-06", "GROCER  MARKET", -52.10),
+    ])
+
+    assert rehash(ingest_db) == {USER: {"rehashed": 2, "removed": 0}}
+    result = upload(ingest_db, COFFEE, GROCER)
+
+    assert result["inserted"] == 0
+    assert result["duplicates"] == 2
+    assert len(stored(ingest_db)) == 2
+
+
+def test_repeated_legacy_purchases_keep_distinct_hashes(ingest_db):
+    # The md5 over date, amount and type repeats for identical purchases
+    ingest_db["transactions"].docs.extend([legacy("2024-01-05", "COFFEE SHOP 123", -4.50) for _ in range(2)])
+    rehash(ingest_db)
+
+    assert len({doc["hash"] for doc in stored(ingest_db)}) == 2
+    assert upload(ingest_db, COFFEE, COFFEE, COFFEE)["inserted"] == 1
+
+
+def test_legacy_rows_uploaded_again_since_are_removed(ingest_db):
+    upload(ingest_db, COFFEE)
+    ingest_db["transactions"].docs.append(legacy("2024-01-05", "COFFEE SHOP 123", -4.50))
+
+    assert rehash(ingest_db) == {USER: {"rehashed": 0, "removed": 1}}
+    assert len(stored(ingest_db)) == 1
+    assert rehash(ingest_db) == {}
+
+
+class BlockedIndexes:
+    """Collections whose index builds fail for the given index names."""
+
+    def __init__(self, blocked):
+        self.blocked = blocked
+
+    def __getitem__(self, name):
+        blocked = self.blocked
+
+        class Collection:
+            async def create_indexes(self, models):
+                if models[0].document["name"] in blocked.get(name, ()):
+                    raise OperationFailure("E11000 duplicate key error")
+                return [model.document["name"] for model in models]
+
+        return Collection()
+
+
+def test_a_blocked_unique_index_fails_startup():
+    db = BlockedIndexes({"transactions": ["user_id_hash_unique"]})
+    with pytest.raises(RuntimeError, match="transactions.user_id_hash_unique.*app.services.uploads rehash"):
+        asyncio.run(ensure_indexes(db))
+
+
+def test_other_index_failures_are_only_logged(capsys):
+    created = asyncio.run(ensure_indexes(BlockedIndexes({"transactions": ["user_id_transaction_date"]})))
+
+    assert "user_id_transaction_date" not in created["transactions"]
+    assert "user_id_hash_unique" in created["transactions"]
+    assert "Could not create index transactions.user_id_transaction_date" in capsys.readouterr().out
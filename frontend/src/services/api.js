@@ -27,20 +27,53 @@ api.interceptors.request.use(async (config) => {
   }
 });
 
-export const fetchSummary = () => {
-  return api.get('/api/analysis/summary');
+export const fetchSummary = (params = {}) => {
+  return api.get('/api/analysis/summary', { params });
 };
 
 export const fetchInsights = () => {
   return api.get('/api/analysis/insights');
 };
 
-export const uploadTransactions = (formData) => {
-  return api.post('/api/transactions/upload', formData, {
+export const fetchSubscriptions = (includeInactive = false) => {
+  return api.get('/api/analysis/subscriptions', { params: { include_inactive: includeInactive } });
+};
+
+export const fetchUploadJob = (jobId) => {
+  return api.get(`/api/transactions/upload/jobs/${jobId}`);
+};
+
+const UPLOAD_POLL_INTERVAL_MS = 1000;
+// Stop waiting on a job after this long; it may still finish and show up on the next load
+const UPLOAD_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+// Same shape as an HTTP error so callers can show `response.data.detail`
+const uploadError = (detail) => {
+  const error = new Error(detail);
+  error.response = { data: { detail } };
+  return error;
+};
+
+// The upload is processed in a background job; resolve once it has finished
+export const uploadTransactions = async (formData) => {
+  const { data } = await api.post('/api/transactions/upload', formData, {
     headers: {
       'Content-Type': 'multipart/form-data'
     }
   });
+
+  const deadline = Date.now() + UPLOAD_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS));
+    const response = await fetchUploadJob(data.job_id);
+    if (response.data.status === 'succeeded') {
+      return response;
+    }
+    if (response.data.status === 'failed') {
+      throw uploadError(response.data.error);
+    }
+  }
+  throw uploadError('The statement is taking longer than expected to process; check back in a few minutes');
 };
 
 // New API endpoints for credit card recommendations and scraping
@@ -53,10 +86,12 @@ export const fetchCreditCardInfo = () => {
 };
 
 // Transaction listing endpoint
-export const fetchTransactions = (startDate, endDate) => {
+export const fetchTransactions = (startDate, endDate, cursor, limit) => {
   const params = {};
   if (startDate) params.start_date = startDate;
   if (endDate) params.end_date = endDate;
+  if (cursor) params.cursor = cursor;
+  if (limit) params.limit = limit;
   return api.get('/api/transactions/list', { params });
 };
 